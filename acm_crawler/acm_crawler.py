@@ -1,46 +1,77 @@
 import os
-import random
-import re
+import sys
 import time
 
-import dotenv
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-import selenium.webdriver.support.expected_conditions as EC
-from tqdm import tqdm
-from webdriver_manager.chrome import ChromeDriverManager
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import browser, keywords, query_plan  # noqa: E402
+from common.browser import EC, By, WebDriver, WebDriverWait  # noqa: E402
+from common.extract import Extractor, has_class  # noqa: E402
+from common.lazy import LazyImport  # noqa: E402
+from common.query_plan import DateSlice, page_count  # noqa: E402
+from common.record import Record  # noqa: E402
+from common.sink import NdjsonSink, convert  # noqa: E402
+from common.telemetry import metrics, set_source  # noqa: E402
+from common.source import RunContext, Source, Task  # noqa: E402
+
+dotenv = LazyImport("dotenv")
+tqdm = LazyImport("tqdm", "tqdm")
+
+query = "(tts AND prosod*) OR (TTS AND emot*) OR (TTS AND style*)"
+content_types = ["research-article", "short-paper"]
+# the search only serves the first max_hits results of a query, larger searches are split into date slices
+max_hits = 2000
+page_size = 50
+first_year = 2016
+listing_xpath = '//*[@id="skip-to-main-content"]/main/div[1]/div/div[2]/div/ul'
+
+listing_extractor = Extractor({"doi": "@href"}, rows=f"//a[{has_class('issue-item__doi')}]")
+paper_extractor = Extractor({
+    "title": "//h1[@property='name']",
+    "abstract": "//div[@role='paragraph']",
+    "doi": "//meta[@name='publication_doi']/@content",
+    "publication_date": f"//span[{has_class('core-date-published')}]",
+})
 
 
-class PaperInfo:
-    def __init__(self, title, abstract, doi, publication_date):
-        self.title = title
-        self.abstract = abstract
-        self.doi = doi
-        self.publication_date = publication_date
+def get_chrome():
+    return browser.get_chrome(headless=True)
 
 
-def get_chrome():
-    options = Options()
-    options.add_argument("--headless=new")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--log-level=3")
-    options.add_experimental_option("excludeSwitches", ["enable-logging"])
+def search_range() -> DateSlice:
+    return DateSlice.years(first_year, time.localtime().tm_year)
+
+
+def search_url(content_type: str, piece: DateSlice = None) -> str:
+    transformed_query = query.replace("(", "%28").replace(")", "%29").replace(" ", "+")
+    dates = f"AfterMonth=1&AfterYear={first_year}"
+    if piece is not None:
+        dates = (f"AfterMonth={piece.start_month}&AfterYear={piece.start_year}"
+                 f"&BeforeMonth={piece.end_month}&BeforeYear={piece.end_year}")
+    return f"https://dl.acm.org/action/doSearch?fillQuickSearch=false&target=advanced&expand=dl&{dates}&field1=AllField&text1={transformed_query}&ContentItemType={content_type}"
+
+
+def listing_url(url: str, page: int) -> str:
+    return url + f"&startPage={page}&pageSize={page_size}"
+
+
+def parse_listing(page_source: str) -> list[str]:
+    dois = [row["doi"] for row in listing_extractor.extract(page_source) if row["doi"]]
+    # strip "https://doi.org/" from the doi
+    return [doi.replace("https://doi.org/", "") for doi in dois]
+
 
-    service = Service(executable_path=ChromeDriverManager().install())
-    driver = webdriver.Chrome(
-        service=service,
-        options=options
-    )
-    return driver
+def parse_paper(page_source: str) -> Record:
+    fields = paper_extractor.extract(page_source)
+
+    missing = [name for name, value in fields.items() if value is None]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+
+    return Record(fields["title"], fields["abstract"], fields["publication_date"], doi=fields["doi"])
 
 
 def get_hits(driver: WebDriver, query: str) -> int:
-    driver.get(query)
+    browser.navigate(driver, query)
     hits = driver.find_element(By.CLASS_NAME, 'hitsLength').text
     hits = hits.replace(",", "")
     return int(hits)
@@ -70,49 +101,41 @@ def login(driver: WebDriver):
     driver.find_element(By.XPATH, '/html/body/div/div/div/div[1]/form/div[5]/button').click()
 
 
-def get_papers(driver: WebDriver, query: str, hits: int) -> list[PaperInfo]:
-    res: list[PaperInfo] = []
+def get_papers(driver: WebDriver, query: str, hits: int, sink: NdjsonSink = None) -> list[Record]:
+    # with a sink every paper is written as soon as it is extracted instead of being returned
+    res: list[Record] = []
 
-    if hits > 2000:
-        print("Too many hits. Only first 2000 will be downloaded. Was ", hits, "hits.")
-        hits = 2000
+    if hits > max_hits:
+        print(f"Too many hits. Only first {max_hits} will be downloaded. Was ", hits, "hits.")
+        hits = max_hits
 
-    max_page = (hits // 50)
+    max_page = page_count(hits, page_size)
     for page in tqdm(range(0, max_page), desc="Pages"):
         print("Page", page)
-        url = query + f"&startPage={page}&pageSize=50"
-        driver.get(url)
-        WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.XPATH, '//*[@id="skip-to-main-content"]/main/div[1]/div/div[2]/div/ul')))
+        url = listing_url(query, page)
+        browser.navigate(driver, url)
+        WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.XPATH, listing_xpath)))
 
         # fields = driver.find_elements(By.CLASS_NAME, 'hlFld-Title')
 
-        page_source = BeautifulSoup(driver.page_source, 'html.parser')
-        fields = page_source.find_all("a", class_="hlFld-Title")
-
-        doi_links = page_source.find_all("a", class_="issue-item__doi dot-separator")
-
-        dois = [doi_link["href"] for doi_link in doi_links]
-        # strip "https://doi.org/" from the doi
-        dois = [doi.replace("https://doi.org/", "") for doi in dois]
+        dois = parse_listing(driver.page_source)
 
         incorrect_dois = []
 
         for doi in tqdm(dois, desc="Papers"):
             try:
-                driver.get(f"https://dl.acm.org/doi/{doi}")
-
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                title = soup.find("h1", attrs={"property": "name"}).text
-                abstract = soup.find("div", attrs={"role": "paragraph"}).text
-                doi_elem = soup.find("meta", attrs={"name": "publication_doi"})
-                doi = doi_elem["content"]
-                publication_date = soup.find("span", class_="core-date-published").text
+                browser.navigate(driver, f"https://dl.acm.org/doi/{doi}")
 
-                res.append(PaperInfo(title, abstract, doi, publication_date))
+                paper = parse_paper(driver.page_source)
+                if sink is not None:
+                    sink.write(to_record(paper))
+                else:
+                    res.append(paper)
             except Exception as e:
                 print(e)
                 print("Error while extracting paper info. Skipping paper. DOI:", doi)
                 incorrect_dois.append(doi)
+                metrics.inc("crawler_incorrect_dois_total")
                 # continue
 
         # for field in tqdm(fields, desc="Papers"):
@@ -125,93 +148,82 @@ def get_papers(driver: WebDriver, query: str, hits: int) -> list[PaperInfo]:
         #     doi = doi_elem["content"]
         #     publication_date = soup.find("span", class_="core-date-published").text
         #
-        #     res.append(PaperInfo(title, abstract, doi, publication_date))
+        #     res.append(Record(title, abstract, doi, publication_date))
         #
         #     driver.back()
 
     return res
 
 
-def save(results: list[PaperInfo], filename="papers.json"):
-    # save the papers to a file for later use in json
-    # structure of the json file:
-    #
-    # {
-    #     "title": "Title of the paper",
-    #     "pdf": "URL to the pdf",
-    #     "doi": "DOI of the paper",
-    #     "summary": "Summary of the paper",
-    # }
-    #
-    # the file will be named papers.json
-
-    import json
-    with open(filename, "w") as f:
-        json.dump([{
-            "title": result.title,
-            # "pdf": result.pdf_url,
-            "doi": result.doi,
-            "summary": result.abstract,
-            "submitted": str(result.publication_date),
-        } for result in results], f, indent=4)
-
-
-def filter_papers(papers: list[PaperInfo]) -> list[PaperInfo]:
-    abs_keywords = [
-        "Emotion", "Emotional", "Prosody", "prosodic", "Paralinguistic",
-        "Natural", "Naturalness", "Expressive", "Style",
-        "Human", "State-of-the-Art", "SOTA", "SOA", "State-of-Art",
-        "Voice", "Modulation", "Speech", "Pitch", "Rhythm", "Dynamic",
-        "Intonation", "Stress", "Affective", "Duration"
-    ]
-
-    def escape_keyword(keyword):
-        return re.escape(keyword).replace(r'\-', r'-')
-
-    def compare(text: str, regex: re.Pattern[str]) -> bool:
-        # check if one of the keywords is in the title
-        return bool(regex.search(text))
-
-    # Combine keywords into a single regex pattern
-    pattern = "|".join([escape_keyword(keyword) for keyword in abs_keywords])
-
-    # Compile the regex pattern
-    regex = re.compile(pattern, re.IGNORECASE)
-
-    filtered_papers = []
-    for paper in tqdm(papers):
-        if compare(paper.title, regex):
-            filtered_papers.append(paper)
-
-    return filtered_papers
+def to_record(result: Record) -> dict:
+    return {
+        "title": result.title,
+        # "pdf": result.pdf_url,
+        "doi": result.doi,
+        "summary": result.abstract,
+        "submitted": str(result.submitted),
+    }
+
+
+class AcmSource(Source):
+    name = "acm"
+    max_concurrency = 2
+    output_file = "acm_crawler/acm_papers.ndjson.gz"
+    filtered_output_file = "acm_crawler/acm_filtered_papers.ndjson.gz"
+
+    def discover(self, context: RunContext):
+        for content_type in content_types:
+            def count(piece: DateSlice) -> int:
+                with context.browsers.acquire() as driver:
+                    return get_hits(driver, search_url(content_type, piece))
+
+            # monthly slices below the cap, counted with as many browsers as the listing pages use
+            slices = query_plan.plan(count, search_range(), max_hits, max_workers=self.max_concurrency)
+            print("Found", sum(hits for _, hits in slices), "papers in", len(slices), "slices for content type",
+                  content_type)
+
+            for piece, hits in slices:
+                url = search_url(content_type, piece)
+                for page in range(0, page_count(hits, page_size)):
+                    yield Task(self.name, "listing", listing_url(url, page))
+
+    def fetch(self, context: RunContext, task: Task) -> str:
+        with context.browsers.acquire() as driver:
+            browser.navigate(driver, task.url)
+            if task.kind == "listing":
+                WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.XPATH, listing_xpath)))
+            return driver.page_source
+
+    def extract(self, task: Task, raw: str):
+        if task.kind == "listing":
+            for doi in parse_listing(raw):
+                yield Task(self.name, "detail", f"https://dl.acm.org/doi/{doi}")
+        else:
+            yield to_record(parse_paper(raw))
 
 
 def main():
+    set_source("acm")
     driver = get_chrome()
     # login(driver)
 
-    query = "(tts AND prosod*) OR (TTS AND emot*) OR (TTS AND style*)"
-    transformed_query = query.replace("(", "%28").replace(")", "%29").replace(" ", "+")
-    # print(transformed_query)
-
-    content_types = ["research-article", "short-paper"]
-
-    papers = []
-
-    for content_type in tqdm(content_types, desc="Content Types"):
-        url = f"https://dl.acm.org/action/doSearch?fillQuickSearch=false&target=advanced&expand=dl&AfterMonth=1&AfterYear=2016&field1=AllField&text1={transformed_query}&ContentItemType={content_type}"
-        hits = get_hits(driver, url)
-        print("Found", hits, "papers for content type", content_type)
-
-        papers += get_papers(driver, url, hits)
+    with NdjsonSink("acm_papers.ndjson", key="doi", filtered_path="acm_filtered_papers.ndjson",
+                    predicate=lambda record: keywords.compare(record["title"])) as sink:
+        for content_type in tqdm(content_types, desc="Content Types"):
+            slices = query_plan.plan(lambda piece: get_hits(driver, search_url(content_type, piece)),
+                                     search_range(), max_hits, max_workers=1)
+            print("Found", sum(hits for _, hits in slices), "papers in", len(slices), "slices for content type",
+                  content_type)
 
-    save(papers, "acm_papers.json")
+            for piece, hits in slices:
+                get_papers(driver, search_url(content_type, piece), hits, sink)
 
-    filtered_papers = filter_papers(papers)
-    save(filtered_papers, "acm_filtered_papers.json")
+    convert("acm_papers.ndjson", "acm_papers.ndjson.gz")
+    convert("acm_filtered_papers.ndjson", "acm_filtered_papers.ndjson.gz")
 
-    print("Downloaded", len(papers), "papers")
-    print("Filtered", len(filtered_papers), "papers")
+    print("Downloaded", sink.count, "papers")
+    print("Filtered", sink.filtered_count, "papers")
+    metrics.write("acm_crawl_report.json")
     driver.quit()
 
 
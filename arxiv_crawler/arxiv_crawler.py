@@ -1,56 +1,117 @@
+import argparse
+import json
+import os
+import re
+import sys
 import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
 import arxiv
-import re
-from tqdm import tqdm
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import interchange, query_plan  # noqa: E402
+from common.keywords import compare, escape_keyword  # noqa: E402
+from common.lazy import LazyImport  # noqa: E402
+from common.rate_limit import get_limiter, parse_retry_after  # noqa: E402
+from common.source import RunContext, Source, Task  # noqa: E402
+from common.telemetry import log  # noqa: E402
+
+tqdm = LazyImport("tqdm", "tqdm")
+
+# terms of the topics in config.yaml, also used to select records from the OAI-PMH bulk feed
+topic_keywords = query_plan.search_terms(query_plan.load_topics())
+# one OR query instead of a query per term, whose results overlap
+queries = [query_plan.arxiv_query(topic_keywords)]
+
+output_file = "arxiv_filtered_results.ndjson.gz"
+state_file = "arxiv_harvest_state.json"
+
+oai_url = "https://oaipmh.arxiv.org/oai"
+oai_sets = ["cs", "eess"]
+
+OAI_NS = {
+    "oai": "http://www.openarchives.org/OAI/2.0/",
+    "arXiv": "http://arxiv.org/OAI/arXiv/",
+}
 
-def save(results: list[arxiv.Result], filename="papers.json"):
+
+def to_record(result: arxiv.Result) -> dict:
+    return {
+        "title": result.title,
+        "pdf": result.pdf_url,
+        "doi": result.doi,
+        "summary": result.summary,
+        "submitted": str(result.published),
+    }
+
+
+def save(records: list[dict], filename="papers.json"):
     # save the papers to a file for later use in json
     # structure of the json file:
-    # 
+    #
     # {
     #     "title": "Title of the paper",
     #     "pdf": "URL to the pdf",
     #     "doi": "DOI of the paper",
     #     "summary": "Summary of the paper",
+    #     "submitted": "Date the first version was published",
     # }
     #
-    # the file will be named papers.json
+    # the file will be named papers.json, .ndjson.gz names get compressed NDJSON (common.interchange)
+
+    interchange.write(filename, records)
+
+
+def load(filename: str) -> dict[str, dict]:
+    # load a previous output, keyed by title like the crawl results. A legacy .json output is read too.
+    filename = interchange.resolve(filename)
+    if not os.path.exists(filename):
+        return {}
+
+    return {record["title"]: record for record in interchange.read(filename)}
 
-    import json
+
+def parse_published(submitted: str) -> datetime or None:
+    try:
+        return datetime.fromisoformat(submitted)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_high_water_mark(filename: str, records: dict[str, dict]) -> datetime or None:
+    # newest published date seen by a previous run. Fall back to the newest record
+    # of the existing output if the state file is missing.
+    try:
+        with open(filename, "r") as f:
+            return parse_published(json.load(f)["published"])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    dates = [parse_published(record["submitted"]) for record in records.values()]
+    dates = [date for date in dates if date is not None]
+    return max(dates) if dates else None
+
+
+def save_high_water_mark(filename: str, published: datetime):
     with open(filename, "w") as f:
-        json.dump([{
-            "title": result.title,
-            "pdf": result.pdf_url,
-            "doi": result.doi,
-            "summary": result.summary,
-            "submitted": str(result.published),
-        } for result in results], f, indent=4)
-
-# Construct the default API client.
-client = arxiv.Client(page_size=1000, delay_seconds=5)
-
-abs_keywords = [
-    "Emotion", "Emotional", "Prosody", "prosodic", "Paralinguistic",
-    "Natural", "Naturalness", "Expressive", "Style", 
-    "Human", "State-of-the-Art", "SOTA", "SOA", "State-of-Art", 
-    "Voice", "Modulation", "Speech", "Pitch", "Rhythm", "Dynamic", 
-    "Intonation", "Stress", "Affective", "Duration"
-]
-
-def escape_keyword(keyword):
-    return re.escape(keyword).replace(r'\-', r'-')
-
-# Combine keywords into a single regex pattern
-pattern = "|".join([escape_keyword(keyword) for keyword in abs_keywords])
-
-# Compile the regex pattern
-regex = re.compile(pattern, re.IGNORECASE)
-
-def compare(text: str):
-    # check if one of the keywords is in the title
-    return bool(regex.search(text))
-
-def search(query):
+        json.dump({"published": str(published)}, f, indent=4)
+
+
+topic_regex = re.compile(r"\b(" + "|".join([escape_keyword(keyword) for keyword in topic_keywords]) + r")\b",
+                         re.IGNORECASE)
+
+
+def search(query, since: datetime = None, until: datetime = None):
+    if since is not None:
+        # restrict the query to the submission date window (minute granularity, inclusive)
+        until = until or datetime.now(timezone.utc)
+        query = f"({query}) AND submittedDate:[{since:%Y%m%d%H%M} TO {until:%Y%m%d%H%M}]"
+
     search = arxiv.Search(
       query = f"{query}",
       max_results = None,
@@ -58,19 +119,225 @@ def search(query):
     )
     return search
 
-result: dict[str, arxiv.Result] = {}
 
-for q in tqdm(["TTS", 'TTSOR"Text to speech"']):
-    results = client.results(search(q))
-    # save(results, f"arxiv_{q}_results.json")
+class RateLimitedSession(requests.Session):
+    # paces the requests of the arxiv client with the shared per-host limiter
+
+    def request(self, method, url, *args, **kwargs):
+        limiter = get_limiter(url)
+        limiter.acquire()
+        start = time.monotonic()
+        response = super().request(method, url, *args, **kwargs)
+        limiter.feedback(response.status_code, time.monotonic() - start,
+                         parse_retry_after(response.headers.get("Retry-After")))
+        return response
+
+
+def get_client(api_url: str = None) -> arxiv.Client:
+    # Construct the default API client. Pacing is left to the rate limiter instead of delay_seconds.
+    client = arxiv.Client(page_size=1000, delay_seconds=0)
+    client._session = RateLimitedSession()
+    if api_url is not None:
+        client.query_url_format = api_url + "?{}"
+    return client
+
+
+def crawl(client: arxiv.Client, since: datetime = None) -> tuple[dict[str, dict], datetime or None]:
+    # returns the relevant papers and the newest published date seen
+    result: dict[str, dict] = {}
+    newest = None
+
+    query_plan.report(topic_keywords, queries)
+    for q in tqdm(queries):
+        results = client.results(search(q, since))
+
+        # check if the paper is relevant with the keywords
+        for r in tqdm(results):
+            if newest is None or r.published > newest:
+                newest = r.published
+
+            if r.title not in result:
+                if compare(r.summary):
+                    result[r.title] = to_record(r)
+
+    return result, newest
+
+
+class ArxivSource(Source):
+    name = "arxiv"
+    relevance_field = "summary"
+    output_file = "arxiv_crawler/arxiv_results.ndjson.gz"
+    filtered_output_file = "arxiv_crawler/arxiv_filtered_results.ndjson.gz"
+    state_file = "arxiv_crawler/arxiv_harvest_state.json"
+
+    def __init__(self, since: datetime = None, api_url: str = None, incremental: bool = True):
+        # without `since` an incremental crawl starts at the high-water mark of the last complete one
+        self.since = since
+        self.incremental = incremental
+        self.client = get_client(api_url)
+        # newest published date of the queries read to the end, stored by finish()
+        self.newest = None
+        self.queries_done = 0
+
+    def discover(self, context: RunContext):
+        query_plan.report(topic_keywords, queries)
+        if self.since is None and self.incremental:
+            previous = load(self.output_file)
+            self.since = load_high_water_mark(self.state_file, previous)
+            if previous:
+                # the outputs are replaced at the end of the run, so the papers of the earlier
+                # crawls are passed on with the new ones
+                yield Task(self.name, "previous", self.output_file)
+        log.info("harvesting papers", source=self.name, since=str(self.since))
+        for q in queries:
+            yield Task(self.name, "query", payload={"query": q})
+
+    def fetch(self, context: RunContext, task: Task):
+        if task.kind == "previous":
+            # an iterator, so the previous output is not stored in the page archive
+            return iter(load(task.url).values())
+        return self.client.results(search(task.payload["query"], self.since))
+
+    def extract(self, task: Task, raw):
+        if task.kind == "previous":
+            yield from raw
+            return
+
+        newest = None
+        for r in raw:
+            if newest is None or r.published > newest:
+                newest = r.published
+            yield to_record(r)
+        # only a query read to the end moves the high-water mark
+        self.queries_done += 1
+        if newest is not None and (self.newest is None or newest > self.newest):
+            self.newest = newest
+
+    def finish(self):
+        # the outputs of a complete crawl are written, the next one only asks for newer submissions
+        if self.queries_done < len(queries):
+            return
+        dates = [date for date in (self.newest, self.since) if date is not None]
+        if dates:
+            save_high_water_mark(self.state_file, max(dates))
+
+
+def oai_request(url: str, retries: int = 5) -> bytes:
+    limiter = get_limiter(url)
+    for _ in range(retries):
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            with urllib.request.urlopen(url) as response:
+                body = response.read()
+            limiter.feedback(response.status, time.monotonic() - start)
+            return body
+        except urllib.error.HTTPError as e:
+            # arXiv uses 503 with Retry-After for flow control
+            limiter.feedback(e.code, retry_after=parse_retry_after(e.headers.get("Retry-After")))
+            if e.code != 503:
+                raise
+
+    raise RuntimeError(f"OAI-PMH endpoint kept answering 503: {url}")
+
+
+def parse_oai_record(record: ET.Element) -> dict or None:
+    metadata = record.find("oai:metadata/arXiv:arXiv", OAI_NS)
+    if metadata is None:
+        # deleted records only carry a header
+        return None
+
+    def text(tag: str) -> str or None:
+        elem = metadata.find(f"arXiv:{tag}", OAI_NS)
+        return " ".join(elem.text.split()) if elem is not None and elem.text else None
+
+    arxiv_id = text("id")
+    return {
+        "title": text("title"),
+        "pdf": f"https://arxiv.org/pdf/{arxiv_id}",
+        "doi": text("doi"),
+        "summary": text("abstract"),
+        # created is the date of the first version, like `published` in the search API
+        "submitted": f"{text('created')} 00:00:00+00:00",
+    }
+
+
+def oai_harvest(base_url: str, sets: list[str], since: str = None) -> dict[str, dict]:
+    # bulk harvest with resumption tokens, used for full rebuilds
+    result: dict[str, dict] = {}
+
+    for set_spec in tqdm(sets, desc="OAI sets"):
+        params = {"verb": "ListRecords", "metadataPrefix": "arXiv", "set": set_spec}
+        if since is not None:
+            params["from"] = since
+
+        with tqdm(desc=f"OAI {set_spec}") as progress:
+            while params is not None:
+                root = ET.fromstring(oai_request(f"{base_url}?{urllib.parse.urlencode(params)}"))
+
+                error = root.find("oai:error", OAI_NS)
+                if error is not None:
+                    # noRecordsMatch is returned for an empty window
+                    if error.get("code") != "noRecordsMatch":
+                        raise RuntimeError(f"OAI-PMH error {error.get('code')}: {error.text}")
+                    break
+
+                records = root.findall("oai:ListRecords/oai:record", OAI_NS)
+                for record in records:
+                    paper = parse_oai_record(record)
+                    if paper is None or paper["title"] is None or paper["summary"] is None:
+                        continue
+
+                    if topic_regex.search(f"{paper['title']} {paper['summary']}") and compare(paper["summary"]):
+                        result.setdefault(paper["title"], paper)
+                progress.update(len(records))
+
+                token = root.find("oai:ListRecords/oai:resumptionToken", OAI_NS)
+                if token is not None and token.text:
+                    params = {"verb": "ListRecords", "resumptionToken": token.text}
+                else:
+                    params = None
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl TTS papers from arXiv")
+    parser.add_argument("--mode", choices=["incremental", "full", "oai"], default="incremental",
+                        help="incremental only queries submissions newer than the last run, "
+                             "full pages through every result, oai rebuilds from the OAI-PMH bulk feed")
+    parser.add_argument("--output", default=output_file)
+    parser.add_argument("--state", default=state_file)
+    parser.add_argument("--api-url", default=None, help="override the arXiv API endpoint, e.g. for a local stub")
+    parser.add_argument("--oai-url", default=oai_url)
+    parser.add_argument("--oai-from", default=None, help="YYYY-MM-DD lower bound for the OAI-PMH harvest")
+    args = parser.parse_args()
+
+    if args.mode == "oai":
+        result = oai_harvest(args.oai_url, oai_sets, args.oai_from)
+        dates = [parse_published(record["submitted"]) for record in result.values()]
+        newest = max([date for date in dates if date is not None], default=None)
+    else:
+        existing = load(args.output) if args.mode == "incremental" else {}
+        since = load_high_water_mark(args.state, existing) if args.mode == "incremental" else None
+        print("Harvesting papers published since", since)
+
+        new, newest = crawl(get_client(args.api_url), since)
+        print("Found", len([title for title in new if title not in existing]), "new papers")
+
+        # merge the new entries into the existing output
+        result = existing
+        result.update(new)
+
+        if since is not None and (newest is None or newest < since):
+            newest = since
 
-    # check if the paper is relevant with the keywords
-    for r in tqdm(results):
-        if r.title not in result:
-            if compare(r.summary):
-                result[r.title] = r
+    print("Found", len(result), "papers")
 
-print("Found", len(result), "papers")
+    save(list(result.values()), args.output)
+    if newest is not None:
+        save_high_water_mark(args.state, newest)
 
 
-save(list(result.values()), "arxiv_filtered_results.json")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark of the HTML extraction of the ACM, IEEE and ISCA crawlers.
+
+Every page in benchmarks/fixtures is run through the BeautifulSoup/html.parser code the
+crawlers used before (baseline) and through the compiled lxml extractors they use now.
+Reports pages per second and the memory allocated per page (tracemalloc peak and number
+of allocated blocks). Recorded pages can be added as fixtures/<source>_<kind>*.html.
+
+    python benchmarks/bench_extract.py [--iterations 50] [--json results.json]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from acm_crawler import acm_crawler  # noqa: E402
+from ieee_crawler import ieee_crawler  # noqa: E402
+from interspeech_crawler import interspeech_crawler  # noqa: E402
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def baseline_acm_paper(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    return (soup.find("h1", attrs={"property": "name"}).text,
+            soup.find("div", attrs={"role": "paragraph"}).text,
+            soup.find("meta", attrs={"name": "publication_doi"})["content"],
+            soup.find("span", class_="core-date-published").text)
+
+
+def baseline_acm_listing(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    return [a["href"] for a in soup.find_all("a", class_="issue-item__doi dot-separator")]
+
+
+def baseline_ieee_paper(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    return (soup.find("h1", class_='document-title').text,
+            soup.find("div", class_='abstract-text').div.div.div.text,
+            soup.find("div", class_='stats-document-abstract-doi').a.text,
+            soup.find("div", class_='doc-abstract-confdate').text)
+
+
+def baseline_ieee_listing(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    return [result.find("a", class_='fw-bold')['href'] for result in soup.find_all("div", class_='List-results-items')]
+
+
+def baseline_isca_paper(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    return soup.find("h3").text, soup.find("p").text, soup.find("pre").text
+
+
+def baseline_isca_table(page):
+    # parse, serialize the table and parse it again, as get_rows did
+    soup = BeautifulSoup(page, "html.parser")
+    paper_table = soup.find("table", attrs={"id": "paper_table"})
+    rows = BeautifulSoup(str(paper_table), "html.parser").find_all("tr")[1:]
+    return [(row.contents[0].find("a")["href"], row.contents[2].text) for row in rows]
+
+
+class FakeDriver:
+    def __init__(self, page):
+        self.page_source = page
+
+
+CASES = {
+    "acm_paper": (baseline_acm_paper, acm_crawler.parse_paper),
+    "acm_listing": (baseline_acm_listing, acm_crawler.parse_listing),
+    "ieee_paper": (baseline_ieee_paper, ieee_crawler.parse_paper_page),
+    "ieee_listing": (baseline_ieee_listing, ieee_crawler.parse_listing),
+    "isca_paper": (baseline_isca_paper, lambda page: interspeech_crawler.parse_paper_page(page, "x/doe23.html")),
+    "isca_table": (baseline_isca_table, lambda page: interspeech_crawler.get_rows(FakeDriver(page))),
+}
+
+
+def measure(fn, pages: list[str], iterations: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for page in pages:
+            fn(page)
+    elapsed = time.perf_counter() - start
+
+    # allocations of a single pass, measured separately so tracing does not skew the timing
+    peaks, blocks = [], []
+    for page in pages:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = fn(page)
+        after = tracemalloc.take_snapshot()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0))
+        tracemalloc.stop()
+        del result
+
+    return {
+        "pages_per_second": iterations * len(pages) / elapsed,
+        "peak_kib_per_page": sum(peaks) / len(peaks) / 1024,
+        "blocks_per_page": sum(blocks) / len(blocks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crawler HTML extraction on saved pages")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--fixtures", default=fixtures_dir)
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<14}{'pages':>6}{'impl':>10}{'pages/s':>12}{'peak KiB':>12}{'blocks':>10}")
+    for case, (baseline, extractor) in CASES.items():
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.fixtures, f"{case}*.html"))):
+            with open(path, "r", encoding="utf8") as f:
+                pages.append(f.read())
+        if not pages:
+            continue
+
+        results[case] = {}
+        for impl, fn in (("baseline", baseline), ("lxml", extractor)):
+            stats = measure(fn, pages, args.iterations)
+            results[case][impl] = stats
+            print(f"{case:<14}{len(pages):>6}{impl:>10}{stats['pages_per_second']:>12.1f}"
+                  f"{stats['peak_kib_per_page']:>12.1f}{stats['blocks_per_page']:>10.0f}")
+
+        speedup = results[case]["lxml"]["pages_per_second"] / results[case]["baseline"]["pages_per_second"]
+        print(f"{case:<14}{'':>6}{'speedup':>10}{speedup:>11.1f}x")
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+End-to-end benchmark of the offline filter pipeline in filter/filter.py.
+
+Synthetic filtered outputs are generated for every source, with the date formats the
+crawlers write, missing abstracts and papers found by several sources. The pipeline of
+filter.main then runs stage by stage: get_files -> load_json -> filter_papers -> dedupe
+(merge_papers) -> write. Every corpus size runs in a fresh process, so the peak RSS of a
+stage is not inflated by an earlier run.
+
+    python benchmarks/bench_filter.py [--sizes 10000 100000 1000000 5000000] [--format json] [--json results.json]
+    python benchmarks/bench_filter.py --compare old.json new.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queues
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import interchange  # noqa: E402
+from filter import filter as paper_filter  # noqa: E402
+
+# share of the records per source, roughly as in a full crawl
+SOURCES = {
+    "arxiv": 0.35,
+    "semanticscholar": 0.25,
+    "ieee": 0.15,
+    "acm": 0.10,
+    "paperswithcode": 0.10,
+    "interspeech": 0.05,
+}
+WORDS = ("speech synthesis expressive emotional prosody neural vocoder text to speech style transfer multi speaker "
+         "zero shot low resource diffusion model transformer duration pitch energy controllable end").split()
+
+
+def format_date(source: str, day: date, rng: random.Random) -> str:
+    # the formats the crawlers write for each source
+    if source == "arxiv":
+        return f"{day} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00+00:00"
+    if source == "ieee":
+        return rng.choice([f"{day.day}-{day.day + 3} {day:%B %Y}", f"{day.day} {day:%B %Y}", ""])
+    if source == "acm":
+        return f"{day.day} {day:%B %Y}"
+    if source == "interspeech":
+        return str(day.year)
+    return rng.choice([str(day), str(day), "None"])
+
+
+def make_record(source: str, paper: int, rng: random.Random, missing_abstracts: float) -> dict:
+    # the same paper number gives the same title and identifiers in every source
+    paper_rng = random.Random(paper)
+    title = " ".join(paper_rng.choice(WORDS) for _ in range(paper_rng.randint(6, 14))) + f" {paper}"
+    day = date(2010, 1, 1) + timedelta(days=paper_rng.randrange(15 * 365))
+
+    abstract = " ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 250)))
+    if rng.random() < missing_abstracts:
+        abstract = rng.choice([None, "", "None"])
+
+    record = {"title": title, "summary": abstract, "submitted": format_date(source, day, rng)}
+    if source in ("arxiv", "paperswithcode"):
+        record["pdf"] = f"http://arxiv.org/pdf/{day:%y%m}.{paper % 100000:05d}v{rng.randint(1, 3)}"
+    if source == "paperswithcode":
+        record["arxiv_id"] = f"{day:%y%m}.{paper % 100000:05d}"
+    else:
+        record["doi"] = f"10.{1000 + paper % 9000}/{source}.{paper}" if rng.random() < 0.8 else None
+    return record
+
+
+def generate(directory: str, records: int, duplicates: float, missing_abstracts: float, extension: str = ".json",
+             seed: int = 0) -> list[str]:
+    # with probability `duplicates` a record is a paper another source has found too
+    rng = random.Random(seed)
+    files = []
+    next_paper = 0
+    for source, share in SOURCES.items():
+        count = max(1, round(records * share))
+        batch = []
+        for _ in range(count):
+            if next_paper and rng.random() < duplicates:
+                paper = rng.randrange(next_paper)
+            else:
+                paper = next_paper
+                next_paper += 1
+            batch.append(make_record(source, paper, rng, missing_abstracts))
+
+        os.makedirs(os.path.join(directory, source), exist_ok=True)
+        path = os.path.join(directory, source, f"{source}_filtered_papers{extension}")
+        interchange.write(path, batch)
+        files.append(path)
+    return files
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_pipeline(directory: str, output: str) -> dict:
+    # the steps of filter.main, timed one by one
+    stages = {}
+
+    def stage(name: str, records: int or None, start: float):
+        seconds = time.perf_counter() - start
+        stages[name] = {
+            "seconds": seconds,
+            "records": records,
+            "records_per_second": records / seconds if records is not None and seconds > 0 else None,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+    start = time.perf_counter()
+    files = paper_filter.get_files(directory)
+    stage("get_files", None, start)
+
+    start = time.perf_counter()
+    papers = dict()
+    for file in files:
+        source = file.split("/")[-1].split(".")[0].split("_")[0]
+        papers[source] = paper_filter.load_json(file)
+        for paper in papers[source]:
+            paper.add_source(source)
+    loaded = sum(len(jsons) for jsons in papers.values())
+    stage("load_json", loaded, start)
+
+    start = time.perf_counter()
+    filtered = []
+    for jsons in papers.values():
+        filtered.extend(paper_filter.filter_papers(jsons))
+    stage("filter_papers", loaded, start)
+
+    start = time.perf_counter()
+    merged = paper_filter.merge_papers(filtered)
+    stage("dedupe", len(filtered), start)
+
+    start = time.perf_counter()
+    interchange.write(output, merged)
+    stage("write", len(merged), start)
+
+    return {"stages": stages, "loaded": loaded, "filtered": len(filtered), "merged": len(merged)}
+
+
+def measure(records: int, duplicates: float, missing_abstracts: float, extension: str, keep: str or None, queue):
+    # runs in its own process; generation happens in a child so it does not count towards the peak
+    with tempfile.TemporaryDirectory(dir=keep) as directory:
+        data = os.path.join(directory, "data")
+        generator = multiprocessing.Process(target=generate,
+                                            args=(data, records, duplicates, missing_abstracts, extension))
+        generator.start()
+        generator.join()
+
+        input_bytes = sum(os.path.getsize(os.path.join(root, file))
+                          for root, _, files in os.walk(data) for file in files)
+        start = time.perf_counter()
+        result = run_pipeline(data, os.path.join(directory, f"filtered_papers{extension}"))
+        result["seconds"] = time.perf_counter() - start
+        result["records"] = records
+        result["input_mib"] = input_bytes / (1024 * 1024)
+        result["records_per_second"] = records / result["seconds"]
+        result["peak_rss_mib"] = peak_rss_mib()
+        queue.put(result)
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def wait_result(process: multiprocessing.Process, queue, poll: float = 5.0) -> dict or None:
+    # the result of a measuring process, None if it died without one (killed by the OOM killer, an exception)
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except queues.Empty:
+            if not process.is_alive():
+                # the result may have been sent just before the process exited
+                try:
+                    return queue.get(timeout=1)
+                except queues.Empty:
+                    return None
+
+
+def compare(old_path: str, new_path: str):
+    # sizes whose run failed have no stages and are left out
+    with open(old_path, "r") as f:
+        old = {result["records"]: result for result in json.load(f)["results"] if "stages" in result}
+    with open(new_path, "r") as f:
+        new = {result["records"]: result for result in json.load(f)["results"] if "stages" in result}
+
+    print(f"{'records':>10}{'stage':>15}{'old s':>10}{'new s':>10}{'speedup':>9}{'old MiB':>10}{'new MiB':>10}")
+    for records in sorted(old.keys() & new.keys()):
+        for name, before in old[records]["stages"].items():
+            after = new[records]["stages"].get(name)
+            if after is None:
+                continue
+            speedup = before["seconds"] / after["seconds"] if after["seconds"] > 0 else float("inf")
+            print(f"{records:>10}{name:>15}{before['seconds']:>10.2f}{after['seconds']:>10.2f}{speedup:>8.2f}x"
+                  f"{before['peak_rss_mib']:>10.0f}{after['peak_rss_mib']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the filter pipeline on synthetic crawler outputs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="total records over all sources, e.g. 10000 100000 1000000 5000000")
+    parser.add_argument("--duplicates", type=float, default=0.3, help="share of records found by another source too")
+    parser.add_argument("--missing-abstracts", type=float, default=0.1)
+    parser.add_argument("--format", choices=["gzip", "zstd", "json"], default="gzip",
+                        help="format of the inputs and the output, json: legacy JSON arrays")
+    parser.add_argument("--tmp", default=None, help="directory for the generated files")
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    extension = interchange.EXTENSIONS.get(args.format, ".json")
+    results = []
+    print(f"{'records':>10}{'stage':>15}{'seconds':>10}{'records/s':>12}{'peak MiB':>10}")
+    for records in args.sizes:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure,
+                                          args=(records, args.duplicates, args.missing_abstracts, extension, args.tmp,
+                                                queue))
+        process.start()
+        result = wait_result(process, queue)
+        process.join()
+        if result is None:
+            print(f"{records:>10}{'failed':>15}   measuring process exited with code {process.exitcode}")
+            results.append({"records": records, "error": f"exit code {process.exitcode}"})
+            continue
+        results.append(result)
+
+        for name, stats in result["stages"].items():
+            rate = f"{stats['records_per_second']:>12.0f}" if stats["records_per_second"] else f"{'':>12}"
+            print(f"{records:>10}{name:>15}{stats['seconds']:>10.2f}{rate}{stats['peak_rss_mib']:>10.0f}")
+        print(f"{records:>10}{'total':>15}{result['seconds']:>10.2f}{result['records_per_second']:>12.0f}"
+              f"{result['peak_rss_mib']:>10.0f}   {result['loaded']} loaded, {result['filtered']} filtered, "
+              f"{result['merged']} merged, {result['input_mib']:.0f} MiB input")
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"meta": metadata(), "parameters": vars(args), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
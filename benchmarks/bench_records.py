@@ -0,0 +1,151 @@
+"""
+Memory benchmark of the in-memory paper representations, in bytes per record.
+
+A synthetic merged corpus (the format of filter/filtered_papers.json) is parsed and held
+the way each consumer held it before and holds it now:
+
+    filter   PaperInfo with a __dict__      -> filter.PaperInfo (common.record.Record)
+    api      pydantic PaperInfo + id index  -> common.record.Record by id
+    dict     the parsed JSON dicts, for reference
+
+Memory is what tracemalloc sees retained after the input text and the parsed JSON are
+released, so it includes the strings of every record.
+
+    python benchmarks/bench_records.py [--records 100000] [--json results.json]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_filter import SOURCES, WORDS, metadata  # noqa: E402
+from common.export import paper_id  # noqa: E402
+from common.record import Record  # noqa: E402
+from filter import filter as paper_filter  # noqa: E402
+
+
+class DictPaperInfo:
+    # filter.PaperInfo and the PaperInfo of the crawlers before common.record
+    def __init__(self, title, abstract, submitted, doi=None, arxiv_id=None, pdf=None):
+        self.source = None
+        self.title = title
+        self.abstract = abstract
+        self.submitted = submitted
+        self.doi = doi
+        self.arxiv_id = arxiv_id
+        self.pdf = pdf
+
+
+def generate(records: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    names = list(SOURCES)
+    papers = []
+    for i in range(records):
+        source = rng.choices(names, weights=list(SOURCES.values()))[0]
+        day = date(2017, 1, 1) + timedelta(days=rng.randrange(8 * 365))
+        papers.append({
+            "source": source,
+            "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))) + f" {i}",
+            "abstract": " ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 250))),
+            "submitted": str(day),
+            "doi": f"10.{1000 + i % 9000}/{source}.{i}" if rng.random() < 0.8 else None,
+            "arxiv_id": f"{day:%y%m}.{i % 100000:05d}" if source in ("arxiv", "paperswithcode") else None,
+            "pdf": None,
+            "sources": sorted({source, rng.choice(names)} if rng.random() < 0.3 else {source}),
+        })
+    return json.dumps(papers)
+
+
+def as_dicts(papers: list[dict]):
+    return papers
+
+
+def as_class(papers: list[dict]):
+    result = []
+    for data in papers:
+        paper = DictPaperInfo(data["title"], data["abstract"], data["submitted"], data["doi"], data["arxiv_id"],
+                              data["pdf"])
+        paper.source = data["source"]
+        result.append(paper)
+    return result
+
+
+def as_record(papers: list[dict]):
+    return [paper_filter.from_dict(data) for data in papers]
+
+
+def as_models(papers: list[dict]):
+    # the Corpus of literature_helper before: a sorted list of models and an index by id
+    from literature_helper import PaperInfo
+    result = [PaperInfo(**{**data, "id": paper_id(data)}) for data in papers]
+    return result, {paper.id: paper for paper in result}
+
+
+def as_record_index(papers: list[dict]):
+    # the Corpus of literature_helper now, see load_papers
+    return {paper_id(data): Record.from_dict(data) for data in papers}
+
+
+REPRESENTATIONS = {
+    # name -> (consumer, before/after, build)
+    "dict": ("reference", "-", as_dicts),
+    "class with __dict__": ("filter", "before", as_class),
+    "Record": ("filter", "after", as_record),
+    "pydantic models + index": ("api", "before", as_models),
+    "Record index": ("api", "after", as_record_index),
+}
+
+
+def measure(build, text: str) -> tuple[int, float]:
+    # bytes retained by the built objects and the seconds to parse and build them
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    papers = json.loads(text)
+    built = build(papers)
+    seconds = time.perf_counter() - start
+    del papers
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del built
+    return size, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per record of the in-memory paper representations")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    args = parser.parse_args()
+
+    text = generate(args.records)
+    raw = len(text.encode("utf8")) / args.records
+    print(f"{args.records} records, {raw:.0f} bytes per record as JSON")
+    print(f"{'representation':<26}{'consumer':>10}{'':>8}{'bytes/record':>14}{'x JSON':>8}{'build s':>9}")
+
+    results = []
+    for name, (consumer, stage, build) in REPRESENTATIONS.items():
+        try:
+            size, seconds = measure(build, text)
+        except ImportError as e:
+            print(f"{name:<26}{consumer:>10}{stage:>8}  skipped: {e}")
+            continue
+        per_record = size / args.records
+        results.append({"representation": name, "consumer": consumer, "stage": stage,
+                        "bytes_per_record": per_record, "seconds": seconds})
+        print(f"{name:<26}{consumer:>10}{stage:>8}{per_record:>14.0f}{per_record / raw:>8.2f}{seconds:>9.2f}")
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"meta": metadata(), "parameters": vars(args), "json_bytes_per_record": raw,
+                       "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
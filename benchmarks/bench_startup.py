@@ -0,0 +1,125 @@
+"""
+Cold start benchmark of the crawler entry points.
+
+Every module is imported in a fresh interpreter, `--repeat` times, and the median import time
+is reported together with the heavy dependencies the import pulled in (selenium, tqdm, dotenv,
+bs4 should only be loaded once a crawler opens a browser or shows a progress bar). The
+chromedriver lookup of common.browser is timed as well: cold (no pin, chromedriver from the
+PATH or webdriver-manager) and pinned.
+
+    python benchmarks/bench_startup.py [--repeat 7] [--modules runner acm_crawler.acm_crawler] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_filter import metadata  # noqa: E402
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = [
+    "runner",
+    "refresh",
+    "literature_helper",
+    "common.source",
+    "acm_crawler.acm_crawler",
+    "ieee_crawler.ieee_crawler",
+    "interspeech_crawler.interspeech_crawler",
+    "arxiv_crawler.arxiv_crawler",
+    "papers_with_code.papers_with_code_crawler",
+]
+HEAVY = ("selenium", "tqdm", "dotenv", "bs4", "httpx", "webdriver_manager")
+
+IMPORT_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+DRIVER_CODE = """
+import json, time
+from common import browser
+browser.driver_cache_file = {cache_file!r}
+start = time.perf_counter()
+try:
+    path = browser.resolve_driver()
+except Exception as e:
+    print(json.dumps({{"error": f"{{type(e).__name__}}: {{e}}".splitlines()[0]}}))
+else:
+    print(json.dumps({{"seconds": time.perf_counter() - start, "path": path}}))
+"""
+
+
+def run_python(code: str, env: dict = None) -> dict:
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root, env=env)
+    if result.returncode != 0:
+        return {"error": (result.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_import(module: str, repeat: int) -> dict:
+    runs = [run_python(IMPORT_CODE.format(module=module, heavy=HEAVY)) for _ in range(repeat)]
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        return {"module": module, "error": errors[0]}
+    return {
+        "module": module,
+        "median_seconds": statistics.median(run["seconds"] for run in runs),
+        "min_seconds": min(run["seconds"] for run in runs),
+        "loaded": runs[0]["loaded"],
+    }
+
+
+def bench_driver() -> dict:
+    # in a temporary pin file, so the pin of the user is neither used nor replaced
+    env = {key: value for key, value in os.environ.items() if key != "CHROMEDRIVER"}
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, "chromedriver.json")
+        cold = run_python(DRIVER_CODE.format(cache_file=cache_file), env)
+        if "error" in cold:
+            return {"skipped": cold["error"]}
+        pinned = run_python(DRIVER_CODE.format(cache_file=cache_file), env)
+    return {"cold_seconds": cold["seconds"], "pinned_seconds": pinned.get("seconds"), "path": cold["path"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start of the crawler entry points")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    baseline = run_python(IMPORT_CODE.format(module="json", heavy=HEAVY))
+    print(f"{'module':45s} {'median':>8s} {'min':>8s}  heavy imports")
+    results = []
+    for module in args.modules:
+        result = bench_import(module, args.repeat)
+        results.append(result)
+        if "error" in result:
+            print(f"{module:45s} {'error':>8s}           {result['error']}")
+        else:
+            print(f"{module:45s} {result['median_seconds']:7.3f}s {result['min_seconds']:7.3f}s  "
+                  f"{', '.join(result['loaded']) or '-'}")
+
+    driver = bench_driver()
+    if "skipped" in driver:
+        print(f"chromedriver: skipped ({driver['skipped']})")
+    else:
+        print(f"chromedriver: {driver['cold_seconds']:.3f}s cold, {driver['pinned_seconds']:.3f}s pinned "
+              f"({driver['path']})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as f:
+            json.dump({"metadata": metadata(), "python_seconds": baseline.get("seconds"), "imports": results,
+                       "chromedriver": driver}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import datetime
+import gzip
+import json
+import os
+import socket
+import threading
+from typing import Iterator
+
+from common.source import Task
+
+# a new segment is started when the current one reaches this size
+SEGMENT_BYTES = 256 * 1024 * 1024
+
+
+class PageArchive:
+    """
+    Raw fetched pages in a WARC-like store. Every page is one gzip member in a segment file,
+    with a small WARC-style header (URL, fetch time, source, task) in front of the body, so a
+    single page can be read by seeking to its offset. The index holds one JSON line per page.
+
+    Every process writes its own segments and index file, so workers sharing a directory never
+    write to the same file. Readers merge the index files of all writers.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.writer = f"{socket.gethostname()}-{os.getpid()}"
+        self._lock = threading.Lock()
+        self._segment = None
+        self._segment_number = 0
+        self._index = None
+
+    def _open_segment(self):
+        # called with the lock held
+        if self._segment is not None and self._segment.tell() < self.segment_bytes:
+            return
+        if self._segment is not None:
+            self._segment.close()
+
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            self._segment_number += 1
+            name = f"pages-{self.writer}-{self._segment_number:05d}.warc.gz"
+            if not os.path.exists(os.path.join(self.directory, name)):
+                break
+        self._segment = open(os.path.join(self.directory, name), "ab")
+        if self._index is None:
+            self._index = open(os.path.join(self.directory, f"index-{self.writer}.ndjson"), "a", encoding="utf8")
+
+    def add(self, source: str, task: Task, raw) -> bool:
+        # pages are stored as text, JSON responses as their serialization. Other results
+        # (e.g. objects returned by API clients) cannot be re-extracted and are not stored.
+        if isinstance(raw, str):
+            content_type, body = "text/html", raw
+        elif isinstance(raw, (dict, list)):
+            content_type, body = "application/json", json.dumps(raw, ensure_ascii=False)
+        else:
+            return False
+
+        fetched = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        payload = body.encode("utf8")
+        header = (
+            "WARC/1.0\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Target-URI: {task.url}\r\n"
+            f"WARC-Date: {fetched}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"X-Crawler-Source: {source}\r\n"
+            f"X-Crawler-Task: {json.dumps(task.to_dict(), ensure_ascii=False)}\r\n"
+            "\r\n"
+        ).encode("utf8")
+        member = gzip.compress(header + payload + b"\r\n\r\n")
+
+        with self._lock:
+            self._open_segment()
+            offset = self._segment.tell()
+            self._segment.write(member)
+            self._segment.flush()
+            entry = {
+                "url": task.url,
+                "source": source,
+                "kind": task.kind,
+                "fetched": fetched,
+                "content_type": content_type,
+                "file": os.path.basename(self._segment.name),
+                "offset": offset,
+                "length": len(member),
+                "task": task.to_dict(),
+            }
+            # the index line is written after the page, a crash never indexes a missing page
+            self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index.flush()
+        return True
+
+    def close(self):
+        with self._lock:
+            for f in (self._segment, self._index):
+                if f is not None:
+                    f.close()
+            self._segment = self._index = None
+
+    def entries(self, sources: list[str] = None, latest: bool = True) -> list[dict]:
+        # index entries of all writers; with `latest` only the last fetch of every task
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("index-") and name.endswith(".ndjson")):
+                continue
+            with open(os.path.join(self.directory, name), "r", encoding="utf8") as f:
+                for line in f:
+                    # a line cut off by a crash is skipped
+                    if line.endswith("\n") and line.strip():
+                        entry = json.loads(line)
+                        if sources is None or entry["source"] in sources:
+                            entries.append(entry)
+
+        if latest:
+            by_task = dict()
+            for entry in sorted(entries, key=lambda e: e["fetched"]):
+                by_task[(entry["source"], json.dumps(entry["task"], sort_keys=True))] = entry
+            entries = list(by_task.values())
+        # in file order, so pages are read sequentially
+        entries.sort(key=lambda e: (e["file"], e["offset"]))
+        return entries
+
+    def read(self, entry: dict):
+        # the raw content as fetch() returned it
+        with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+            f.seek(entry["offset"])
+            record = gzip.decompress(f.read(entry["length"]))
+        _, body = record.split(b"\r\n\r\n", 1)
+        body = body[:-4].decode("utf8")
+        return json.loads(body) if entry["content_type"] == "application/json" else body
+
+    def pages(self, sources: list[str] = None, latest: bool = True) -> Iterator[tuple[dict, object]]:
+        for entry in self.entries(sources, latest):
+            yield entry, self.read(entry)
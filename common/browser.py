@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from common.lazy import LazyImport
+from common.rate_limit import get_limiter
+from common.telemetry import log, metrics
+
+# selenium is only imported when a browser is used, the crawlers take these names from here
+By = LazyImport("selenium.webdriver.common.by", "By")
+EC = LazyImport("selenium.webdriver.support.expected_conditions")
+WebDriver = LazyImport("selenium.webdriver.chrome.webdriver", "WebDriver")
+WebDriverWait = LazyImport("selenium.webdriver.support.wait", "WebDriverWait")
+
+# chromedriver of get_chrome(): $CHROMEDRIVER if set, otherwise resolved once (chromedriver on the
+# PATH, else downloaded by webdriver-manager) and pinned in this file, so later runs start offline
+driver_cache_file = os.path.join(os.path.expanduser("~"), ".cache", "tts-lit-paper-crawler", "chromedriver.json")
+
+_driver_path: str or None = None
+_driver_lock = threading.Lock()
+
+
+def _pinned_driver() -> str or None:
+    try:
+        with open(driver_cache_file, "r") as f:
+            path = json.load(f)["path"]
+    except (OSError, KeyError, ValueError):
+        return None
+    return path if os.path.exists(path) else None
+
+
+def _pin_driver(path: str):
+    os.makedirs(os.path.dirname(driver_cache_file), exist_ok=True)
+    tmp_path = f"{driver_cache_file}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"path": path, "pinned": time.time()}, f, indent=4)
+    os.replace(tmp_path, driver_cache_file)
+
+
+def resolve_driver(refresh: bool = False) -> str:
+    # the chromedriver path, resolved once per process. Only a missing pin or refresh (a driver
+    # that does not match the installed Chrome any more) asks webdriver-manager, i.e. the network.
+    global _driver_path
+    with _driver_lock:
+        if _driver_path is not None and not refresh:
+            return _driver_path
+
+        path = os.getenv("CHROMEDRIVER")
+        if not path and not refresh:
+            path = _pinned_driver() or shutil.which("chromedriver")
+        if not path:
+            from webdriver_manager.chrome import ChromeDriverManager
+            path = ChromeDriverManager().install()
+        if path != os.getenv("CHROMEDRIVER"):
+            _pin_driver(path)
+        _driver_path = path
+        return path
+
+
+def get_chrome(headless: bool = True) -> WebDriver:
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--log-level=3")
+    options.add_experimental_option("excludeSwitches", ["enable-logging"])
+
+    try:
+        return webdriver.Chrome(service=Service(executable_path=resolve_driver()), options=options)
+    except SessionNotCreatedException as e:
+        if os.getenv("CHROMEDRIVER"):
+            raise
+        # Chrome was updated since the driver was pinned
+        log.warning("pinned chromedriver rejected, resolving it again", error=str(e).splitlines()[0])
+        return webdriver.Chrome(service=Service(executable_path=resolve_driver(refresh=True)), options=options)
+
+
+class BrowserPool:
+    # hands out at most `size` Chrome sessions, started on first use and reused afterwards
+
+    def __init__(self, size: int = 2, headless: bool = True):
+        self.headless = headless
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: queue.LifoQueue[WebDriver] = queue.LifoQueue()
+        self._drivers: list[WebDriver] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = get_chrome(self.headless)
+                with self._lock:
+                    self._drivers.append(driver)
+
+            try:
+                yield driver
+            finally:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            for driver in self._drivers:
+                try:
+                    driver.quit()
+                except Exception as e:
+                    print("Error while closing browser", e)
+            self._drivers.clear()
+
+
+def navigate(driver: WebDriver, url: str):
+    # driver.get() paced by the rate limiter of the host. The browser does not expose
+    # the status code, so only the page load time is reported.
+    limiter = get_limiter(url)
+    metrics.observe("crawler_wait_seconds", limiter.acquire())
+    start = time.monotonic()
+    driver.get(url)
+    elapsed = time.monotonic() - start
+    limiter.feedback(latency=elapsed)
+
+    metrics.observe("crawler_fetch_seconds", elapsed)
+    metrics.inc("crawler_pages_fetched_total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve the chromedriver once and pin it for offline runs")
+    parser.add_argument("--refresh", action="store_true", help="download the driver for the installed Chrome again")
+    args = parser.parse_args()
+    print(resolve_driver(args.refresh))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+import zlib
+from typing import Callable, Iterable, Iterator
+
+from common import interchange
+
+CSV_FIELDS = ["id", "title", "abstract", "submitted", "source", "doi", "arxiv_id", "pdf"]
+# characters with a special meaning in BibTeX field values
+BIBTEX_ESCAPES = {c: f"\\{c}" for c in "&%$#_{}"}
+BIBTEX_ESCAPES["\\"] = "\\textbackslash{}"
+
+
+def paper_id(record: dict) -> str:
+    # the id literature_helper gives a paper and progress files refer to
+    year = record["submitted"].split("-")[0]
+    return f"{year}-{record['title']}"
+
+
+def read_papers(path: str) -> Iterator[dict]:
+    # interchange, NDJSON and legacy JSON array files alike
+    return interchange.read(interchange.resolve(path))
+
+
+def select(records: Iterable[dict], ids: set[str]) -> Iterator[dict]:
+    # ids from progress files can repeat, every paper is exported once
+    exported = set()
+    for record in records:
+        record_id = paper_id(record)
+        if record_id in ids and record_id not in exported:
+            exported.add(record_id)
+            yield {"id": record_id, **record}
+
+
+def to_ndjson(records: Iterable[dict]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def to_csv(records: Iterable[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def bibtex_escape(value: str) -> str:
+    return "".join(BIBTEX_ESCAPES.get(c, c) for c in value)
+
+
+def to_bibtex(records: Iterable[dict]) -> Iterator[str]:
+    keys = set()
+    for record in records:
+        year = record["submitted"].split("-")[0]
+        word = next(iter(re.findall(r"[a-z0-9]+", record["title"].lower())), "paper")
+        # the key set only grows with the exported papers, not with the corpus
+        key = base = f"{record.get('source') or 'paper'}{year}{word}"
+        suffix = 0
+        while key in keys:
+            suffix += 1
+            key = f"{base}{suffix}"
+        keys.add(key)
+
+        fields = [("title", record["title"]), ("abstract", record.get("abstract")), ("year", year),
+                  ("doi", record.get("doi")), ("eprint", record.get("arxiv_id")),
+                  ("archiveprefix", "arXiv" if record.get("arxiv_id") else None), ("url", record.get("pdf")),
+                  ("note", ", ".join(record.get("sources") or []) or record.get("source"))]
+        body = ",\n".join(f"  {name} = {{{bibtex_escape(str(value))}}}" for name, value in fields if value)
+        yield f"@misc{{{key},\n{body}\n}}\n\n"
+
+
+FORMATS: dict[str, tuple[Callable, str, str]] = {
+    # format -> (writer, media type, file extension)
+    "bibtex": (to_bibtex, "application/x-bibtex", "bib"),
+    "csv": (to_csv, "text/csv", "csv"),
+    "ndjson": (to_ndjson, "application/x-ndjson", "ndjson"),
+}
+
+
+def encode(chunks: Iterable[str], compress: bool = False, buffer_size: int = 16384) -> Iterator[bytes]:
+    # joins the small chunks of the writers into blocks of about buffer_size bytes
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    pending, size = [], 0
+    for chunk in chunks:
+        data = chunk.encode("utf8")
+        pending.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            block = b"".join(pending)
+            pending, size = [], 0
+            block = compressor.compress(block) if compressor else block
+            if block:
+                yield block
+
+    block = b"".join(pending)
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
+
+
+def export(papers_path: str, ids: set[str], fmt: str, compress: bool = False) -> Iterator[bytes]:
+    writer = FORMATS[fmt][0]
+    return encode(writer(select(read_papers(papers_path), ids)), compress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export accepted or rejected papers of a progress file")
+    parser.add_argument("--papers", default="filter/filtered_papers.ndjson.gz")
+    parser.add_argument("--progress", default="progress.json", help="e.g. progress/<reviewer>.json")
+    parser.add_argument("--status", choices=["accepted", "rejected"], default="accepted")
+    parser.add_argument("--format", choices=list(FORMATS), default="bibtex")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--output", default=None, help="default: standard output")
+    args = parser.parse_args()
+
+    with open(args.progress, "r", encoding="utf8") as f:
+        progress = json.load(f)
+    ids = set(progress["added_papers" if args.status == "accepted" else "deleted_papers"])
+
+    out = open(args.output, "wb") if args.output is not None else sys.stdout.buffer
+    try:
+        for block in export(args.papers, ids, args.format, args.gzip):
+            out.write(block)
+    finally:
+        if args.output is not None:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
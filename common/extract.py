@@ -0,0 +1,91 @@
+import threading
+
+from lxml import etree
+
+from common.telemetry import metrics
+
+_local = threading.local()
+
+
+def _parser() -> etree.HTMLParser:
+    # lxml parsers must not be shared between threads
+    if not hasattr(_local, "parser"):
+        _local.parser = etree.HTMLParser(remove_comments=True, remove_pis=True, no_network=True)
+    return _local.parser
+
+
+def has_class(name: str) -> str:
+    # XPath predicate matching one class of a multi-class attribute, like BeautifulSoup's class_
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class Field:
+    """
+    A compiled XPath selector for one field. Element results are converted to their
+    text content, attribute and text() results are returned as they are.
+    """
+
+    def __init__(self, xpath: str, strip: bool = True):
+        self.xpath = xpath
+        self.strip = strip
+        self._compiled = etree.XPath(xpath)
+
+    def __call__(self, node) -> str or None:
+        for result in self._compiled(node):
+            value = result.xpath("string()") if isinstance(result, etree._Element) else str(result)
+            return value.strip() if self.strip else value
+        return None
+
+
+class Extractor:
+    """
+    Declares the fields of one page type. Selectors are compiled once when the extractor is
+    created. If `scope` is given as (start marker, end marker), only the part of the page
+    between the markers is parsed; the whole page is parsed if a marker is missing.
+    `rows` turns extract() into a list of dicts, one per matching row element.
+    Missing fields are counted as extraction failures unless they are `optional`.
+    """
+
+    def __init__(self, fields: dict[str, str], scope: tuple[str, str] = None, rows: str = None,
+                 optional: set[str] = frozenset()):
+        self.fields = {name: Field(xpath) for name, xpath in fields.items()}
+        self.scope = scope
+        self.rows = etree.XPath(rows) if rows is not None else None
+        self.optional = optional
+
+    def _slice(self, page: str) -> str:
+        if self.scope is None:
+            return page
+
+        start_marker, end_marker = self.scope
+        start = page.find(start_marker)
+        if start < 0:
+            return page
+        # a marker inside a start tag, e.g. 'id="paper_table"', slices from the tag itself
+        if not start_marker.startswith("<"):
+            start = max(page.rfind("<", 0, start), 0)
+        end = page.find(end_marker, start)
+        if end < 0:
+            return page
+        return page[start:end + len(end_marker)]
+
+    def parse(self, page: str):
+        return etree.fromstring(self._slice(page), _parser())
+
+    def extract_node(self, node) -> dict:
+        values = {name: field(node) for name, field in self.fields.items()}
+        for name, value in values.items():
+            if value is None and name not in self.optional:
+                metrics.inc("crawler_extraction_failures_total", field=name)
+        return values
+
+    def extract(self, page: str) -> dict or list[dict]:
+        metrics.inc("crawler_bytes_parsed_total", len(page))
+        with metrics.timer("crawler_parse_seconds"):
+            root = self.parse(page)
+            if root is None:
+                return [] if self.rows is not None else self.extract_node(etree.Element("html"))
+
+            if self.rows is not None:
+                return [self.extract_node(row) for row in self.rows(root)]
+            return self.extract_node(root)
@@ -0,0 +1,83 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator
+
+import httpx
+
+from common.rate_limit import get_limiter, parse_retry_after
+from common.telemetry import log, metrics
+
+USER_AGENT = "Mozilla/5.0 (compatible; tts-lit-paper-crawler)"
+
+_client: httpx.Client or None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    # one connection pool shared by every crawler of the process
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                headers={"user-agent": USER_AGENT},
+                follow_redirects=True,
+                timeout=30,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            )
+    return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def request(method: str, url: str, retries: int = 3, **kwargs) -> httpx.Response:
+    # paced by the limiter of the host; 429 and 5xx are retried after the limiter backed off
+    limiter = get_limiter(url)
+    for attempt in range(retries + 1):
+        metrics.observe("crawler_wait_seconds", limiter.acquire())
+        start = time.monotonic()
+        response = get_client().request(method, url, **kwargs)
+        elapsed = time.monotonic() - start
+        limiter.feedback(response.status_code, elapsed, parse_retry_after(response.headers.get("Retry-After")))
+
+        metrics.observe("crawler_fetch_seconds", elapsed)
+        metrics.inc("crawler_pages_fetched_total")
+        metrics.inc("crawler_bytes_fetched_total", len(response.content))
+
+        if response.status_code != 429 and response.status_code < 500:
+            break
+
+        metrics.inc("crawler_http_errors_total", status=response.status_code)
+        if attempt < retries:
+            metrics.inc("crawler_retries_total")
+            log.warning("retrying request", url=url, status=response.status_code, attempt=attempt + 1)
+
+    response.raise_for_status()
+    return response
+
+
+def get(url: str, **kwargs) -> httpx.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> httpx.Response:
+    return request("POST", url, **kwargs)
+
+
+def fetch_all(items: Iterable, fetch: Callable, max_workers: int = 8) -> Iterator[tuple]:
+    # run fetch(item) concurrently and yield (item, result, error) as the calls complete.
+    # the workers run in the caller's context so metrics keep the caller's source.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, fetch, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
@@ -0,0 +1,295 @@
+"""
+Compressed NDJSON interchange format of the crawler and filter outputs.
+
+A file is gzip- (.ndjson.gz) or zstd-compressed (.ndjson.zst) NDJSON. The first line is a
+header with the schema (the field names of the records) and the row count:
+
+    {"format": "tts-papers", "version": 1, "schema": ["title", "summary", ...], "rows": 1234}
+
+followed by one record per line. Readers detect the format from the first bytes of a file,
+so legacy JSON array files (and plain NDJSON) are read the same way.
+
+    python -m common.interchange convert acm_crawler/acm_papers.json ... [--zstd] [--remove]
+    python -m common.interchange info filter/filtered_papers.ndjson.gz
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import shutil
+import zlib
+from typing import IO, Iterable, Iterator
+
+FORMAT = "tts-papers"
+VERSION = 1
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# lines parsed with one json.loads call
+BATCH_BYTES = 1 << 20
+
+
+def read_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[dict]:
+    # yields the objects of a JSON array file one at a time without loading the whole file
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf8") as f:
+        buffer = ""
+        pos = 0
+        started = False
+        while True:
+            # skip whitespace, the opening bracket and the separators
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (buffer[pos] == "[" and not started)):
+                started = started or buffer[pos] == "["
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("end of buffer", buffer, pos)
+                value, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the value continues in the next chunk
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    if buffer[pos:].strip():
+                        raise
+                    return
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield value
+
+
+def _zstd():
+    # optional dependency, only needed for .zst files
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd-compressed files need the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def compression_of(path: str) -> str or None:
+    for compression, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def stem(path: str) -> str:
+    # the path without its .json / .ndjson / .ndjson.gz / .ndjson.zst extension
+    for extension in (*EXTENSIONS.values(), ".ndjson", ".json"):
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def resolve(path: str) -> str:
+    # the existing file among the variants of a path, so a legacy .json output is found under
+    # its new name and the other way round. The path itself if none exists.
+    if os.path.exists(path):
+        return path
+    for candidate in (*(stem(path) + extension for extension in EXTENSIONS.values()), stem(path) + ".json"):
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def _open_write(path: str, compression: str, level: int or None) -> IO[bytes]:
+    if compression == "zstd":
+        cctx = _zstd().ZstdCompressor(level=level or 10)
+        return cctx.stream_writer(open(path, "wb"), closefd=True)
+    return gzip.open(path, "wb", compresslevel=level or 6)
+
+
+def _compress(data: bytes, compression: str, level: int or None) -> bytes:
+    if compression == "zstd":
+        return _zstd().ZstdCompressor(level=level or 10).compress(data)
+    return gzip.compress(data, compresslevel=level or 6)
+
+
+def write(path: str, records: Iterable[dict], compression: str = None, level: int = None) -> int:
+    """
+    Writes the records to path and returns their number. The compression is taken from the
+    extension unless given; a path ending in .json gets a legacy JSON array file.
+
+    The body is compressed into a temporary file first, the header with the row count is
+    written in front of it as a separate gzip member / zstd frame (a concatenation of members
+    or frames is a valid stream), and the result replaces path atomically.
+    """
+    compression = compression or compression_of(path)
+    tmp_path = f"{path}.tmp"
+    if compression is None:
+        records = list(records)
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(records, f, indent=4)
+        os.replace(tmp_path, path)
+        return len(records)
+
+    body_path = f"{path}.body.tmp"
+    schema = dict()
+    rows = 0
+    try:
+        with _open_write(body_path, compression, level) as f:
+            for record in records:
+                for field in record:
+                    if field not in schema:
+                        schema[field] = None
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf8") + b"\n")
+                rows += 1
+
+        header = {"format": FORMAT, "version": VERSION, "schema": list(schema), "rows": rows}
+        with open(tmp_path, "wb") as out, open(body_path, "rb") as body:
+            out.write(_compress(json.dumps(header).encode("utf8") + b"\n", compression, level))
+            shutil.copyfileobj(body, out, 1 << 20)
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (body_path, tmp_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return rows
+
+
+def _magic(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(4)
+
+
+def _open_text(path: str) -> IO[str]:
+    magic = _magic(path)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rt", encoding="utf8")
+    if magic.startswith(ZSTD_MAGIC):
+        reader = _zstd().ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf8")
+    return open(path, "r", encoding="utf8")
+
+
+def _blocks(path: str) -> Iterator[bytes]:
+    # the decompressed content in blocks of about BATCH_BYTES
+    magic = _magic(path)
+    with open(path, "rb") as f:
+        if magic.startswith(GZIP_MAGIC):
+            # zlib directly instead of the gzip module, one decompressor per member
+            decompressor = zlib.decompressobj(wbits=31)
+            while chunk := f.read(BATCH_BYTES // 4):
+                while chunk:
+                    yield decompressor.decompress(chunk)
+                    chunk = decompressor.unused_data
+                    if decompressor.eof:
+                        decompressor = zlib.decompressobj(wbits=31)
+        elif magic.startswith(ZSTD_MAGIC):
+            with _zstd().ZstdDecompressor().stream_reader(f, read_across_frames=True) as reader:
+                while block := reader.read(BATCH_BYTES):
+                    yield block
+        else:
+            while block := f.read(BATCH_BYTES):
+                yield block
+
+
+def _is_header(value: dict) -> bool:
+    return value.get("format") == FORMAT and "schema" in value
+
+
+def read_header(path: str) -> dict or None:
+    # the header of an interchange file, None for legacy files
+    with _open_text(path) as f:
+        first = f.readline()
+    if first.lstrip().startswith("{"):
+        try:
+            value = json.loads(first)
+        except json.JSONDecodeError:
+            return None
+        if _is_header(value):
+            return value
+    return None
+
+
+def _parse_lines(data: bytes) -> list:
+    # complete lines, parsed with one json.loads call. JSON values never contain a raw newline,
+    # so the newlines become the separators of an array.
+    data = data.strip()
+    if not data:
+        return []
+    if b"\n\n" in data or b"\r" in data:
+        data = b"\n".join(line for line in data.splitlines() if line.strip())
+    return json.loads(b"[" + data.replace(b"\n", b",") + b"]")
+
+
+def _records(batches: Iterable[bytes]) -> Iterator[dict]:
+    header = True
+    for batch in batches:
+        values = _parse_lines(batch)
+        if header and values and isinstance(values[0], dict) and _is_header(values[0]):
+            values = values[1:]
+        header = False
+        yield from values
+
+
+def _batches(first: bytes, blocks: Iterator[bytes]) -> Iterator[bytes]:
+    # complete lines in batches of about BATCH_BYTES
+    parts, size = [first], len(first)
+    for block in blocks:
+        parts.append(block)
+        size += len(block)
+        if size >= BATCH_BYTES:
+            data = b"".join(parts)
+            end = data.rfind(b"\n") + 1
+            yield data[:end]
+            parts, size = [data[end:]], len(data) - end
+    # a line cut off by a crash is skipped, as by read_ndjson
+    data = b"".join(parts)
+    yield data[:data.rfind(b"\n") + 1]
+
+
+def read(path: str) -> Iterator[dict]:
+    # the records of an interchange, NDJSON or JSON array file, one at a time
+    blocks = _blocks(path)
+    first = b""
+    for block in blocks:
+        first += block
+        if first.strip():
+            break
+    if first.lstrip().startswith(b"["):
+        blocks.close()
+        yield from read_json_array(path)
+        return
+    yield from _records(_batches(first, blocks))
+
+
+def convert(path: str, compression: str = "gzip", level: int = None) -> tuple[str, int]:
+    # writes a legacy output next to it in the interchange format, returns the new path and the row count
+    target = stem(path) + EXTENSIONS[compression]
+    return target, write(target, read(path), compression, level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert crawler and filter outputs to compressed NDJSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="write <name>.ndjson.gz next to every file")
+    convert_parser.add_argument("files", nargs="+", help="JSON array or NDJSON files")
+    convert_parser.add_argument("--zstd", action="store_true", help="write .ndjson.zst (needs zstandard)")
+    convert_parser.add_argument("--level", type=int, default=None)
+    convert_parser.add_argument("--remove", action="store_true", help="remove the legacy files afterwards")
+    info_parser = subparsers.add_parser("info", help="print the header of interchange files")
+    info_parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        for path in args.files:
+            print(path, json.dumps(read_header(path)))
+        return
+
+    for path in args.files:
+        target, rows = convert(path, "zstd" if args.zstd else "gzip", args.level)
+        before, after = os.path.getsize(path), os.path.getsize(target)
+        print(f"{path} -> {target}: {rows} records, {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB "
+              f"({after / before if before else 0:.1%})")
+        if args.remove and target != path:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
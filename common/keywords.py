@@ -0,0 +1,25 @@
+import re
+
+abs_keywords = [
+    "Emotion", "Emotional", "Prosody", "prosodic", "Paralinguistic",
+    "Natural", "Naturalness", "Expressive", "Style",
+    "Human", "State-of-the-Art", "SOTA", "SOA", "State-of-Art",
+    "Voice", "Modulation", "Speech", "Pitch", "Rhythm", "Dynamic",
+    "Intonation", "Stress", "Affective", "Duration"
+]
+
+
+def escape_keyword(keyword):
+    return re.escape(keyword).replace(r'\-', r'-')
+
+
+# Combine keywords into a single regex pattern
+pattern = "|".join([escape_keyword(keyword) for keyword in abs_keywords])
+
+# Compile the regex pattern
+regex = re.compile(pattern, re.IGNORECASE)
+
+
+def compare(text: str) -> bool:
+    # check if one of the keywords is in the text
+    return bool(regex.search(text or ""))
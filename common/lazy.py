@@ -0,0 +1,32 @@
+import importlib
+
+
+class LazyImport:
+    """
+    A module, or a name defined in a module, imported on first use: attribute access and calls
+    are forwarded to it. Crawler modules get selenium, tqdm and dotenv this way, so code paths
+    that do not open a browser or show a progress bar do not pay for importing them.
+
+        tqdm = LazyImport("tqdm", "tqdm")
+        By = LazyImport("selenium.webdriver.common.by", "By")
+    """
+
+    def __init__(self, module: str, name: str = None):
+        self._module = module
+        self._name = name
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            self._target = getattr(target, self._name) if self._name else target
+        return self._target
+
+    def __getattr__(self, attr: str):
+        return getattr(self._resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"LazyImport({self._module!r}, {self._name!r})"
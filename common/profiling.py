@@ -0,0 +1,150 @@
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from starlette.datastructures import Headers, MutableHeaders
+
+
+class Timings:
+    # durations of the phases of one request, in the order they first ran
+
+    def __init__(self):
+        self.phases: dict[str, float] = dict()
+        self.main_thread = threading.get_ident()
+        # threads currently working for the request, the profiler samples these
+        self.threads = {self.main_thread}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+current_timings: contextvars.ContextVar[Timings or None] = contextvars.ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    # times a phase of the current request; without the middleware this is a single context variable lookup
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    thread = threading.get_ident()
+    timings.threads.add(thread)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+        if thread != timings.main_thread:
+            timings.threads.discard(thread)
+
+
+def frame_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the given threads every `interval` seconds from a background
+    thread and counts identical stacks. write() saves them in the collapsed format read by
+    flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, threads: set[int], interval: float = 0.001):
+        self.threads = threads
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread in list(self.threads):
+                frame = frames.get(thread)
+                if frame is not None:
+                    self.stacks[frame_stack(frame)] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware adding a Server-Timing header with the phases timed by phase() and the
+    total time until the response starts. A request is profiled if it is drawn with
+    `sample_rate` or sends an X-Profile header; its profile is written to `profile_dir`
+    and named in the header.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.0, profile_dir: str = "profiles", interval: float = 0.001):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = current_timings.set(timings)
+        profiler = None
+        if "x-profile" in Headers(scope=scope) or random.random() < self.sample_rate:
+            profiler = SamplingProfiler(timings.threads, self.interval).start()
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal profiler
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.header(time.perf_counter() - start))
+                if profiler is not None:
+                    profiler.stop()
+                    headers.append("Server-Timing", f'profile;desc="{self.save(profiler, scope["path"])}"')
+                    profiler = None
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            if profiler is not None:
+                profiler.stop()
+
+    def save(self, profiler: SamplingProfiler, path: str) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = path.strip("/").replace("/", "_") or "root"
+        file = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10**6}-{name}.folded")
+        profiler.write(file)
+        return file
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import time
+
+
+class Progress:
+    """
+    Progress of a run for another process, e.g. the job API of literature_helper: the stage,
+    the records processed, and done/total units of work of the stage (tasks of a crawl, papers
+    of a validation). Rewritten as a small JSON file at most every `interval` seconds; without
+    a path every call is a no-op.
+    """
+
+    def __init__(self, path: str or None, interval: float = 1.0, records: int = 0):
+        self.path = path
+        self.interval = interval
+        self.values = {"stage": None, "stage_started": None, "records": records, "done": 0, "total": 0}
+        self.written = 0.0
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, total: int = 0):
+        if self.path is None:
+            return
+        with self._lock:
+            self.values.update(stage=name, stage_started=time.time(), done=0, total=total)
+            self._write()
+
+    def add(self, records: int = 0, done: int = 0, total: int = 0):
+        if self.path is None:
+            return
+        with self._lock:
+            self.values["records"] += records
+            self.values["done"] += done
+            self.values["total"] += total
+            if time.monotonic() - self.written >= self.interval:
+                self._write()
+
+    def flush(self):
+        if self.path is None:
+            return
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(self.values, f)
+        os.replace(tmp_path, self.path)
+        self.written = time.monotonic()
+
+
+def read_progress(path: str) -> dict or None:
+    try:
+        with open(path, encoding="utf8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def eta_seconds(progress: dict or None) -> float or None:
+    # remaining time of the current stage at the rate so far. The total of a crawl grows as
+    # listing pages yield detail pages, so it is a lower bound there.
+    if not progress or not progress.get("stage_started"):
+        return None
+    done, total = progress["done"], progress["total"]
+    if done <= 0 or total <= done:
+        return None
+    return (time.time() - progress["stage_started"]) * (total - done) / done
@@ -0,0 +1,141 @@
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+import yaml
+
+from common import http
+from common.telemetry import log, metrics
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.yaml")
+word_regex = re.compile(r"\w+")
+
+
+def page_count(hits: int, page_size: int) -> int:
+    # the last page is a partial one unless hits is a multiple of the page size
+    return math.ceil(hits / page_size)
+
+
+@dataclass(frozen=True)
+class DateSlice:
+    # the months first..last of a search, inclusive, as year * 12 + month - 1
+    first: int
+    last: int
+
+    @staticmethod
+    def years(first_year: int, last_year: int) -> "DateSlice":
+        return DateSlice(first_year * 12, last_year * 12 + 11)
+
+    @property
+    def start_year(self) -> int:
+        return self.first // 12
+
+    @property
+    def start_month(self) -> int:
+        return self.first % 12 + 1
+
+    @property
+    def end_year(self) -> int:
+        return self.last // 12
+
+    @property
+    def end_month(self) -> int:
+        return self.last % 12 + 1
+
+    def split(self, granularity: int = 1) -> tuple["DateSlice", "DateSlice"] or None:
+        # two halves on a boundary of `granularity` months (12: whole years), None for a single unit
+        units = (self.last - self.first + 1) // granularity
+        if units < 2:
+            return None
+        middle = self.first + units // 2 * granularity
+        return DateSlice(self.first, middle - 1), DateSlice(middle, self.last)
+
+    def __str__(self) -> str:
+        return f"{self.start_year}-{self.start_month:02d}..{self.end_year}-{self.end_month:02d}"
+
+
+def plan(count: Callable[[DateSlice], int], whole: DateSlice, cap: int, granularity: int = 1,
+         max_workers: int = 4) -> list[tuple[DateSlice, int]]:
+    """
+    Splits a search into date slices of at most `cap` hits, the number of results a site
+    serves for one query. count(slice) returns the hits of the search restricted to the
+    slice; the slices of one level are counted concurrently (paced by the rate limiter of
+    the host, as every request).
+
+    Returns the slices with hits, in date order, with their number of hits. A single unit
+    of `granularity` months above the cap cannot be split further, its results beyond the
+    cap are lost and counted in crawler_truncated_results_total.
+    """
+    slices, pending = [], [whole]
+    while pending:
+        counted = list(http.fetch_all(pending, count, max_workers))
+        pending = []
+        for piece, hits, error in counted:
+            if error is not None:
+                # a slice that was not counted would be missing from the crawl without a trace
+                raise error
+            metrics.inc("crawler_query_slices_total")
+            if hits <= cap:
+                if hits > 0:
+                    slices.append((piece, hits))
+                continue
+
+            halves = piece.split(granularity)
+            if halves is None:
+                log.warning("slice above the result cap", slice=str(piece), hits=hits, cap=cap)
+                metrics.inc("crawler_truncated_results_total", hits - cap)
+                slices.append((piece, cap))
+            else:
+                pending.extend(halves)
+
+    slices.sort(key=lambda item: item[0].first)
+    return slices
+
+
+def load_topics(path: str = config_path) -> dict[str, dict]:
+    # the keywords section of config.yaml: search terms (filters) and per-API settings of each topic
+    with open(path, encoding="utf8") as f:
+        return (yaml.safe_load(f) or {}).get("keywords") or {}
+
+
+def _contains(words: tuple, other: tuple) -> bool:
+    # other occurs in words as a contiguous phrase
+    return any(words[i:i + len(other)] == other for i in range(len(words) - len(other) + 1))
+
+
+def search_terms(topics: dict[str, dict]) -> list[str]:
+    """
+    The distinct search terms of all topics, without the terms that contain another term as a
+    phrase ("neural text to speech" next to "text to speech"): every paper the longer phrase
+    matches is matched by the shorter one, so its query would only return duplicates.
+    Terms compare by their lower-case words, "Text-to-speech" is "text to speech".
+    """
+    terms: dict[tuple, str] = dict()
+    for topic in topics.values():
+        for term in topic.get("filters", []):
+            terms.setdefault(tuple(word_regex.findall(term.lower())), term)
+    return [term for words, term in terms.items()
+            if words and not any(other != words and _contains(words, other) for other in terms)]
+
+
+def topic_values(topics: dict[str, dict], key: str) -> list[str]:
+    # the distinct values of a per-API list of all topics, e.g. paperswithcode_tasks
+    return list(dict.fromkeys(value for topic in topics.values() for value in topic.get(key, [])))
+
+
+def arxiv_query(terms: list[str]) -> str:
+    # one query for all terms instead of one per term, whose results overlap
+    return " OR ".join(f'all:"{term}"' for term in terms)
+
+
+def semanticscholar_query(terms: list[str]) -> str:
+    # syntax of the bulk search: | is OR, quotes make a phrase
+    return " | ".join(f'"{term}"' for term in terms)
+
+
+def report(terms: list[str], queries: list[str]):
+    # a query per term is what the crawlers ran before, every merged term saves at least one request
+    log.info("query plan", terms=terms, queries=queries)
+    metrics.inc("crawler_requests_saved_total", len(terms) - len(queries), reason="merged_queries")
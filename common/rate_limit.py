@@ -0,0 +1,146 @@
+import threading
+import time
+import urllib.parse
+from email.utils import parsedate_to_datetime
+from typing import Callable
+
+# starting/maximum request rates (requests per second) for the hosts we crawl.
+# arXiv asks for no more than one request every three seconds.
+HOST_LIMITS = {
+    "export.arxiv.org": {"rate": 1 / 3, "max_rate": 1 / 3},
+    "oaipmh.arxiv.org": {"rate": 1 / 3, "max_rate": 1 / 3},
+    "dl.acm.org": {"rate": 1.0, "max_rate": 4.0},
+    "ieeexplore.ieee.org": {"rate": 1.0, "max_rate": 4.0},
+    "www.isca-archive.org": {"rate": 4.0, "max_rate": 20.0},
+    # 1 request per second with an API key
+    "api.semanticscholar.org": {"rate": 1.0, "max_rate": 1.0},
+}
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate adapts to the server: additive increase while responses
+    are healthy, multiplicative decrease on 429/5xx and latency spikes. Retry-After pauses
+    the bucket for the given time. `clock` and `sleep` can be replaced by a simulated clock.
+    """
+
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.05, max_rate: float = 10.0, burst: float = 1.0,
+                 increase: float = 0.05, decrease: float = 0.5, latency_factor: float = 3.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.clock = clock
+        self.sleep = sleep
+
+        self._rate = min(max(rate, min_rate), max_rate)
+        self._tokens = burst
+        self._updated = clock()
+        self._blocked_until = 0.0
+        # moving average of healthy response times, used to detect latency spikes
+        self._latency = None
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        # blocks until a request may be sent, returns the time waited
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self._tokens) / self._rate
+
+            self.sleep(wait)
+            waited += wait
+
+    def feedback(self, status: int = None, latency: float = None, retry_after: float = None):
+        # report the outcome of a request. status is None if it is unknown (browser navigation).
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+
+            if status is not None and (status == 429 or status >= 500):
+                self._slow_down()
+                if retry_after is not None:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                    self._tokens = 0
+                return
+
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+            if latency is not None:
+                if self._latency is not None and latency > self.latency_factor * self._latency:
+                    self._slow_down()
+                    # let the baseline follow a lasting slowdown
+                    self._latency = 0.9 * self._latency + 0.1 * latency
+                    return
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+
+            self._rate = min(self.max_rate, self._rate + self.increase)
+
+    def _slow_down(self):
+        self._rate = max(self.min_rate, self._rate * self.decrease)
+
+
+def host_of(url_or_host: str) -> str:
+    return urllib.parse.urlsplit(url_or_host).netloc if "//" in url_or_host else url_or_host
+
+
+class HostRateLimiters:
+    # one limiter per host, shared by every crawler of the process
+
+    def __init__(self, limits: dict[str, dict] = None, **defaults):
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.defaults = defaults
+        self._limiters: dict[str, AdaptiveRateLimiter] = dict()
+        self._lock = threading.Lock()
+
+    def get(self, url_or_host: str) -> AdaptiveRateLimiter:
+        host = host_of(url_or_host)
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = AdaptiveRateLimiter(**{**self.defaults, **self.limits.get(host, {})})
+            return self._limiters[host]
+
+    def rates(self) -> dict[str, float]:
+        with self._lock:
+            return {host: limiter.rate for host, limiter in self._limiters.items()}
+
+
+def parse_retry_after(value: str or None, now: float = None) -> float or None:
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (time.time() if now is None else now))
+    except (TypeError, ValueError):
+        return None
+
+
+limiters = HostRateLimiters()
+
+
+def get_limiter(url_or_host: str) -> AdaptiveRateLimiter:
+    return limiters.get(url_or_host)
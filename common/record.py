@@ -0,0 +1,128 @@
+import sys
+
+# fields of to_dict(), in the order of the merged output of filter.py
+FIELDS = ("source", "title", "abstract", "submitted", "doi", "arxiv_id", "pdf", "sources")
+
+# fields every record of a merged corpus has as strings, literature_helper skips other records
+REQUIRED_FIELDS = ("title", "abstract", "submitted", "source")
+# fields that are strings or null
+OPTIONAL_FIELDS = ("doi", "arxiv_id", "pdf")
+
+# sorted source lists seen so far, every merged record with the same sources shares one tuple
+_source_lists: dict[tuple, tuple] = dict()
+
+
+def invalid_fields(data: dict) -> list[str]:
+    # the fields of a merged record without the types of literature_helper.PaperInfo
+    invalid = [field for field in REQUIRED_FIELDS if not isinstance(data.get(field), str)]
+    invalid += [field for field in OPTIONAL_FIELDS if data.get(field) is not None and not isinstance(data[field], str)]
+    sources = data.get("sources", [])
+    if not isinstance(sources, list) or not all(isinstance(source, str) for source in sources):
+        invalid.append("sources")
+    return invalid
+
+
+def compact_date(value):
+    # "YYYY-MM-DD" is stored as the int YYYYMMDD, which sorts the same way and takes half the memory.
+    # Anything else (raw crawler dates, None) is kept as it is.
+    if type(value) is str and len(value) == 10 and value[4] == "-" and value[7] == "-":
+        digits = value[:4] + value[5:7] + value[8:]
+        if digits.isascii() and digits.isdigit():
+            return int(digits)
+    return value
+
+
+def expand_date(value):
+    if type(value) is int:
+        return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+    return value
+
+
+def intern_source(source):
+    return sys.intern(source) if type(source) is str else source
+
+
+def intern_sources(sources) -> tuple:
+    key = tuple(intern_source(source) for source in sources)
+    return _source_lists.setdefault(key, key)
+
+
+class Record:
+    """
+    One paper as the crawlers produce it, filter.py merges it and literature_helper serves it.
+
+    A slotted object instead of a dict or a class with a __dict__: source names are interned,
+    the source lists of merged records are shared tuples, and normalized dates are stored as
+    ints, so a record takes little more memory than its strings (benchmarks/bench_records.py).
+    """
+    __slots__ = ("title", "abstract", "_submitted", "_source", "doi", "arxiv_id", "pdf", "_sources")
+
+    def __init__(self, title, abstract, submitted, doi=None, arxiv_id=None, pdf=None, source=None, sources=()):
+        self.title = title
+        self.abstract = abstract
+        self._submitted = compact_date(submitted)
+        self._source = intern_source(source)
+        self.doi = doi
+        self.arxiv_id = arxiv_id
+        self.pdf = pdf
+        self._sources = intern_sources(sources)
+
+    @property
+    def submitted(self):
+        return expand_date(self._submitted)
+
+    @submitted.setter
+    def submitted(self, value):
+        self._submitted = compact_date(value)
+
+    @property
+    def year(self) -> str:
+        if type(self._submitted) is int:
+            return str(self._submitted // 10000)
+        return str(self._submitted).split("-")[0]
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, value):
+        self._source = intern_source(value)
+
+    @property
+    def sources(self) -> tuple:
+        return self._sources
+
+    @sources.setter
+    def sources(self, value):
+        self._sources = intern_sources(value)
+
+    def to_dict(self) -> dict:
+        return {
+            "source": self._source,
+            "title": self.title,
+            "abstract": self.abstract,
+            "submitted": expand_date(self._submitted),
+            "doi": self.doi,
+            "arxiv_id": self.arxiv_id,
+            "pdf": self.pdf,
+            "sources": list(self._sources),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Record":
+        # inverse of to_dict(), unknown keys (e.g. the id of the API) are ignored
+        return cls(data["title"], data["abstract"], data["submitted"], data.get("doi"), data.get("arxiv_id"),
+                   data.get("pdf"), data.get("source"), data.get("sources") or ())
+
+    def to_model(self, model, **extra):
+        # a pydantic model with the fields of the record, e.g. literature_helper.PaperInfo(id=...)
+        return model(**self.to_dict(), **extra)
+
+    @classmethod
+    def from_model(cls, model) -> "Record":
+        # the field values of a pydantic model are its __dict__ in pydantic 1 and 2
+        return cls.from_dict(model.__dict__)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.title!r}, source={self._source!r}, submitted={self.submitted!r})"
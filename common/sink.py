@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import threading
+from typing import Callable, Iterator
+
+from common import interchange
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    # a line cut off by a crash is skipped
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            if line.strip():
+                yield json.loads(line)
+
+
+def _repair(path: str):
+    # drop a partially written last line so the file can be appended to again
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+
+        f.seek(0)
+        data = f.read()
+        f.truncate(data.rfind(b"\n") + 1)
+
+
+class NdjsonSink:
+    """
+    Appends every record as one JSON line as soon as it is written. Records whose key was
+    already written are dropped. Records accepted by `predicate` also go to a second
+    `filtered_path` stream. Both files are flushed and fsynced every `batch_size` records.
+    With `resume` an existing file is kept and its keys count as already written.
+    """
+
+    def __init__(self, path: str, key: str or None = "title", filtered_path: str = None,
+                 predicate: Callable[[dict], bool] = None, batch_size: int = 50, resume: bool = False):
+        self.path = path
+        self.key = key
+        self.filtered_path = filtered_path
+        self.predicate = predicate
+        self.batch_size = batch_size
+
+        self.seen = set()
+        self.count = 0
+        self.filtered_count = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self._file = self._open(path, resume)
+        self._filtered_file = self._open(filtered_path, resume) if filtered_path is not None else None
+
+        if resume and key is not None and os.path.exists(path):
+            for record in read_ndjson(path):
+                self.seen.add(record.get(key))
+                self.count += 1
+
+    @staticmethod
+    def _open(path: str, resume: bool):
+        if resume and os.path.exists(path):
+            _repair(path)
+            return open(path, "a", encoding="utf8")
+        return open(path, "w", encoding="utf8")
+
+    def write(self, record: dict) -> bool:
+        # returns False if the record is a duplicate or, with a filtered stream, not accepted by the predicate
+        with self._lock:
+            if self.key is not None:
+                key = record.get(self.key)
+                if key in self.seen:
+                    return False
+                self.seen.add(key)
+
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            self._file.write(line)
+            self.count += 1
+
+            accepted = True
+            if self._filtered_file is not None:
+                accepted = self.predicate is None or self.predicate(record)
+                if accepted:
+                    self._filtered_file.write(line)
+                    self.filtered_count += 1
+
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._sync()
+            return accepted
+
+    def _sync(self):
+        for f in (self._file, self._filtered_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+            if self._filtered_file is not None:
+                self._filtered_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def convert(ndjson_path: str, output_path: str, replace: dict = None, key: str = None) -> int:
+    # write the output file read by filter.py and literature_helper, compressed NDJSON
+    # (see common.interchange) or a legacy JSON array file, depending on its extension.
+    # Records whose `key` is in `replace` are written in the version given there.
+    records = read_ndjson(ndjson_path)
+    if replace:
+        records = (replace.get(record.get(key), record) for record in records)
+    return interchange.write(output_path, records)
+
+
+def ndjson_path(output_path: str) -> str:
+    # the uncompressed stream an output is written from
+    return interchange.stem(output_path) + ".ndjson"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert crawler NDJSON output to compressed NDJSON")
+    parser.add_argument("files", nargs="+", help="NDJSON files, written next to them as .ndjson.gz")
+    args = parser.parse_args()
+
+    for path in args.files:
+        output_path = interchange.stem(path) + interchange.EXTENSIONS["gzip"]
+        print(f"{path} -> {output_path}: {convert(path, output_path)} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, Union
+
+from common import http
+from common.browser import BrowserPool
+from common.keywords import compare
+
+
+@dataclass
+class Task:
+    # a unit of crawl work, e.g. a listing page or a paper detail page
+    source: str
+    kind: str
+    url: str = ""
+    payload: dict = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {"source": self.source, "kind": self.kind, "url": self.url, "payload": self.payload}
+
+    def key(self) -> tuple:
+        # identifies the page a task fetches: the URL, or the payload of tasks without one
+        return self.kind, self.url or json.dumps(self.payload, sort_keys=True)
+
+    @staticmethod
+    def from_dict(data: dict) -> "Task":
+        return Task(data["source"], data["kind"], data.get("url", ""), data.get("payload", {}))
+
+
+class RunContext:
+    # resources shared by all sources of one run
+
+    def __init__(self, browsers: BrowserPool = None, archive=None):
+        self.http = http
+        self.browsers = browsers or BrowserPool()
+        # common.archive.PageArchive the raw fetched content is stored in, if any
+        self.archive = archive
+
+    def fetch(self, source: "Source", task: Task):
+        raw = source.fetch(self, task)
+        if self.archive is not None:
+            self.archive.add(source.name, task, raw)
+        return raw
+
+    def close(self):
+        self.browsers.close()
+        if self.archive is not None:
+            self.archive.close()
+
+
+class Source:
+    """
+    A crawler plugin.
+
+    discover() yields the initial tasks, fetch() loads the raw content of a task and
+    extract() turns it into normalized records (dicts in the crawler output format)
+    and/or follow-up tasks.
+    """
+    name: str = ""
+    # number of tasks of this source that may be fetched at the same time
+    max_concurrency: int = 1
+    # record field the keyword filter is applied to
+    relevance_field: str = "title"
+    # record field used to drop duplicates within this source
+    key_field: str = "title"
+    # output files, relative to the repository root
+    output_file: str = None
+    filtered_output_file: str = None
+
+    def discover(self, context: RunContext) -> Iterable[Task]:
+        raise NotImplementedError
+
+    def fetch(self, context: RunContext, task: Task):
+        raise NotImplementedError
+
+    def extract(self, task: Task, raw) -> Iterable[Union[dict, Task]]:
+        raise NotImplementedError
+
+    def is_relevant(self, record: dict) -> bool:
+        return compare(record.get(self.relevance_field))
+
+    def finish(self) -> None:
+        # called once the outputs of a complete crawl are written, e.g. to store a high-water mark
+        pass
@@ -0,0 +1,175 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import structlog
+
+log = structlog.get_logger()
+
+# upper bounds in seconds, shared by the fetch, wait and parse histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# source the current thread works for, set by the runner and the crawler mains
+current_source: contextvars.ContextVar[str] = contextvars.ContextVar("current_source", default="unknown")
+
+
+def set_source(name: str):
+    current_source.set(name)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float or None:
+        # estimated by linear interpolation inside the bucket, like Prometheus' histogram_quantile
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= rank:
+                return lower + (bound - lower) * (rank - seen) / self.counts[i]
+            seen += self.counts[i]
+            lower = bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms keyed by metric name and labels. Metrics are
+    labelled with the current source unless a source is passed explicitly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple, float] = dict()
+        self.gauges: dict[tuple, float] = dict()
+        self.histograms: dict[tuple, Histogram] = dict()
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        labels.setdefault("source", current_source.get())
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def total(self, name: str) -> float:
+        # a counter summed over all labels
+        with self._lock:
+            return sum(value for (metric, _), value in self.counters.items() if metric == name)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def to_prometheus(self) -> str:
+        def fmt(labels) -> str:
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        lines = []
+        with self._lock:
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{name}{fmt(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist.sum}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> dict:
+        # per-source summary of the run, e.g. to compare two runs
+        sources: dict[str, dict] = dict()
+
+        def entry(labels) -> dict:
+            return sources.setdefault(dict(labels).get("source", "unknown"), {"counters": {}, "latency": {}})
+
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                extra = [f"{k}={v}" for k, v in labels if k != "source"]
+                entry(labels)["counters"][name + (f"[{','.join(extra)}]" if extra else "")] = value
+
+            for (name, labels), hist in self.histograms.items():
+                entry(labels)["latency"][name] = {
+                    "count": hist.count,
+                    "total": hist.sum,
+                    "mean": hist.sum / hist.count if hist.count else None,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                }
+
+            gauges = {f"{name}{dict(labels)}": value for (name, labels), value in self.gauges.items()}
+
+        return {
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "sources": sources,
+            "gauges": gauges,
+        }
+
+    def write(self, json_path: str = None, prometheus_path: str = None):
+        if json_path is not None:
+            with open(json_path, "w") as f:
+                json.dump(self.report(), f, indent=4)
+        if prometheus_path is not None:
+            with open(prometheus_path, "w") as f:
+                f.write(self.to_prometheus())
+
+
+metrics = Metrics()
@@ -0,0 +1,248 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, Union
+
+from common.rate_limit import AdaptiveRateLimiter, HostRateLimiters, host_of
+from common.source import Task
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    task TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, source, id);
+CREATE TABLE IF NOT EXISTS records (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (source, key)
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    next_at REAL NOT NULL
+);
+"""
+
+
+class WorkQueue:
+    """
+    Crawl tasks stored in a SQLite file, shared by worker processes on one host or on several
+    hosts with a shared filesystem.
+
+    Workers lease tasks for `lease_seconds` and report them completed with the records and
+    follow-up tasks they produced, or failed. Leases that expire (e.g. the worker crashed) are
+    reclaimed by the next lease() call. A task is given up after `max_attempts` leases.
+    Records are stored once per (source, key), so a task that runs twice does not duplicate them.
+    The rollback journal is kept instead of WAL because WAL does not work on network filesystems.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # sqlite connections must not be shared between threads
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        return self._local.conn
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never lease the same task
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    @staticmethod
+    def _put(conn: sqlite3.Connection, tasks: Iterable[Task]) -> int:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO tasks (source, kind, task) VALUES (?, ?, ?)",
+            ((task.source, task.kind, json.dumps(task.to_dict(), sort_keys=True)) for task in tasks),
+        )
+        return conn.total_changes - before
+
+    def put(self, tasks: Iterable[Task]) -> int:
+        # returns the number of new tasks, tasks already in the queue are ignored
+        conn = self._transaction()
+        try:
+            added = self._put(conn, tasks)
+            conn.execute("COMMIT")
+            return added
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def lease(self, worker: str, sources: list[str] = None, count: int = 1) -> list[tuple[int, Task]]:
+        now = time.time()
+        conn = self._transaction()
+        try:
+            self._reclaim(conn, now)
+            query = "SELECT id, task FROM tasks WHERE state = 'pending'"
+            params = []
+            if sources is not None:
+                query += f" AND source IN ({','.join('?' * len(sources))})"
+                params.extend(sources)
+            rows = conn.execute(query + " ORDER BY id LIMIT ?", (*params, count)).fetchall()
+
+            conn.executemany(
+                "UPDATE tasks SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                ((worker, now + self.lease_seconds, task_id) for task_id, _ in rows),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [(task_id, Task.from_dict(json.loads(task))) for task_id, task in rows]
+
+    def heartbeat(self, task_ids: Iterable[int], worker: str):
+        # extends the leases of tasks that are still running
+        conn = self._transaction()
+        conn.executemany(
+            "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+            ((time.time() + self.lease_seconds, task_id, worker) for task_id in task_ids),
+        )
+        conn.execute("COMMIT")
+
+    def complete(self, task_id: int, items: Iterable[Union[dict, Task]], key_field: str = "title") -> int:
+        # stores the records and follow-up tasks of a task and marks it done in one transaction.
+        # returns the number of new records.
+        conn = self._transaction()
+        try:
+            source, = conn.execute("SELECT source FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            tasks, records = [], []
+            for item in items:
+                if isinstance(item, Task):
+                    tasks.append(item)
+                else:
+                    record = json.dumps(item)
+                    records.append((source, str(item.get(key_field)) if item.get(key_field) else record, record))
+
+            self._put(conn, tasks)
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO records (source, key, record) VALUES (?, ?, ?)", records)
+            added = conn.total_changes - before
+            conn.execute("UPDATE tasks SET state = 'done', lease_until = NULL, error = NULL WHERE id = ?", (task_id,))
+            conn.execute("COMMIT")
+            return added
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def fail(self, task_id: int, error: str):
+        conn = self._transaction()
+        conn.execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_until = NULL, error = ? WHERE id = ?",
+            (self.max_attempts, error, task_id),
+        )
+        conn.execute("COMMIT")
+
+    def _reclaim(self, conn: sqlite3.Connection, now: float) -> int:
+        before = conn.total_changes
+        conn.execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_until = NULL, error = 'lease expired' WHERE state = 'leased' AND lease_until < ?",
+            (self.max_attempts, now),
+        )
+        return conn.total_changes - before
+
+    def reclaim(self) -> int:
+        conn = self._transaction()
+        reclaimed = self._reclaim(conn, time.time())
+        conn.execute("COMMIT")
+        return reclaimed
+
+    def retry_failed(self, sources: list[str] = None) -> int:
+        conn = self._transaction()
+        query = "UPDATE tasks SET state = 'pending', attempts = 0 WHERE state = 'failed'"
+        if sources is not None:
+            query += f" AND source IN ({','.join('?' * len(sources))})"
+        retried = conn.execute(query, sources or ()).rowcount
+        conn.execute("COMMIT")
+        return retried
+
+    def active(self, sources: list[str] = None) -> int:
+        # number of tasks that are pending or leased, a worker stops when there are none left
+        query = "SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'leased')"
+        if sources is not None:
+            query += f" AND source IN ({','.join('?' * len(sources))})"
+        return self._conn().execute(query, sources or ()).fetchone()[0]
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        stats: dict[str, dict[str, int]] = dict()
+        for source, state, count in self._conn().execute(
+                "SELECT source, state, COUNT(*) FROM tasks GROUP BY source, state"):
+            stats.setdefault(source, {})[state] = count
+        for source, count in self._conn().execute("SELECT source, COUNT(*) FROM records GROUP BY source"):
+            stats.setdefault(source, {})["records"] = count
+        return stats
+
+    def records(self, source: str) -> Iterator[dict]:
+        for record, in self._conn().execute("SELECT record FROM records WHERE source = ? ORDER BY rowid", (source,)):
+            yield json.loads(record)
+
+    def reserve(self, host: str, interval: float) -> float:
+        # books the next request slot of a host for all workers and returns the time until it starts
+        now = time.time()
+        conn = self._transaction()
+        row = conn.execute("SELECT next_at FROM hosts WHERE host = ?", (host,)).fetchone()
+        start = max(now, row[0] if row else now)
+        conn.execute("INSERT OR REPLACE INTO hosts (host, next_at) VALUES (?, ?)", (host, start + interval))
+        conn.execute("COMMIT")
+        return start - now
+
+    def close(self):
+        if hasattr(self._local, "conn"):
+            self._local.conn.close()
+            del self._local.conn
+
+
+class SharedRateLimiter:
+    # paces a host across all workers of a queue: the local adaptive limiter decides the rate,
+    # the queue hands out the request slots. Worker clocks must be roughly in sync.
+
+    def __init__(self, limiter: AdaptiveRateLimiter, queue: WorkQueue, host: str):
+        self.limiter = limiter
+        self.queue = queue
+        self.host = host
+
+    @property
+    def rate(self) -> float:
+        return self.limiter.rate
+
+    def acquire(self) -> float:
+        waited = self.limiter.acquire()
+        delay = self.queue.reserve(self.host, 1.0 / self.limiter.rate)
+        if delay > 0:
+            time.sleep(delay)
+        return waited + delay
+
+    def feedback(self, status: int = None, latency: float = None, retry_after: float = None):
+        self.limiter.feedback(status, latency, retry_after)
+
+
+class SharedHostRateLimiters(HostRateLimiters):
+    def __init__(self, queue: WorkQueue, limits: dict[str, dict] = None, **defaults):
+        super().__init__(limits, **defaults)
+        self.queue = queue
+        self._shared: dict[str, SharedRateLimiter] = dict()
+
+    def get(self, url_or_host: str) -> SharedRateLimiter:
+        host = host_of(url_or_host)
+        limiter = super().get(host)
+        with self._lock:
+            if host not in self._shared:
+                self._shared[host] = SharedRateLimiter(limiter, self.queue, host)
+            return self._shared[host]
@@ -0,0 +1,159 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+from common import http, rate_limit
+from common.archive import PageArchive
+from common.browser import BrowserPool
+from common.source import RunContext, Source
+from common.telemetry import log, metrics, set_source
+from common.work_queue import SharedHostRateLimiters, WorkQueue
+from runner import SOURCES, STAGING_OUTPUT, FilterStage, load_sources
+
+# sources whose search URLs seed the queue unless --sources is given
+SEED_SOURCES = ["acm", "ieee", "interspeech"]
+
+
+def seed(queue: WorkQueue, sources: list[Source], context: RunContext):
+    # the coordinator only runs discover(), i.e. the searches; listing and detail pages are left to the workers
+    for source in sources:
+        set_source(source.name)
+        added = queue.put(source.discover(context))
+        print(f"{source.name}: {added} new tasks")
+
+
+class Worker:
+    """
+    Leases the tasks of its sources from the queue until none are pending or leased any more.
+    Every source gets max_concurrency threads. A heartbeat thread extends the leases of the
+    running tasks, so only the tasks of a worker that died are reclaimed.
+    """
+
+    def __init__(self, queue: WorkQueue, sources: list[Source], context: RunContext, worker_id: str,
+                 poll_seconds: float = 5.0):
+        self.queue = queue
+        self.sources = sources
+        self.context = context
+        self.worker_id = worker_id
+        self.poll_seconds = poll_seconds
+        self.running: set[int] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run_thread(self, source: Source):
+        set_source(source.name)
+        while True:
+            leased = self.queue.lease(self.worker_id, [source.name])
+            if not leased:
+                # other workers may still produce follow-up tasks from their leases
+                if self.queue.active([source.name]) == 0:
+                    return
+                time.sleep(self.poll_seconds)
+                continue
+
+            task_id, task = leased[0]
+            with self._lock:
+                self.running.add(task_id)
+            try:
+                items = list(source.extract(task, self.context.fetch(source, task)))
+                records = self.queue.complete(task_id, items, source.key_field)
+                metrics.inc("crawler_records_total", records)
+            except Exception as e:
+                metrics.inc("crawler_task_errors_total", kind=task.kind)
+                log.warning("task failed", source=source.name, kind=task.kind, url=task.url, error=str(e))
+                self.queue.fail(task_id, str(e))
+            finally:
+                with self._lock:
+                    self.running.discard(task_id)
+
+    def heartbeat(self):
+        while not self._stopped.wait(self.queue.lease_seconds / 3):
+            with self._lock:
+                running = list(self.running)
+            if running:
+                self.queue.heartbeat(running, self.worker_id)
+
+    def run(self):
+        heartbeat = threading.Thread(target=self.heartbeat, daemon=True)
+        heartbeat.start()
+
+        threads = [threading.Thread(target=self.run_thread, args=(source,))
+                   for source in self.sources for _ in range(source.max_concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stopped.set()
+
+
+def export(queue: WorkQueue, sources: list[Source], output: str):
+    # writes the same output files as runner.py from the records collected by all workers
+    stage = FilterStage(sources, output)
+    try:
+        for source in sources:
+            for record in queue.records(source.name):
+                stage.add(source, record)
+    finally:
+        stage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribute crawl tasks over worker processes through a shared queue")
+    parser.add_argument("command", choices=["seed", "work", "status", "reclaim", "retry", "export"])
+    parser.add_argument("--queue", default="crawl_queue.sqlite", help="queue file, on a filesystem shared by all workers")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=None,
+                        help=f"default: {' '.join(SEED_SOURCES)} for seed, all sources otherwise")
+    parser.add_argument("--lease", type=float, default=300, help="lease timeout in seconds")
+    parser.add_argument("--attempts", type=int, default=3, help="leases per task before it is marked failed")
+    parser.add_argument("--browsers", type=int, default=2, help="size of the Chrome pool of a worker")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--output", default=STAGING_OUTPUT,
+                        help="merged output, the served corpus is only replaced by refresh.py")
+    parser.add_argument("--report", default=None, help="JSON report with the metrics of this worker")
+    parser.add_argument("--archive", default=None, help="store every fetched page in this directory, see reextract.py")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue, args.lease, args.attempts)
+    names = args.sources or (SEED_SOURCES if args.command == "seed" else list(SOURCES))
+
+    if args.command == "status":
+        for source, states in sorted(queue.stats().items()):
+            print(source, " ".join(f"{state}={count}" for state, count in sorted(states.items())))
+        return
+    if args.command == "reclaim":
+        print(f"Reclaimed {queue.reclaim()} expired leases")
+        return
+    if args.command == "retry":
+        print(f"Retrying {queue.retry_failed(args.sources)} failed tasks")
+        return
+
+    sources = load_sources(names)
+    if not sources:
+        sys.exit("No source could be loaded")
+    if args.command == "export":
+        export(queue, sources, args.output)
+        return
+
+    # requests of all workers to a host share the pacing of that host
+    rate_limit.limiters = SharedHostRateLimiters(queue)
+    context = RunContext(BrowserPool(args.browsers), PageArchive(args.archive) if args.archive else None)
+    start = time.perf_counter()
+    try:
+        if args.command == "seed":
+            seed(queue, sources, context)
+        else:
+            Worker(queue, sources, context, args.worker_id).run()
+    finally:
+        context.close()
+        http.close_client()
+
+    log.info("worker finished", worker=args.worker_id, seconds=time.perf_counter() - start)
+    if args.report is not None:
+        metrics.write(args.report)
+
+
+if __name__ == "__main__":
+    main()
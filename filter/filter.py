@@ -1,14 +1,27 @@
 import os
-import json
+import re
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import interchange  # noqa: E402
+from common.record import Record  # noqa: E402
 
-class PaperInfo:
-    def __init__(self, title, abstract, submitted):
-        self.source = None
-        self.title = title
-        self.abstract = abstract
-        self.submitted = submitted
+# sources whose title is preferred when records of the same paper are merged, publishers first
+SOURCE_PRIORITY = ["acm", "ieee", "interspeech", "arxiv", "semanticscholar", "paperswithcode"]
+
+doi_prefix_regex = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:)", re.IGNORECASE)
+arxiv_doi_regex = re.compile(r"^10\.48550/arxiv\.(.+)$")
+arxiv_url_regex = re.compile(r"arxiv\.org/(?:abs|pdf)/(.+?)(?:\.pdf)?$", re.IGNORECASE)
+arxiv_version_regex = re.compile(r"v\d+$")
+title_key_regex = re.compile(r"[\W_]+")
+ieee_date_regex = re.compile(r"^(?:(\d{1,2})\S*\s+)?(?:([A-Za-z]+).*?\s+)?(\d{4})$")
+
+output_file = "filtered_papers.ndjson.gz"
+
+
+class PaperInfo(Record):
+    __slots__ = ()
 
     def add_source(self, source: str) -> None:
         self.source = source
@@ -17,28 +30,67 @@ class PaperInfo:
         self.submitted = new_date
 
 
-def get_files() -> list[str]:
-    # recursively search for .json files in the parent directory
-    files = []
-    for root, dirs, filenames in os.walk(os.path.join(os.getcwd(), "..")):
+def get_files(directory: str = None) -> list[str]:
+    # recursively search for .ndjson.gz / .ndjson.zst / legacy .json files in the parent directory.
+    # Of an output in several formats the compressed one is used.
+    extensions = [*interchange.EXTENSIONS.values(), ".json"]
+    found = []
+    for root, dirs, filenames in os.walk(directory or os.path.join(os.getcwd(), "..")):
         for filename in filenames:
-            if filename.endswith(".json") and "filtered" in filename:
-                files.append(os.path.join(root, filename))
+            for rank, extension in enumerate(extensions):
+                if filename.endswith(extension) and "filtered" in filename:
+                    found.append((rank, os.path.join(root, filename)))
+                    break
 
-    return files
+    files = dict()
+    for rank, path in sorted(found):
+        files.setdefault(interchange.stem(path), path)
+    return list(files.values())
 
 
 def load_json(file: str) -> list[PaperInfo]:
-    with open(file, "r") as f:
-        data = json.load(f)
+    # any of the output formats, see common.interchange
+    return [from_record(paper) for paper in interchange.read(file)]
 
-    papers = []
-    for paper in data:
-        papers.append(PaperInfo(paper["title"], paper["summary"], paper["submitted"]))
 
+def load_sources(files: list[str]) -> dict[str, list[PaperInfo]]:
+    # the papers of the per-source outputs by source, taken from the file name
+    papers: dict[str, list[PaperInfo]] = dict()
+    for file in files:
+        jsons = load_json(file)
+        print(f"Loaded {len(jsons)} papers from {file}")
+
+        source = file.split("/")[-1].split(".")[0].split("_")[0]
+        for paper in jsons:
+            paper.add_source(source)
+        papers[source] = jsons
     return papers
 
 
+def filter_and_merge(papers: dict[str, list[PaperInfo]]) -> list[dict]:
+    filtered_papers: list[PaperInfo] = []
+    for source, jsons in papers.items():
+        filtered = filter_papers(jsons)
+        filtered_papers.extend(filtered)
+    print(f"Filtered {len(filtered_papers)} papers")
+
+    # merge the records of the same paper from different sources
+    merged_papers = merge_papers(filtered_papers)
+    print(f"Merged into {len(merged_papers)} papers")
+    return merged_papers
+
+
+def from_record(record: dict) -> PaperInfo:
+    # records use the crawler output format
+    return PaperInfo(record["title"], record["summary"], record["submitted"], record.get("doi"),
+                     record.get("arxiv_id"), record.get("pdf"))
+
+
+def from_dict(data: dict) -> PaperInfo:
+    # inverse of paper.to_dict()
+    return PaperInfo.from_dict(data)
+
+
 def parse_date(date_str: str) -> datetime or None:
     # List of date formats to try
     date_formats = [
@@ -62,83 +114,168 @@ def parse_date(date_str: str) -> datetime or None:
 
 
 def parse_ieee_date(date_str: str) -> datetime or None:
+    # conference dates "16-20 April 2021", "30 Aug.-3 Sept. 2021", publication dates "April 2020", "2020".
+    # The first day of a range is used, the first of the month (or of the year) when there is none.
     if date_str is None or date_str == "" or date_str == "None":
         return None
 
+    match = ieee_date_regex.match(date_str.strip())
+    if match is None:
+        # dates of the REST API, e.g. 2021-03-01
+        return parse_date(date_str)
+    day, month, year = match.groups()
     try:
-        date_splitted = date_str.split(" ")
-        days = date_splitted[0]
-        months = date_splitted[1]
-        year = date_splitted[2]
-        return datetime.strptime(f"{days[0]} {months} {year}", "%d %B %Y")
+        if month is None:
+            return datetime(int(year), 1, 1)
+        return datetime.strptime(f"{day or 1} {month[:3]} {year}", "%d %b %Y")
     except ValueError:
         return None
 
 
+def filter_paper(paper: PaperInfo) -> PaperInfo or None:
+    if "None" in paper.submitted:
+        return None
+
+    if paper.source == "ieee":
+        date = parse_ieee_date(paper.submitted)
+    else:
+        date = parse_date(paper.submitted)
+    if date is None:
+        return None
+    if paper.abstract is None or paper.abstract == "" or paper.abstract == "None":
+        return None
+
+    # Update the date format to YYYY-MM-DD
+    if date is not None and date.year >= 2017:
+        paper.update_submitted(date.strftime("%Y-%m-%d"))
+        return paper
+    return None
+
+
 def filter_papers(papers: list[PaperInfo]) -> list[PaperInfo]:
     result = []
     for paper in papers:
-        if "None" in paper.submitted:
-            continue
-
-        if paper.source == "ieee":
-            date = parse_ieee_date(paper.submitted)
-        else:
-            date = parse_date(paper.submitted)
-        if date is None:
-            continue
-        if paper.abstract is None or paper.abstract == "" or paper.abstract == "None":
-            continue
-
-        # Update the date format to YYYY-MM-DD
-        if date is not None and date.year >= 2017:
-            paper.update_submitted(date.strftime("%Y-%m-%d"))
+        if filter_paper(paper) is not None:
             result.append(paper)
     return result
 
 
-def main():
-    files = get_files()
+def normalize_doi(doi: str or None) -> str or None:
+    if doi is None:
+        return None
+    doi = doi_prefix_regex.sub("", doi.strip()).lower()
+    return doi if doi.startswith("10.") else None
 
-    papers: dict[str, list[PaperInfo]] = dict()
-    for file in files:
-        jsons = load_json(file)
-        print(f"Loaded {len(jsons)} papers from {file}")
 
-        # get filename from path
-        source = file.split("/")[-1].split(".")[0].split("_")[0]
-        papers[source] = jsons
-    print("Total papers:", sum(len(jsons) for jsons in papers.values()))
+def normalize_arxiv_id(value: str or None) -> str or None:
+    # accepts ids, arXiv:<id> and abs/pdf URLs; the version is dropped
+    if value is None or value.strip() in ("", "None"):
+        return None
+    value = value.strip()
+    match = arxiv_url_regex.search(value)
+    if match:
+        value = match.group(1)
+    value = value.removeprefix("arXiv:").removeprefix("arxiv:")
+    return arxiv_version_regex.sub("", value).lower()
+
+
+def paper_keys(paper: PaperInfo) -> list[str]:
+    # identifiers under which records of the same paper meet
+    doi = normalize_doi(paper.doi)
+    arxiv_id = normalize_arxiv_id(paper.arxiv_id) or normalize_arxiv_id(paper.pdf)
+    if arxiv_id is None and doi is not None and arxiv_doi_regex.match(doi):
+        arxiv_id = arxiv_doi_regex.match(doi).group(1)
+
+    keys = []
+    # an empty or punctuation-only title would join unrelated papers
+    title = title_key_regex.sub("", paper.title.casefold()) if paper.title else ""
+    if title:
+        keys.append(f"title:{title}")
+    if doi is not None:
+        keys.append(f"doi:{doi}")
+    if arxiv_id is not None:
+        keys.append(f"arxiv:{arxiv_id}")
+    return keys
+
+
+def is_missing(value) -> bool:
+    return value is None or value == "" or value == "None"
+
+
+def canonical(papers: list[PaperInfo]) -> dict:
+    # the best field of every record: title of the preferred source, longest abstract,
+    # earliest date, and the first identifiers found
+    def priority(paper: PaperInfo) -> int:
+        return SOURCE_PRIORITY.index(paper.source) if paper.source in SOURCE_PRIORITY else len(SOURCE_PRIORITY)
+
+    papers = sorted(papers, key=priority)
+    best = papers[0]
+
+    def first(values):
+        return next((value for value in values if not is_missing(value)), None)
+
+    arxiv_ids = (normalize_arxiv_id(paper.arxiv_id) or normalize_arxiv_id(paper.pdf) for paper in papers)
+    return {
+        "source": best.source,
+        "title": best.title,
+        "abstract": max((paper.abstract for paper in papers if not is_missing(paper.abstract)), key=len,
+                        default=best.abstract),
+        "submitted": min(paper.submitted for paper in papers),
+        "doi": first(normalize_doi(paper.doi) for paper in papers),
+        "arxiv_id": first(arxiv_ids),
+        "pdf": first(paper.pdf for paper in papers),
+        "sources": sorted({paper.source for paper in papers if paper.source is not None}),
+    }
+
+
+def merge_papers(papers: list[PaperInfo]) -> list[dict]:
+    # hash join on DOI, arXiv id and normalized title in one pass. Records sharing any key
+    # end up in the same group (union-find), even if they are linked through a third record.
+    # Records without a title are dropped, the output requires one.
+    papers = [paper for paper in papers if not is_missing(paper.title)]
+    parent = list(range(len(papers)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner: dict[str, int] = dict()
+    for i, paper in enumerate(papers):
+        for key in paper_keys(paper):
+            j = owner.setdefault(key, i)
+            if j != i:
+                parent[find(i)] = find(j)
+
+    groups: dict[int, list[PaperInfo]] = dict()
+    for i, paper in enumerate(papers):
+        groups.setdefault(find(i), []).append(paper)
+
+    return [canonical(group) for group in groups.values()]
 
-    # update the source of each paper
-    for source, jsons in papers.items():
-        for paper in jsons:
-            paper.add_source(source)
 
-    filtered_papers: list[PaperInfo] = []
-    for source, jsons in papers.items():
-        filtered = filter_papers(jsons)
-        filtered_papers.extend(filtered)
-    print(f"Filtered {len(filtered_papers)} papers")
+def main():
+    # the output of an earlier run is not an input
+    files = [file for file in get_files()
+             if os.path.abspath(interchange.stem(file)) != os.path.abspath(interchange.stem(output_file))]
+
+    papers = load_sources(files)
+    print("Total papers:", sum(len(jsons) for jsons in papers.values()))
 
-    # Save filtered papers to a new json file
-    with open("filtered_papers.json", "w", encoding='utf8') as f:
-        json.dump([paper.__dict__ for paper in filtered_papers], f, indent=4)
+    merged_papers = filter_and_merge(papers)
 
-    # remove duplicates
-    filtered_papers = list({paper.title: paper for paper in filtered_papers}.values())
-    print(f"Remove duplicates {len(filtered_papers)} papers")
+    # Save filtered papers as compressed NDJSON
+    interchange.write(output_file, merged_papers)
 
     # group by source
     grouped_papers = dict()
-    for paper in filtered_papers:
-        if paper.source not in grouped_papers:
-            grouped_papers[paper.source] = []
-        grouped_papers[paper.source].append(paper)
+    for paper in merged_papers:
+        for source in paper["sources"]:
+            grouped_papers[source] = grouped_papers.get(source, 0) + 1
 
     # print statistics
-    for source, filtered_papers in grouped_papers.items():
-        new_len = len(filtered_papers)
+    for source, new_len in grouped_papers.items():
         old_len = len(papers[source])
         print(f"{source}: {old_len} -> {new_len}")
 
@@ -1,42 +1,43 @@
+import argparse
+import json
 import os
-import random
 import re
+import sys
 import time
-
-import dotenv
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-import selenium.webdriver.support.expected_conditions as EC
-from tqdm import tqdm
-from webdriver_manager.chrome import ChromeDriverManager
-
-
-class PaperInfo:
-    def __init__(self, title, abstract, doi, publication_date):
-        self.title = title
-        self.abstract = abstract
-        self.doi = doi
-        self.publication_date = publication_date
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import browser, http, keywords, query_plan  # noqa: E402
+from common.browser import EC, By, WebDriver, WebDriverWait  # noqa: E402
+from common.extract import Extractor, has_class  # noqa: E402
+from common.lazy import LazyImport  # noqa: E402
+from common.query_plan import DateSlice, page_count  # noqa: E402
+from common.record import Record  # noqa: E402
+from common.sink import NdjsonSink, convert  # noqa: E402
+from common.telemetry import metrics, set_source  # noqa: E402
+from common.source import RunContext, Source, Task  # noqa: E402
+
+dotenv = LazyImport("dotenv")
+tqdm = LazyImport("tqdm", "tqdm")
+
+base_iee_url = "https://ieeexplore.ieee.org"
+
+listing_extractor = Extractor(
+    {"url": f"descendant::a[{has_class('fw-bold')}][1]/@href"},
+    rows=f"//div[{has_class('List-results-items')}]",
+)
+# the document page is rendered by Angular, everything we read lives in <xpl-document-details>
+paper_extractor = Extractor({
+    "title": f"//h1[{has_class('document-title')}]",
+    "abstract": f"(//div[{has_class('abstract-text')}])[1]/descendant::div[1]/descendant::div[1]/descendant::div[1]",
+    "doi": f"//div[{has_class('stats-document-abstract-doi')}]/descendant::a[1]",
+    "conference_date": f"//div[{has_class('doc-abstract-confdate')}]",
+    "publication_date": f"//div[{has_class('doc-abstract-pubdate')}]",
+}, scope=("<xpl-document-details", "</xpl-document-details>"), optional={"doi", "conference_date", "publication_date"})
 
 
 def get_chrome():
-    options = Options()
-    # options.add_argument("--headless=new")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--log-level=3")
-    options.add_experimental_option("excludeSwitches", ["enable-logging"])
-
-    service = Service(executable_path=ChromeDriverManager().install())
-    driver = webdriver.Chrome(
-        service=service,
-        options=options
-    )
-    return driver
+    return browser.get_chrome(headless=False)
 
 
 def login(driver: WebDriver):
@@ -58,7 +59,7 @@ def login(driver: WebDriver):
     driver.find_element(By.XPATH, '/html/body/div/div/div/div[1]/form/div[5]/button').click()
 
 
-def get_num_pages(driver: WebDriver) -> int:
+def get_num_hits(driver: WebDriver) -> int:
     try:
         xpath = '//*[@id="xplMainContent"]/div[1]/div[2]/xpl-search-dashboard/section/div/h1/span[1]/span[2]'
         WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.XPATH, xpath)))
@@ -68,14 +69,16 @@ def get_num_pages(driver: WebDriver) -> int:
             xpath
         )[0].text
 
-        pages = int(num_hits_ieee) // 100
-
-        return pages
+        return int(num_hits_ieee.replace(",", ""))
     except Exception as e:
         print(e)
         return 0
 
 
+def get_num_pages(driver: WebDriver) -> int:
+    return page_count(get_num_hits(driver), rows_per_page)
+
+
 def extract_date(publication_info: str) -> str:
     match = re.search(r'Date of [\w\s]*: {2}(.*)', publication_info)
     if match:
@@ -85,166 +88,343 @@ def extract_date(publication_info: str) -> str:
 
 def navigate_to_paper(driver: WebDriver, paper_url: str) -> None:
     try:
-        driver.get(paper_url)
+        browser.navigate(driver, paper_url)
         WebDriverWait(driver, 2).until(EC.presence_of_all_elements_located((By.XPATH, '//*[@id="xplMainContentLandmark"]/div/xpl-document-details/div/div[1]/section[2]/div/xpl-document-header/section/div[2]/div/div/div[1]/div/div[1]/h1')))
     except Exception as e:
         print(e)
 
 
-def extract_paper_info(driver: WebDriver, paper_url: str) -> PaperInfo:
-    base_iee_url = "https://ieeexplore.ieee.org"
-    print(f"Extracting paper info from {base_iee_url}{paper_url}")
+def extract_paper_info(driver: WebDriver, paper_url: str, base_url: str = base_iee_url) -> Record:
+    print(f"Extracting paper info from {base_url}{paper_url}")
 
-    navigate_to_paper(driver, f"{base_iee_url}{paper_url}")
+    navigate_to_paper(driver, f"{base_url}{paper_url}")
 
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    try:
-        title = soup.find("h1", class_='document-title').text
-    except Exception as e:
-        print("Error extracting title", e)
+    return parse_paper_page(driver.page_source)
 
-    try:
-        abstract_container = soup.find("div", class_='abstract-text').div.div.div.text
-    except Exception as e:
-        print("Error extracting abstract", e)
 
-    try:
-        doi_container = soup.find("div", class_='stats-document-abstract-doi')
-        if doi_container is not None:
-            doi = doi_container.a.text
-        else:
-            doi = ""
-    except Exception as e:
-        print("Error extracting doi", e)
+def parse_paper_page(page_source: str) -> Record:
+    fields = paper_extractor.extract(page_source)
 
-    try:
-        publication_date = soup.find("div", class_='doc-abstract-confdate')
+    for name in ("title", "abstract"):
+        if fields[name] is None:
+            print("Error extracting", name)
 
-        if publication_date is None:
-            publication_date = soup.find("div", class_='doc-abstract-pubdate')
+    publication_date = fields["conference_date"] or fields["publication_date"]
+    if publication_date is None:
+        print("Error extracting publication date")
 
-        publication_date = publication_date.text
-    except Exception as e:
-        print("Error extracting publication date", e)
+    return Record(fields["title"], fields["abstract"], extract_date(publication_date or ""), doi=fields["doi"] or "")
 
-    try:
-        date = extract_date(publication_date)
-    except Exception as e:
-        print("Error extracting date", e)
 
-    return PaperInfo(title, abstract_container, doi, date)
+def parse_listing(page_source: str) -> list[str]:
+    return [row["url"] for row in listing_extractor.extract(page_source) if row["url"]]
 
 
-def access_page(driver: WebDriver, page_num: int) -> list[PaperInfo]:
+def access_page(driver: WebDriver, page_num: int, sink: NdjsonSink = None, url: str = None) -> list[Record]:
+    # with a sink every paper is written as soon as it is extracted instead of being returned
     papers = []
     try:
-        driver.get(f'{base_search_url}&pageNumber={page_num}')
+        browser.navigate(driver, f'{url or base_search_url}&pageNumber={page_num}')
         WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'List-results-items')))
 
         # results = driver.find_elements(By.XPATH, xpath)
-        # parse with beautifulsoup
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        results = soup.find_all("div", class_='List-results-items')
-
-        for idx, result in tqdm(enumerate(results)):
-            paper_url = result.find("a", class_='fw-bold')['href']
+        for idx, paper_url in tqdm(enumerate(parse_listing(driver.page_source))):
             paper_info = extract_paper_info(driver, paper_url)
-            papers.append(paper_info)
-
-            # sleep for a random time between 1 and 2 seconds
-            time.sleep(random.uniform(1, 2))
+            if sink is not None:
+                sink.write(to_record(paper_info))
+            else:
+                papers.append(paper_info)
 
         return papers
 
     except Exception as e:
         print(e)
 
-def escape_keyword(keyword):
-    return re.escape(keyword).replace(r'\-', r'-')
 
+def to_record(result: Record) -> dict:
+    return {
+        "title": result.title,
+        # "pdf": result.pdf_url,
+        "doi": result.doi,
+        "summary": result.abstract,
+        "submitted": str(result.submitted),
+    }
 
-def compare(text: str, regex: re.Pattern[str]) -> bool:
-    # check if one of the keywords is in the title
-    return bool(regex.search(text))
 
+base_search_url = 'https://ieeexplore.ieee.org/search/searchresult.jsp?action=search&newsearch=true&matchBoolean=true&queryText=(%22All%20Metadata%22:tts)%20AND%20(%22All%20Metadata%22:prosod*)%20OR%20(%22All%20Metadata%22:tts)%20AND%20(%22All%20Metadata%22:emot*)%20OR%20(%22All%20Metadata%22:tts)%20AND%20(%22All%20Metadata%22:style)&rowsPerPage=100'
 
-def save(results: list[PaperInfo], filename="papers.json"):
-    # save the papers to a file for later use in json
-    # structure of the json file:
-    #
-    # {
-    #     "title": "Title of the paper",
-    #     "pdf": "URL to the pdf",
-    #     "doi": "DOI of the paper",
-    #     "summary": "Summary of the paper",
-    # }
-    #
-    # the file will be named papers.json
 
-    import json
-    with open(filename, "w") as f:
-        json.dump([{
-            "title": result.title,
-            # "pdf": result.pdf_url,
-            "doi": result.doi,
-            "summary": result.abstract,
-            "submitted": str(result.publication_date),
-        } for result in results], f, indent=4)
+# the search UI and the document pages get their data from these JSON sources, the API mode
+# reads them directly instead of rendering the Angular pages
+rows_per_page = 100
+query_text = parse_qs(urlsplit(base_search_url).query)["queryText"][0]
+# searches above max_results hits are split into year slices, deeper pages of a search are not served.
+# filter.py keeps papers from 2017 on, the slices start with the same year as the ACM search.
+max_results = 2000
+first_year = 2016
+# the document page embeds its metadata as a JS object literal
+metadata_regex = re.compile(r"xplGlobal\.document\.metadata\s*=\s*(\{.*?\});\s*$", re.MULTILINE)
 
 
-base_search_url = 'https://ieeexplore.ieee.org/search/searchresult.jsp?action=search&newsearch=true&matchBoolean=true&queryText=(%22All%20Metadata%22:tts)%20AND%20(%22All%20Metadata%22:prosod*)%20OR%20(%22All%20Metadata%22:tts)%20AND%20(%22All%20Metadata%22:emot*)%20OR%20(%22All%20Metadata%22:tts)%20AND%20(%22All%20Metadata%22:style)&rowsPerPage=100'
+def search_range() -> DateSlice:
+    return DateSlice.years(first_year, time.localtime().tm_year)
 
 
-abs_keywords = [
-    "Emotion", "Emotional", "Prosody", "prosodic", "Paralinguistic",
-    "Natural", "Naturalness", "Expressive", "Style",
-    "Human", "State-of-the-Art", "SOTA", "SOA", "State-of-Art",
-    "Voice", "Modulation", "Speech", "Pitch", "Rhythm", "Dynamic",
-    "Intonation", "Stress", "Affective", "Duration"
-]
+def year_range(piece: DateSlice) -> str:
+    # the publication year filter of the search, as in the "ranges" parameter of the search page
+    return f"{piece.start_year}_{piece.end_year}_Year"
 
 
-def escape_keyword(keyword):
-    return re.escape(keyword).replace(r'\-', r'-')
+def search_url(piece: DateSlice = None) -> str:
+    return base_search_url if piece is None else f"{base_search_url}&ranges={year_range(piece)}"
 
 
-def compare(text: str, regex: re.Pattern[str]) -> bool:
-    # check if one of the keywords is in the title
-    return bool(regex.search(text))
+def search_body(page: int, piece: DateSlice = None) -> dict:
+    body = {
+        "newsearch": True,
+        "queryText": query_text,
+        "matchBoolean": True,
+        "highlight": False,
+        "returnFacets": ["ALL"],
+        "returnType": "SEARCH",
+        "rowsPerPage": rows_per_page,
+        "pageNumber": page,
+    }
+    if piece is not None:
+        body["ranges"] = [year_range(piece)]
+    return body
 
 
-def main():
+def search_page(page: int, base_url: str = base_iee_url, piece: DateSlice = None) -> dict:
+    # the endpoint rejects requests that do not look like they come from the search page
+    return http.post(f"{base_url}/rest/search", json=search_body(page, piece), headers={
+        "Origin": base_url,
+        "Referer": f"{base_url}/search/searchresult.jsp",
+    }).json()
+
+
+def count_pages(search: dict) -> int:
+    if search.get("totalPages"):
+        return int(search["totalPages"])
+    return page_count(int(search.get("totalRecords") or 0), rows_per_page)
+
+
+def plan_searches(base_url: str = base_iee_url, max_workers: int = 8) -> list[tuple[DateSlice, dict]]:
+    # year slices below max_results, with the first page of each slice, which is loaded to count it anyway
+    first_pages: dict[DateSlice, dict] = dict()
+
+    def count(piece: DateSlice) -> int:
+        first_pages[piece] = search_page(1, base_url, piece)
+        return int(first_pages[piece].get("totalRecords") or 0)
+
+    slices = query_plan.plan(count, search_range(), max_results, granularity=12, max_workers=max_workers)
+    return [(piece, first_pages[piece]) for piece, _ in slices]
+
+
+def parse_metadata(page_source: str) -> dict or None:
+    match = metadata_regex.search(page_source)
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+
+
+def fetch_metadata(document_link: str, base_url: str = base_iee_url) -> dict or None:
+    return parse_metadata(http.get(f"{base_url}{document_link}").text)
+
+
+def paper_from_json(data: dict) -> Record:
+    # search records and document metadata share most field names, but not the title
+    title = data.get("articleTitle") or data.get("title") or data.get("displayDocTitle")
+    publication_date = data.get("conferenceDate") or data.get("onlineDate") or data.get("publicationDate") or ""
+    return Record(title, data.get("abstract"), publication_date, doi=data.get("doi") or "")
+
+
+def document_link(data: dict) -> str:
+    return data.get("documentLink") or f"/document/{data['articleNumber']}/"
+
+
+def crawl_api(base_url: str = base_iee_url, max_workers: int = 8, driver: WebDriver = None,
+              sink: NdjsonSink = None) -> list[Record]:
+    # search pages of all year slices are loaded concurrently, documents without an abstract in the
+    # search results are completed from their metadata and only the rest is rendered in the browser
+    slices = plan_searches(base_url, max_workers)
+    records = []
+    rest = []
+    for piece, first in slices:
+        records.extend(first.get("records", []))
+        rest.extend((piece, page) for page in range(2, count_pages(first) + 1))
+    print(f"{len(slices) + len(rest)} pages in {len(slices)} slices")
+
+    pages = http.fetch_all(rest, lambda item: search_page(item[1], base_url, item[0]), max_workers)
+    for (piece, page), search, error in tqdm(pages, total=len(rest)):
+        if error is not None:
+            print(f"Error loading page {page} of {piece}: {error}")
+            continue
+        records.extend(search.get("records", []))
+
+    # with a sink every paper is written as soon as it is complete instead of being returned
+    papers = []
+
+    def emit(paper: Record):
+        if sink is not None:
+            sink.write(to_record(paper))
+        else:
+            papers.append(paper)
+
+    missing = []
+    for record in records:
+        paper = paper_from_json(record)
+        if paper.abstract:
+            emit(paper)
+        else:
+            missing.append(record)
+
+    fallback = []
+    results = http.fetch_all(missing, lambda record: fetch_metadata(document_link(record), base_url), max_workers)
+    for record, metadata, error in results:
+        paper = paper_from_json({**record, **(metadata or {})})
+        if paper.abstract:
+            emit(paper)
+        else:
+            fallback.append(document_link(record))
+
+    if fallback:
+        metrics.inc("crawler_browser_fallbacks_total", len(fallback))
+        # a browser started here is quit here, one passed in belongs to the caller
+        own_driver = driver is None
+        if own_driver:
+            driver = get_chrome()
+        try:
+            for paper_url in tqdm(fallback):
+                emit(extract_paper_info(driver, paper_url, base_url))
+        finally:
+            if own_driver:
+                driver.quit()
+
+    return papers
+
+
+class IeeeSource(Source):
+    name = "ieee"
+    max_concurrency = 4
+    output_file = "ieee_crawler/ieee_papers.ndjson.gz"
+    filtered_output_file = "ieee_crawler/ieee_filtered_papers.ndjson.gz"
+
+    def __init__(self, mode: str = "api", base_url: str = base_iee_url):
+        # mode "api" reads the JSON endpoints, "browser" renders every page in Chrome
+        self.mode = mode
+        self.base_url = base_url
+        # first search pages loaded by discover() to count the slices, by task key. fetch() takes
+        # them from here instead of loading them again (in another process, e.g. a crawl_queue
+        # worker, they are loaded as usual).
+        self.first_pages: dict[tuple, dict] = dict()
+
+    def discover(self, context: RunContext):
+        if self.mode == "api":
+            for piece, first in plan_searches(self.base_url, self.max_concurrency):
+                for page in range(1, count_pages(first) + 1):
+                    task = Task(self.name, "search", payload={"page": page, "slice": [piece.first, piece.last]})
+                    if page == 1:
+                        self.first_pages[task.key()] = first
+                    yield task
+            return
+
+        def count(piece: DateSlice) -> int:
+            with context.browsers.acquire() as driver:
+                browser.navigate(driver, search_url(piece))
+                return get_num_hits(driver)
+
+        for piece, hits in query_plan.plan(count, search_range(), max_results, granularity=12,
+                                           max_workers=self.max_concurrency):
+            for page in range(1, page_count(hits, rows_per_page) + 1):
+                yield Task(self.name, "listing", f'{search_url(piece)}&pageNumber={page}')
+
+    def fetch(self, context: RunContext, task: Task):
+        if task.kind == "search":
+            first = self.first_pages.pop(task.key(), None)
+            if first is not None:
+                metrics.inc("crawler_requests_saved_total", reason="first_page")
+                return first
+            piece = DateSlice(*task.payload["slice"]) if "slice" in task.payload else None
+            return search_page(task.payload["page"], self.base_url, piece)
+        if task.kind == "metadata":
+            return fetch_metadata(task.url, self.base_url)
+
+        with context.browsers.acquire() as driver:
+            if task.kind == "listing":
+                browser.navigate(driver, task.url)
+                WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'List-results-items')))
+            else:
+                navigate_to_paper(driver, task.url)
+            return driver.page_source
+
+    def extract(self, task: Task, raw):
+        if task.kind == "search":
+            for record in raw.get("records", []):
+                paper = paper_from_json(record)
+                if paper.abstract:
+                    yield to_record(paper)
+                else:
+                    yield Task(self.name, "metadata", document_link(record), payload={"record": record})
+        elif task.kind == "metadata":
+            paper = paper_from_json({**task.payload["record"], **(raw or {})})
+            if paper.abstract:
+                yield to_record(paper)
+            else:
+                metrics.inc("crawler_browser_fallbacks_total")
+                yield Task(self.name, "detail", f"{self.base_url}{task.url}")
+        elif task.kind == "listing":
+            for paper_url in parse_listing(raw):
+                yield Task(self.name, "detail", f"{self.base_url}{paper_url}")
+        else:
+            yield to_record(parse_paper_page(raw))
+
+
+def crawl_browser(sink: NdjsonSink):
     driver = get_chrome()
-    driver.get(base_search_url)
+    browser.navigate(driver, base_search_url)
     driver.implicitly_wait(10)
     # login(driver)
-    num_pages = get_num_pages(driver)
-    print(num_pages)
 
-    papers = []
+    def count(piece: DateSlice) -> int:
+        browser.navigate(driver, search_url(piece))
+        return get_num_hits(driver)
 
-    for page in tqdm(range(1, num_pages + 1)):
-        papers.extend(access_page(driver, page))
+    slices = query_plan.plan(count, search_range(), max_results, granularity=12, max_workers=1)
+    print(sum(page_count(hits, rows_per_page) for _, hits in slices), "pages in", len(slices), "slices")
+
+    for piece, hits in slices:
+        for page in tqdm(range(1, page_count(hits, rows_per_page) + 1)):
+            access_page(driver, page, sink, search_url(piece))
         # driver.close()
         # driver = get_chrome()
         # driver.get(base_search_url)
         # driver.implicitly_wait(10)
         # login(driver)
 
-    save(papers, "ieee_papers.json")
-
-    # Combine keywords into a single regex pattern
-    pattern = "|".join([escape_keyword(keyword) for keyword in abs_keywords])
 
-    # Compile the regex pattern
-    regex = re.compile(pattern, re.IGNORECASE)
-
-    filtered_papers = []
-    for paper in tqdm(papers):
-        if compare(paper.title, regex):
-            filtered_papers.append(paper)
+def main():
+    parser = argparse.ArgumentParser(description="Crawl IEEE Xplore")
+    parser.add_argument("--mode", choices=["api", "browser"], default="api",
+                        help="api: search and metadata JSON requests, browser: render every page in Chrome")
+    parser.add_argument("--url", default=base_iee_url, help="base URL of the JSON endpoints, e.g. a local stub")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    set_source("ieee")
+    with NdjsonSink("ieee_papers.ndjson", filtered_path="ieee_filtered_papers.ndjson",
+                    predicate=lambda record: keywords.compare(record["title"])) as sink:
+        if args.mode == "api":
+            crawl_api(args.url, args.workers, sink=sink)
+        else:
+            crawl_browser(sink)
 
-    save(filtered_papers, "ieee_filtered_papers.json")
+    convert("ieee_papers.ndjson", "ieee_papers.ndjson.gz")
+    convert("ieee_filtered_papers.ndjson", "ieee_filtered_papers.ndjson.gz")
+    metrics.write("ieee_crawl_report.json")
 
 
 if __name__ == '__main__':
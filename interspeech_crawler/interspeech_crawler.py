@@ -1,72 +1,34 @@
+import argparse
 import os
-import random
 import re
-import time
+import sys
+import urllib.parse
 
-import dotenv
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-import selenium.webdriver.support.expected_conditions as EC
-from tqdm import tqdm
-from webdriver_manager.chrome import ChromeDriverManager
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import browser, http, keywords  # noqa: E402
+from common.browser import EC, By, WebDriver, WebDriverWait  # noqa: E402
+from common.extract import Extractor  # noqa: E402
+from common.lazy import LazyImport  # noqa: E402
+from common.record import Record  # noqa: E402
+from common.sink import NdjsonSink, convert  # noqa: E402
+from common.telemetry import metrics, set_source  # noqa: E402
+from common.source import RunContext, Source, Task  # noqa: E402
 
+dotenv = LazyImport("dotenv")
+tqdm = LazyImport("tqdm", "tqdm")
 
-class PaperInfo:
-    def __init__(self, title, abstract, doi, publication_date):
-        self.title = title
-        self.abstract = abstract
-        self.doi = doi
-        self.publication_date = publication_date
+archive_url = "https://www.isca-archive.org/"
 
+link_extractor = Extractor({"href": "@href", "text": "."}, rows="//a[@href]")
+# title, abstract and BibTeX block follow each other, nothing before the <h3> is parsed
+paper_extractor = Extractor({"title": "//h3", "abstract": "//p", "bibtex": "//pre"}, scope=("<h3", "</pre>"))
+# rows of the DataTables paper table, the header row has no <td>
+table_extractor = Extractor({"url": "td[1]//a/@href", "year": "td[3]"}, scope=('id="paper_table"', "</table>"),
+                            rows="//tr[td]")
 
-def get_chrome():
-    options = Options()
-    # options.add_argument("--headless=new")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--log-level=3")
-    options.add_experimental_option("excludeSwitches", ["enable-logging"])
-
-    service = Service(executable_path=ChromeDriverManager().install())
-    driver = webdriver.Chrome(
-        service=service,
-        options=options
-    )
-    return driver
-
-
-def filter_papers(papers: list[PaperInfo]) -> list[PaperInfo]:
-    abs_keywords = [
-        "Emotion", "Emotional", "Prosody", "prosodic", "Paralinguistic",
-        "Natural", "Naturalness", "Expressive", "Style",
-        "Human", "State-of-the-Art", "SOTA", "SOA", "State-of-Art",
-        "Voice", "Modulation", "Speech", "Pitch", "Rhythm", "Dynamic",
-        "Intonation", "Stress", "Affective", "Duration"
-    ]
-
-    def escape_keyword(keyword):
-        return re.escape(keyword).replace(r'\-', r'-')
-
-    def compare(text: str, regex: re.Pattern[str]) -> bool:
-        # check if one of the keywords is in the title
-        return bool(regex.search(text))
-
-    # Combine keywords into a single regex pattern
-    pattern = "|".join([escape_keyword(keyword) for keyword in abs_keywords])
-
-    # Compile the regex pattern
-    regex = re.compile(pattern, re.IGNORECASE)
 
-    filtered_papers = []
-    for paper in tqdm(papers):
-        if compare(paper.title, regex):
-            filtered_papers.append(paper)
-
-    return filtered_papers
+def get_chrome():
+    return browser.get_chrome(headless=False)
 
 
 def get_hits(driver: WebDriver) -> int:
@@ -78,7 +40,7 @@ def get_hits(driver: WebDriver) -> int:
     return int(hits)
 
 
-def extract_paper_info(driver: WebDriver, paper_url: str) -> PaperInfo:
+def extract_paper_info(driver: WebDriver, paper_url: str) -> Record:
     title = driver.find_element(By.TAG_NAME, "h3").text
 
     abstract = driver.find_element(By.TAG_NAME, "p").text
@@ -90,88 +52,177 @@ def extract_paper_info(driver: WebDriver, paper_url: str) -> PaperInfo:
 
     publication_date = re.search(r"year=(\d+)", citation).group(1)
 
-    return PaperInfo(title, abstract, doi, publication_date)
+    return Record(title, abstract, publication_date, doi=doi)
 
 
 
-def save(results: list[PaperInfo], filename="papers.json"):
-    # save the papers to a file for later use in json
-    # structure of the json file:
-    #
-    # {
-    #     "title": "Title of the paper",
-    #     "pdf": "URL to the pdf",
-    #     "doi": "DOI of the paper",
-    #     "summary": "Summary of the paper",
-    # }
-    #
-    # the file will be named papers.json
+def to_record(result: Record) -> dict:
+    return {
+        "title": result.title,
+        # "pdf": result.pdf_url,
+        "doi": result.doi,
+        "summary": result.abstract,
+        "submitted": str(result.submitted),
+    }
 
-    import json
-    with open(filename, "w") as f:
-        json.dump([{
-            "title": result.title,
-            # "pdf": result.pdf_url,
-            "doi": result.doi,
-            "summary": result.abstract,
-            "submitted": str(result.publication_date),
-        } for result in results], f, indent=4)
 
+def matches_query(text: str, query: str) -> bool:
+    # same semantics as the DataTables search box: every word has to occur somewhere in the row
+    text = text.lower()
+    return all(word in text for word in query.lower().split())
 
 
-def main():
+def get_conference_indexes(html: str, base_url: str, min_year: int) -> list[str]:
+    # conference links look like "interspeech_2023/index.html"
+    indexes = []
+    for link in link_extractor.extract(html):
+        match = re.search(r"([a-z0-9_]+?)_(\d{4})/index\.html$", link["href"])
+        if match and int(match.group(2)) >= min_year:
+            url = urllib.parse.urljoin(base_url, link["href"])
+            if url not in indexes:
+                indexes.append(url)
+    return indexes
+
+
+def get_conference_papers(html: str, index_url: str, queries: list[str]) -> list[str]:
+    # paper links of a conference index, e.g. "kim23_interspeech.html"
+    conference = index_url.rstrip("/").split("/")[-2]
+
+    paper_urls = []
+    for link in link_extractor.extract(html):
+        href = link["href"]
+        if not re.fullmatch(r"(\./)?[a-z0-9_]+\.html", href) or href.endswith("index.html"):
+            continue
+
+        row = f"{link['text']} {conference}"
+        if any(matches_query(row, query) for query in queries):
+            paper_urls.append(urllib.parse.urljoin(index_url, href))
+    return paper_urls
+
+
+def parse_paper_page(html: str, paper_url: str) -> Record:
+    fields = paper_extractor.extract(html)
+
+    doi = paper_url.split("/")[-1].replace(".html", "")
+    publication_date = re.search(r"year=\{?(\d+)", fields["bibtex"]).group(1)
+
+    return Record(fields["title"], fields["abstract"], publication_date, doi=doi)
+
+
+def crawl_static(queries: list[str], base_url: str = archive_url, min_year: int = 2016,
+                 max_workers: int = 16, sink: NdjsonSink = None) -> dict[str, Record]:
+    # enumerate papers from the static per-conference index pages and fetch them over plain HTTP.
+    # with a sink every paper is written as soon as it is extracted instead of being returned
+    indexes = get_conference_indexes(http.get(base_url).text, base_url, min_year)
+    print("Found", len(indexes), "conferences since", min_year)
+
+    paper_urls = []
+    for index_url, response, error in tqdm(http.fetch_all(indexes, http.get, max_workers), total=len(indexes),
+                                           desc="Conferences"):
+        if error is not None:
+            print("Error while loading conference index", index_url, error)
+            continue
+        paper_urls.extend(get_conference_papers(response.text, index_url, queries))
+
+    papers: dict[str, Record] = dict()
+    for paper_url, response, error in tqdm(http.fetch_all(paper_urls, http.get, max_workers), total=len(paper_urls),
+                                           desc="Papers"):
+        try:
+            if error is not None:
+                raise error
+            paper_info = parse_paper_page(response.text, paper_url)
+            if sink is not None:
+                sink.write(to_record(paper_info))
+            else:
+                papers[paper_info.doi] = paper_info
+        except Exception as e:
+            print(e)
+            print("Error while extracting paper info. Skipping paper:", paper_url)
+
+    return papers
+
+
+class InterspeechSource(Source):
+    name = "interspeech"
+    max_concurrency = 16
+    key_field = "doi"
+    output_file = "interspeech_crawler/interspeech_papers.ndjson.gz"
+    filtered_output_file = "interspeech_crawler/interspeech_filtered_papers.ndjson.gz"
+
+    def __init__(self, queries: list[str] = None, base_url: str = archive_url, min_year: int = 2016):
+        self.queries = queries or ["text to speech"]
+        self.base_url = base_url
+        self.min_year = min_year
+
+    def discover(self, context: RunContext):
+        html = context.http.get(self.base_url).text
+        for index_url in get_conference_indexes(html, self.base_url, self.min_year):
+            yield Task(self.name, "listing", index_url)
+
+    def fetch(self, context: RunContext, task: Task) -> str:
+        return context.http.get(task.url).text
+
+    def extract(self, task: Task, raw: str):
+        if task.kind == "listing":
+            for paper_url in get_conference_papers(raw, task.url, self.queries):
+                yield Task(self.name, "detail", paper_url)
+        else:
+            yield to_record(parse_paper_page(raw, task.url))
+
+
+def crawl_browser(queries: list[str], sink: NdjsonSink = None) -> dict[str, Record]:
     driver = get_chrome()
-    url = "https://www.isca-archive.org/"
+    url = archive_url
     # driver.get(url)
 
-    queries = ["text to speech"]
-
-    papers: dict[str, PaperInfo] = dict()
+    papers: dict[str, Record] = dict()
 
     for query in tqdm(queries, desc="search query"):
-        driver.get(url)
+        browser.navigate(driver, url)
         driver.find_element(By.XPATH, '/html/body/div[8]/div[5]/div/div/div[2]/div[2]/label/input').clear()
         driver.find_element(By.XPATH, '/html/body/div[8]/div[5]/div/div/div[2]/div[2]/label/input').send_keys(query)
         hits = get_hits(driver)
 
+        # the table is filtered as the query is typed, wait for its rows instead of a fixed time
         WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "paper_table"))
+            EC.presence_of_element_located((By.CSS_SELECTOR, "#paper_table tbody tr"))
         )
 
         print("")
         print(f"Query: {query}, Hits: {hits}")
 
-        time.sleep(5)
-
         paper_rows = get_rows(driver)
 
         has_next = True
         while has_next:
             paper_navigated = 0
             for paper_row in tqdm(paper_rows, desc="Papers"):
-                contents = paper_row.contents
-                year = int(contents[2].text)
+                year = int(paper_row["year"])
 
                 if year >= 2016:
-                    paper_url = contents[0].find("a")["href"]
-                    driver.get(f"{url}/{paper_url}")
+                    paper_url = paper_row["url"]
+                    browser.navigate(driver, f"{url}/{paper_url}")
 
                     # extract paper info
                     paper_info = extract_paper_info(driver, paper_url)
 
-                    papers[paper_info.doi] = paper_info
+                    if sink is not None:
+                        sink.write(to_record(paper_info))
+                    else:
+                        papers[paper_info.doi] = paper_info
 
                     paper_navigated += 1
 
             # for _ in range(paper_navigated + 1):
             #     driver.back()
             
-            driver.get(url)
+            browser.navigate(driver, url)
             driver.implicitly_wait(5)
-            time.sleep(5)
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            next_activated = soup.find("a", attrs={"id": "paper_table_next"})["class"]
-            has_next = "disabled" not in next_activated
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.ID, "paper_table_next"))
+            )
+            next_activated = driver.find_element(By.ID, "paper_table_next").get_attribute("class")
+            has_next = "disabled" not in next_activated.split()
 
             if has_next:
                 driver.find_element(By.ID, "paper_table_next").click()
@@ -180,25 +231,41 @@ def main():
                 )
                 paper_rows = get_rows(driver)
 
-    save(list(papers.values()), "interspeech_papers.json")
+    driver.quit()
+    return papers
 
-    filtered_papers = filter_papers(list(papers.values()))
-    save(filtered_papers, "interspeech_filtered_papers.json")
 
-    print("")
-    print("Found", len(papers), "papers")
-    print("Filtered", len(filtered_papers), "papers")
+def main():
+    parser = argparse.ArgumentParser(description="Crawl TTS papers from the ISCA archive")
+    parser.add_argument("--mode", choices=["static", "browser"], default="static",
+                        help="static fetches the archive's index and paper pages over plain HTTP, "
+                             "browser drives the DataTables UI with Selenium")
+    parser.add_argument("--url", default=archive_url, help="archive root, e.g. a local mirror")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    queries = ["text to speech"]
+    set_source("interspeech")
 
+    with NdjsonSink("interspeech_papers.ndjson", key="doi", filtered_path="interspeech_filtered_papers.ndjson",
+                    predicate=lambda record: keywords.compare(record["title"])) as sink:
+        if args.mode == "static":
+            crawl_static(queries, args.url, max_workers=args.workers, sink=sink)
+        else:
+            crawl_browser(queries, sink)
+
+    convert("interspeech_papers.ndjson", "interspeech_papers.ndjson.gz")
+    convert("interspeech_filtered_papers.ndjson", "interspeech_filtered_papers.ndjson.gz")
 
-def get_rows(driver):
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    paper_table = soup.find("table", attrs={"id": "paper_table"})
-    paper_table_src = BeautifulSoup(str(paper_table), "html.parser")
-    paper_rows = paper_table_src.find_all("tr")
-    # skip header row
-    paper_rows = paper_rows[1:]
     print("")
-    print("Found", len(paper_rows), "papers")
+    print("Found", sink.count, "papers")
+    print("Filtered", sink.filtered_count, "papers")
+    metrics.write("interspeech_crawl_report.json")
+
+
+def get_rows(driver) -> list[dict]:
+    # only the paper table is parsed, once
+    paper_rows = table_extractor.extract(driver.page_source)
     return paper_rows
 
 
@@ -1,10 +1,40 @@
+import asyncio
 import json
-from typing import List
-
-from fastapi import FastAPI
-from pydantic import BaseModel
-
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+
+from common import interchange
+from common.export import FORMATS, export, paper_id
+from common.profiling import ProfilingMiddleware, phase
+from common.progress import eta_seconds, read_progress
+from common.record import Record, invalid_fields
+from runner import SOURCES
+
+papers_file_path = "filter/filtered_papers.ndjson.gz"
 progress_file_path = "progress.json"
+# progress of named reviewers, one file per reviewer
+progress_dir = "progress"
+reviewer_regex = re.compile(r"^[\w.-]{1,64}$")
+# how often the papers file is checked for a new version
+corpus_poll_seconds = 5.0
+# keepalive interval of the /diff/stream connections
+stream_keepalive_seconds = 15.0
+# crawl and filter jobs of /jobs: progress and output files, and the number of jobs run at once
+jobs_dir = "jobs"
+max_concurrent_jobs = 2
+refresh_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "refresh.py")
 
 
 class PaperInfo(BaseModel):
@@ -13,100 +43,574 @@ class PaperInfo(BaseModel):
     submitted: str
     source: str
     id: str
+    # identifiers and all sources of papers merged by filter.py
+    doi: Optional[str] = None
+    arxiv_id: Optional[str] = None
+    pdf: Optional[str] = None
+    sources: List[str] = []
 
 
-class InternalPaperInfo(BaseModel):
-    title: str
-    abstract: str
-    submitted: str
-    source: str
+class Progress(BaseModel):
+    added_papers: List[str]
+    deleted_papers: List[str]
 
 
-class Progress(BaseModel):
+class Consensus(BaseModel):
+    reviewers: List[str]
+    # papers every reviewer who decided on them added / deleted
     added_papers: List[str]
     deleted_papers: List[str]
+    # papers reviewers disagree on, with the decision of each reviewer
+    disputed_papers: Dict[str, Dict[str, str]]
 
 
-def load_papers(path: str) -> list[PaperInfo]:
-    # Load papers from JSON file
-    with open(path, "r") as f:
-        papers = json.load(f)
+class JobRequest(BaseModel):
+    # crawl: crawl the sources, then rebuild the corpus; filter: only rebuild it from the
+    # outputs of all sources. Either way a new corpus is validated and swapped in by refresh.py.
+    kind: Literal["crawl", "filter"]
+    sources: List[str] = []
 
-    # Convert to PaperInfo objects
-    internal = []
 
-    for paper in papers:
-        try:
-            internal.append(InternalPaperInfo(**paper))
-        except Exception as e:
-            print(f"Error loading paper: {e} {paper['title']}")
+class Job(BaseModel):
+    id: str
+    kind: str
+    sources: List[str]
+    # cancelling: terminated, but its processes have not exited yet
+    state: Literal["queued", "running", "succeeded", "failed", "cancelling", "cancelled"]
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    # progress of the running stage (crawl, write, build, validate, publish), done/total are
+    # its units of work: tasks of a crawl, papers of a validation
+    stage: Optional[str] = None
+    records: int = 0
+    done: int = 0
+    total: int = 0
+    eta_seconds: Optional[float] = None
+    returncode: Optional[int] = None
+    # last line of the output of a failed job
+    error: Optional[str] = None
+
+
+def load_papers(path: str) -> dict[str, Record]:
+    # Papers are streamed from the compressed NDJSON (or legacy JSON) file and converted to
+    # compact records as they are read, PaperInfo models are only built for requests and responses
+    result = []
+
+    with phase("load"):
+        for paper in interchange.read(path):
+            invalid = invalid_fields(paper)
+            if invalid:
+                print(f"Error loading paper: invalid {', '.join(invalid)} {paper.get('title')}")
+                continue
+            result.append((paper_id(paper), Record.from_dict(paper)))
 
     # sort by date and source
-    internal.sort(key=lambda x: (x.submitted, x.source))
+    with phase("sort"):
+        result.sort(key=lambda x: (x[1].submitted, x[1].source))
 
-    result = []
+    # by id, in the order of the diff
+    return dict(result)
+
+
+def to_api(paper_id: str, paper: Record) -> dict:
+    # the fields of PaperInfo
+    return {"id": paper_id, **paper.to_dict()}
 
-    # Add an ID to each paper
-    for i, paper in enumerate(internal):
-        year = paper.submitted.split("-")[0]
-        # hash the title to get a unique ID
-        paper_id = f"{year}-{paper.title}"
 
-        result.append(PaperInfo(id=paper_id, title=paper.title, abstract=paper.abstract, submitted=paper.submitted,
-                                source=paper.source))
+paper_adapter = TypeAdapter(Dict[str, Any])
 
-    return result
 
+def encode_papers(papers: dict[str, Record]) -> dict[str, bytes]:
+    # the JSON of every paper as /diff/ returns it, encoded once per corpus load instead of per request
+    with phase("encode"):
+        return {paper_id: paper_adapter.dump_json(to_api(paper_id, paper)) for paper_id, paper in papers.items()}
 
-def save_progress(progress: Progress):
-    with open(progress_file_path, "w", encoding="utf8") as f:
+
+def save_progress(progress: Progress, path: str = progress_file_path):
+    # written to a temporary file first, so a crash never leaves a truncated progress file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as f:
         json.dump({"added_papers": [paper_id for paper_id in progress.added_papers],
                    "deleted_papers": [paper_id for paper_id in progress.deleted_papers]}, f, indent=4)
+    os.replace(tmp_path, path)
 
 
-def load_progress() -> Progress:
+def load_progress(path: str = progress_file_path) -> Progress:
     try:
-        with open(progress_file_path, "r", encoding="utf8") as f:
+        with open(path, "r", encoding="utf8") as f:
             data = json.load(f)
             return Progress(added_papers=data["added_papers"], deleted_papers=data["deleted_papers"])
     except Exception:
         return Progress(added_papers=[], deleted_papers=[])
 
 
-app = FastAPI()
+class ProgressShard:
+    """
+    The decisions of one reviewer, kept in memory and persisted to the reviewer's own file.
+    Writes of a shard are serialized by its lock and run in the thread pool, so they
+    neither wait for other reviewers nor block the event loop.
+    """
+
+    def __init__(self, reviewer: str, path: str):
+        self.reviewer = reviewer
+        self.path = path
+        self.lock = asyncio.Lock()
+        progress = load_progress(path)
+        # dicts as insertion-ordered sets
+        self.added = dict.fromkeys(progress.added_papers)
+        self.deleted = dict.fromkeys(progress.deleted_papers)
+
+    def seen(self, paper_id: str) -> bool:
+        return paper_id in self.added or paper_id in self.deleted
+
+    def to_progress(self) -> Progress:
+        return Progress(added_papers=list(self.added), deleted_papers=list(self.deleted))
+
+    async def decide(self, paper_id: str, added: bool):
+        async with self.lock:
+            (self.added if added else self.deleted)[paper_id] = None
+            await run_in_threadpool(save_progress, self.to_progress(), self.path)
+        # the paper is gone from the diff of this reviewer's other sessions
+        await feed.publish("removed", {"id": paper_id}, self.reviewer)
+
+
+class ChangeFeed:
+    """
+    Numbered log of the changes to the diff: papers added by a corpus reload and papers
+    removed by a decision or a reload. The number of the last event a client has seen,
+    prefixed with the epoch of the server process, is its resume token. Only the last
+    `size` events are kept; a client with an older token, or one from before a restart,
+    is told to reset, i.e. to load /diff/ again.
+    """
+
+    def __init__(self, size: int = 10000):
+        self.size = size
+        # events[i] has the number base + i + 1
+        self.events: list[tuple[int, str, str or None, dict]] = []
+        self.base = 0
+        # the numbers start at 0 again after a restart, the epoch keeps old tokens from matching
+        self.epoch = uuid.uuid4().hex[:8]
+        self.condition = asyncio.Condition()
+
+    @property
+    def seq(self) -> int:
+        return self.base + len(self.events)
+
+    async def publish(self, kind: str, data: dict, reviewer: str = None):
+        # reviewer None: the change concerns every reviewer
+        async with self.condition:
+            self.events.append((self.seq + 1, kind, reviewer, data))
+            if len(self.events) > 2 * self.size:
+                dropped = len(self.events) - self.size
+                del self.events[:dropped]
+                self.base += dropped
+            self.condition.notify_all()
+
+    def token(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def parse(self, token: str) -> int or None:
+        # the event number of a resume token, None for a token of another server process.
+        # ValueError if it is no token at all.
+        epoch, _, seq = token.rpartition("-")
+        seq = int(seq)
+        return seq if epoch == self.epoch else None
+
+    def since(self, seq: int or None) -> list[tuple] or None:
+        # the events after seq, None if the client has to reset
+        if seq is None or seq < self.base or seq > self.seq:
+            return None
+        return self.events[seq - self.base:]
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        async with self.condition:
+            try:
+                await asyncio.wait_for(self.condition.wait_for(lambda: self.seq > seq), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+
+class Corpus:
+    # the papers file, loaded once and again only when its modification time changes
+
+    def __init__(self, path: str):
+        self.path = path
+        # papers by id, sorted by date and source
+        self.papers: dict[str, Record] = dict()
+        # their JSON, in the same order
+        self.encoded: dict[str, bytes] = dict()
+        self.mtime = None
+        self.lock = asyncio.Lock()
+
+    async def refresh(self):
+        # a legacy .json file is used while there is no compressed one
+        path = interchange.resolve(self.path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.mtime:
+            return
+
+        async with self.lock:
+            if mtime == self.mtime:
+                return
+            papers = await run_in_threadpool(load_papers, path)
+            encoded = await run_in_threadpool(encode_papers, papers)
+            first_load = self.mtime is None
+            added = [(paper_id, paper) for paper_id, paper in papers.items() if paper_id not in self.papers]
+            removed = [paper_id for paper_id in self.papers if paper_id not in papers]
+            self.papers, self.encoded, self.mtime = papers, encoded, mtime
+
+        if first_load:
+            return
+        for paper_id, paper in added:
+            await feed.publish("added", to_api(paper_id, paper))
+        for paper_id in removed:
+            await feed.publish("removed", {"id": paper_id})
+
+
+feed = ChangeFeed()
+corpus = Corpus(papers_file_path)
+
+
+class JobRun:
+    # one run of refresh.py, its output and progress files are kept in jobs_dir
+
+    def __init__(self, job_id: str, kind: str, sources: list[str], directory: str):
+        self.id = job_id
+        self.kind = kind
+        self.sources = sources
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.process: asyncio.subprocess.Process or None = None
+        self.returncode = None
+        self.progress_path = os.path.join(directory, f"{job_id}.progress.json")
+        self.output_path = os.path.join(directory, f"{job_id}.log")
+        # read once when the process has exited
+        self.progress: dict or None = None
+        self.error: str or None = None
+
+    def command(self) -> list[str]:
+        return [sys.executable, refresh_script, "once", "--sources", *self.sources, "--progress", self.progress_path]
+
+    def last_line(self, size: int = 8192) -> str or None:
+        # of the output, only its end is read: a crawl log with progress bars can be large
+        try:
+            with open(self.output_path, "rb") as f:
+                f.seek(max(0, os.path.getsize(self.output_path) - size))
+                tail = f.read().decode("utf8", errors="replace")
+        except FileNotFoundError:
+            return None
+        # progress bars end their lines with carriage returns
+        lines = [line.strip() for line in tail.replace("\r", "\n").splitlines() if line.strip()]
+        return lines[-1] if lines else None
+
+    def read_results(self):
+        self.progress = read_progress(self.progress_path)
+        if self.returncode != 0:
+            self.error = self.last_line()
+
+    async def to_api(self) -> dict:
+        # the progress file of a running job is read in the thread pool, the event loop keeps serving
+        progress = self.progress
+        if progress is None and self.state == "running":
+            progress = await run_in_threadpool(read_progress, self.progress_path)
+        progress = progress or {}
+        running = self.state == "running"
+        return {
+            "id": self.id, "kind": self.kind, "sources": self.sources, "state": self.state,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "stage": progress.get("stage"), "records": progress.get("records", 0),
+            "done": progress.get("done", 0), "total": progress.get("total", 0),
+            "eta_seconds": eta_seconds(progress) if running else None,
+            "returncode": self.returncode, "error": self.error if self.state == "failed" else None,
+        }
+
+
+class JobPool:
+    """
+    Crawl and filter jobs as refresh.py child processes, at most `size` at a time, later jobs
+    wait in the queue. The event loop only waits for the processes, so requests are served as
+    usual while a job runs. A job gets its own process group, cancelling it terminates the
+    crawler and worker processes it started as well.
+    """
+
+    def __init__(self, size: int, directory: str):
+        self.directory = directory
+        self.semaphore = asyncio.Semaphore(size)
+        self.jobs: dict[str, JobRun] = dict()
+        self.tasks: set[asyncio.Task] = set()
+
+    def busy_sources(self) -> set[str]:
+        # a cancelled crawl keeps its sources until its processes have exited, they may still write the outputs
+        return {source for job in self.jobs.values() if job.state in ("queued", "running", "cancelling")
+                for source in job.sources}
+
+    def submit(self, kind: str, sources: list[str]) -> JobRun:
+        os.makedirs(self.directory, exist_ok=True)
+        job = JobRun(uuid.uuid4().hex[:12], kind, sources, self.directory)
+        self.jobs[job.id] = job
+        task = asyncio.create_task(self.run(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    async def run(self, job: JobRun):
+        async with self.semaphore:
+            if job.state == "cancelled":
+                return
+            job.state, job.started = "running", time.time()
+            with open(job.output_path, "wb") as output:
+                job.process = await asyncio.create_subprocess_exec(*job.command(), stdout=output,
+                                                                   stderr=asyncio.subprocess.STDOUT,
+                                                                   start_new_session=True)
+                # cancelled while the process was starting
+                if job.state == "cancelling":
+                    self.terminate(job)
+                job.returncode = await job.process.wait()
+            await run_in_threadpool(job.read_results)
+            job.finished = time.time()
+            if job.state == "cancelling":
+                job.state = "cancelled"
+            else:
+                job.state = "succeeded" if job.returncode == 0 else "failed"
+
+    def terminate(self, job: JobRun):
+        try:
+            os.killpg(job.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def cancel(self, job: JobRun):
+        if job.state == "queued":
+            job.state, job.finished = "cancelled", time.time()
+        elif job.state == "running":
+            # cancelled once run() has seen the process exit
+            job.state = "cancelling"
+            if job.process is not None:
+                self.terminate(job)
+
+    def close(self):
+        for job in self.jobs.values():
+            self.cancel(job)
 
 
-@app.get("/diff/", response_model=List[PaperInfo], name="get_diff_papers")
-async def get_diff_papers():
-    papers = load_papers("filter/filtered_papers.json")
-    progress = load_progress()
+jobs = JobPool(max_concurrent_jobs, jobs_dir)
 
-    # Get the papers that have not been seen yet
-    added_seen_ids = {paper for paper in progress.added_papers}
-    deleted_seen_ids = {paper for paper in progress.deleted_papers}
 
-    # Filter out the papers that have been seen
-    result = [paper for paper in papers if paper.id not in added_seen_ids and paper.id not in deleted_seen_ids]
+def sse(token: str, kind: str, data: dict) -> str:
+    return f"id: {token}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
 
-    return result
 
+async def poll_corpus():
+    while True:
+        try:
+            await corpus.refresh()
+        except Exception as e:
+            print(f"Error reloading papers: {e}")
+        await asyncio.sleep(corpus_poll_seconds)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one poller for all clients, a stream only reads the events it has not seen yet
+    poller = asyncio.create_task(poll_corpus())
+    yield
+    poller.cancel()
+    jobs.close()
+
+
+shards: dict[str, ProgressShard] = dict()
+shards_lock = threading.Lock()
+
+
+def get_shard(reviewer: str or None) -> ProgressShard:
+    # requests without a reviewer use the shared progress.json, as before
+    key = reviewer or ""
+    with shards_lock:
+        if key not in shards:
+            path = os.path.join(progress_dir, f"{reviewer}.json") if reviewer else progress_file_path
+            if reviewer:
+                os.makedirs(progress_dir, exist_ok=True)
+            shards[key] = ProgressShard(key, path)
+        return shards[key]
+
+
+def all_shards() -> dict[str, ProgressShard]:
+    # every named reviewer with a progress file, also those without a request since the start
+    if os.path.isdir(progress_dir):
+        for file in os.listdir(progress_dir):
+            name, ext = os.path.splitext(file)
+            if ext == ".json" and reviewer_regex.match(name):
+                get_shard(name)
+    with shards_lock:
+        return {reviewer: shard for reviewer, shard in shards.items() if reviewer}
+
+
+def current_shard(request: Request, x_reviewer: Optional[str] = Header(None)) -> ProgressShard:
+    # the reviewer is taken from the /reviewers/{reviewer}/ prefix or the X-Reviewer header
+    reviewer = request.path_params.get("reviewer") or x_reviewer
+    if reviewer is not None and not reviewer_regex.match(reviewer):
+        raise HTTPException(status_code=400, detail="Invalid reviewer name")
+    return get_shard(reviewer)
+
+
+def consensus(reviewer_shards: dict[str, ProgressShard]) -> Consensus:
+    decisions: dict[str, dict[str, str]] = dict()
+    for reviewer, shard in reviewer_shards.items():
+        for paper_id in shard.added:
+            decisions.setdefault(paper_id, {})[reviewer] = "added"
+        for paper_id in shard.deleted:
+            decisions.setdefault(paper_id, {})[reviewer] = "deleted"
+
+    added, deleted, disputed = [], [], dict()
+    for paper_id, votes in decisions.items():
+        values = set(votes.values())
+        if values == {"added"}:
+            added.append(paper_id)
+        elif values == {"deleted"}:
+            deleted.append(paper_id)
+        else:
+            disputed[paper_id] = votes
+
+    return Consensus(reviewers=sorted(reviewer_shards), added_papers=added, deleted_papers=deleted,
+                     disputed_papers=disputed)
+
+
+app = FastAPI(lifespan=lifespan)
+# opt-in instrumentation: Server-Timing headers, and profiles of a share of the requests
+# (LITERATURE_HELPER_PROFILE_RATE) or of requests sending X-Profile
+if os.getenv("LITERATURE_HELPER_TIMING"):
+    app.add_middleware(ProfilingMiddleware, sample_rate=float(os.getenv("LITERATURE_HELPER_PROFILE_RATE", "0")),
+                       profile_dir=os.getenv("LITERATURE_HELPER_PROFILE_DIR", "profiles"))
+router = APIRouter()
+
+
+@router.get("/diff/", response_model=List[PaperInfo], name="get_diff_papers")
+async def get_diff_papers(shard: ProgressShard = Depends(current_shard)):
+    await corpus.refresh()
+    # resume token for /diff/stream: changes after this response
+    token = feed.seq
+
+    # Filter out the papers this reviewer has already seen. The papers are validated and
+    # encoded when the corpus is loaded, the response joins their JSON instead of using the response_model.
+    with phase("diff"):
+        parts = [encoded for paper_id, encoded in corpus.encoded.items() if not shard.seen(paper_id)]
+    with phase("encode"):
+        content = b"[" + b",".join(parts) + b"]"
+    return Response(content, media_type="application/json", headers={"X-Resume-Token": feed.token(token)})
+
+
+@router.get("/diff/stream")
+async def stream_diff(request: Request, since: Optional[str] = None, last_event_id: Optional[str] = Header(None),
+                      shard: ProgressShard = Depends(current_shard)):
+    # server-sent events with the changes to the diff of this reviewer. Reconnects resume
+    # after the Last-Event-ID header or the `since` token, new clients get the changes from now on.
+    resume = since if since is not None else last_event_id
+    if resume is None:
+        token = feed.seq
+    else:
+        try:
+            token = feed.parse(resume)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid resume token")
+
+    async def events():
+        nonlocal token
+        while not await request.is_disconnected():
+            changes = feed.since(token)
+            if changes is None:
+                token = feed.seq
+                yield sse(feed.token(token), "reset", {})
+                continue
+
+            for seq, kind, reviewer, data in changes:
+                token = seq
+                if reviewer not in (None, shard.reviewer) or (kind == "added" and shard.seen(data["id"])):
+                    continue
+                yield sse(feed.token(seq), kind, data)
+
+            if not await feed.wait(token, stream_keepalive_seconds):
+                yield ": keepalive\n\n"
 
-@app.get("/progress/", response_model=Progress)
-async def get_progress():
-    return load_progress()
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
-@app.post("/papers")
-async def add_paper(paper: PaperInfo):
-    progress = load_progress()
-    progress.added_papers.append(paper.id)
-    save_progress(progress)
+@router.get("/progress/", response_model=Progress)
+async def get_progress(shard: ProgressShard = Depends(current_shard)):
+    return shard.to_progress()
+
+
+@router.post("/papers")
+async def add_paper(paper: PaperInfo, shard: ProgressShard = Depends(current_shard)):
+    await shard.decide(paper.id, added=True)
     return {"status": "success"}
 
 
-@app.delete("/papers")
-async def delete_paper(paper: PaperInfo):
-    progress = load_progress()
-    progress.deleted_papers.append(paper.id)
-    save_progress(progress)
+@router.delete("/papers")
+async def delete_paper(paper: PaperInfo, shard: ProgressShard = Depends(current_shard)):
+    await shard.decide(paper.id, added=False)
     return {"status": "success"}
+
+
+@router.get("/export")
+async def export_papers(format: Literal["bibtex", "csv", "ndjson"] = "bibtex",
+                        status: Literal["accepted", "rejected"] = "accepted", gzip: bool = False,
+                        shard: ProgressShard = Depends(current_shard)):
+    # streamed from the papers file while it is read, memory does not grow with the corpus
+    ids = set(shard.added if status == "accepted" else shard.deleted)
+    _, media_type, extension = FORMATS[format]
+    filename = f"papers_{status}.{extension}" + (".gz" if gzip else "")
+    return StreamingResponse(export(corpus.path, ids, format, gzip),
+                             media_type="application/gzip" if gzip else media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.get("/consensus/", response_model=Consensus)
+async def get_consensus():
+    return consensus(all_shards())
+
+
+def get_job(job_id: str) -> JobRun:
+    if job_id not in jobs.jobs:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return jobs.jobs[job_id]
+
+
+@app.post("/jobs", response_model=Job, status_code=202)
+async def submit_job(request: JobRequest):
+    if request.kind == "crawl" and not request.sources:
+        raise HTTPException(status_code=400, detail="A crawl job needs sources")
+    unknown = set(request.sources) - set(SOURCES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sources: {', '.join(sorted(unknown))}")
+    # two crawls of a source at once would write the same output files
+    busy = jobs.busy_sources() & set(request.sources)
+    if busy:
+        raise HTTPException(status_code=409, detail=f"Already crawling {', '.join(sorted(busy))}")
+    return await jobs.submit(request.kind, request.sources if request.kind == "crawl" else []).to_api()
+
+
+@app.get("/jobs", response_model=List[Job])
+async def list_jobs():
+    return [await job.to_api() for job in list(jobs.jobs.values())]
+
+
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job_status(job: JobRun = Depends(get_job)):
+    return await job.to_api()
+
+
+@app.post("/jobs/{job_id}/cancel", response_model=Job)
+async def cancel_job(job: JobRun = Depends(get_job)):
+    jobs.cancel(job)
+    return await job.to_api()
+
+
+app.include_router(router)
+app.include_router(router, prefix="/reviewers/{reviewer}")
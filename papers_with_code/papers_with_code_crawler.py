@@ -1,97 +1,96 @@
-import time
+import os
+import sys
 from paperswithcode import PapersWithCodeClient
 from paperswithcode.models import Paper
-import re
-
-def save(results: list[Paper], filename="papers.json"):
-    # save the papers to a file for later use in json
-    # structure of the json file:
-    # 
-    # {
-    #     "title": "Title of the paper",
-    #     "pdf": "URL to the pdf",
-    #     "doi": "DOI of the paper",
-    #     "summary": "Summary of the paper",
-    # }
-    #
-    # the file will be named papers.json
-
-    import json
-    with open(filename, "w") as f:
-        json.dump([{
-            "title": result.title,
-            "arxiv_id": result.arxiv_id if result.arxiv_id is not None else "",
-            "pdf": result.url_pdf,
-            "summary": result.abstract,
-            "submitted": str(result.published),
-        } for result in results], f, indent=4)
-
-client = PapersWithCodeClient()
-
-abs_keywords = [
-    "Emotion", "Emotional", "Prosody", "prosodic", "Paralinguistic",
-    "Natural", "Naturalness", "Expressive", "Style", 
-    "Human", "State-of-the-Art", "SOTA", "SOA", "State-of-Art", 
-    "Voice", "Modulation", "Speech", "Pitch", "Rhythm", "Dynamic", 
-    "Intonation", "Stress", "Affective", "Duration"
-]
-
-def escape_keyword(keyword):
-    return re.escape(keyword).replace(r'\-', r'-')
 
-# Combine keywords into a single regex pattern
-pattern = "|".join([escape_keyword(keyword) for keyword in abs_keywords])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import query_plan  # noqa: E402
+from common.keywords import compare  # noqa: E402
+from common.sink import NdjsonSink, convert  # noqa: E402
+from common.source import RunContext, Source, Task  # noqa: E402
+from common.telemetry import metrics  # noqa: E402
 
-# Compile the regex pattern
-regex = re.compile(pattern, re.IGNORECASE)
 
-def compare(text: str):
-    # check if one of the keywords is in the title
-    return bool(regex.search(text))
+def to_record(result: Paper) -> dict:
+    return {
+        "title": result.title,
+        "arxiv_id": result.arxiv_id if result.arxiv_id is not None else "",
+        "pdf": result.url_pdf,
+        "summary": result.abstract,
+        "submitted": str(result.published),
+    }
 
 
+client = PapersWithCodeClient()
 
-tasks = ["emotional-speech-synthesis", "expressive-speech-synthesis", "speech-synthesis", "text-to-speech-synthesis"]
-
-original_results = {}
 
-def get_count(task):
-    search = client.task_paper_list(task, items_per_page=1)
-    return search.count
+tasks = query_plan.topic_values(query_plan.load_topics(), "paperswithcode_tasks")
+# papers per request, the default page size of the API
+page_size = 50
 
-def get_results(task, count):
+def get_results(task, sink: NdjsonSink = None):
+    # with a sink every page is written as soon as it is loaded instead of being returned
     from tqdm import tqdm
     results = []
 
-    for p in tqdm(range(0, count)):
-        try:
-            search = client.task_paper_list(task, page=p+1, items_per_page=1)
+    def add(search):
+        if sink is not None:
+            for result in search.results:
+                sink.write(to_record(result))
+        else:
             results.extend(search.results)
+
+    # the first page has the count, there is no separate count request
+    first = client.task_paper_list(task, page=1, items_per_page=page_size)
+    add(first)
+    pages = query_plan.page_count(first.count, page_size)
+    # one request per paper and one for the count before
+    metrics.inc("crawler_requests_saved_total", first.count + 1 - max(pages, 1), reason="page_size")
+
+    for p in tqdm(range(1, pages)):
+        try:
+            add(client.task_paper_list(task, page=p+1, items_per_page=page_size))
         except Exception as e:
             print(e)
     return results
-    
 
-            
-results = []
-for task in tasks:
-    count = get_count(task)
-    results = get_results(task, count)
 
-    original_results.update({result.id: result for result in results})
+class PapersWithCodeSource(Source):
+    name = "paperswithcode"
+    relevance_field = "summary"
+    output_file = "papers_with_code/paperswithcode_results.ndjson.gz"
+    filtered_output_file = "papers_with_code/paperswithcode_filtered_results.ndjson.gz"
+
+    def discover(self, context: RunContext):
+        for task in tasks:
+            yield Task(self.name, "task", payload={"task": task})
+
+    def fetch(self, context: RunContext, task: Task) -> list[Paper]:
+        return get_results(task.payload["task"])
 
-# for task in tasks:
-#     # time.sleep(3)
-#     results = get_results(task, 1)
-#
-#     # add the results to the dictionary
-#     original_results.update({result.id: result for result in results})
-    
+    def extract(self, task: Task, raw: list[Paper]):
+        for result in raw:
+            yield to_record(result)
+
+
+def main():
+    with NdjsonSink("paperswithcode_results.ndjson", filtered_path="paperswithcode_filtered_results.ndjson",
+                    predicate=lambda record: compare(record["summary"])) as sink:
+        for task in tasks:
+            get_results(task, sink)
+
+    # for task in tasks:
+    #     # time.sleep(3)
+    #     results = get_results(task, 1)
+    #
+    #     # add the results to the dictionary
+    #     original_results.update({result.id: result for result in results})
 
+    convert("paperswithcode_results.ndjson", "paperswithcode_results.ndjson.gz")
+    print(sink.count)
+    convert("paperswithcode_filtered_results.ndjson", "paperswithcode_filtered_results.ndjson.gz")
+    print(sink.filtered_count)
 
-filtered_results = [paper for paper in original_results.values() if compare(paper.abstract)]
 
-save(original_results.values(), "paperswithcode_results.json")
-print(len(original_results))
-save(filtered_results, "paperswithcode_filtered_results.json")
-print(len(filtered_results))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
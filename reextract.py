@@ -0,0 +1,81 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from common.archive import PageArchive
+from common.source import Source, Task
+from common.telemetry import log
+from runner import SOURCES, STAGING_OUTPUT, FilterStage, load_source, load_sources
+
+# plugins loaded by a worker process, by source name
+_sources: dict[str, Source] = dict()
+
+
+def extract_chunk(directory: str, entries: list[dict]) -> tuple[list[tuple[str, dict]], int]:
+    # runs in a worker process: current extractors over archived pages, no network and no browser.
+    # returns the records and the number of pages that failed.
+    archive = PageArchive(directory)
+    records, failed = [], 0
+    for entry in entries:
+        name = entry["source"]
+        if name not in _sources:
+            _sources[name] = load_source(name)
+        try:
+            for item in _sources[name].extract(Task.from_dict(entry["task"]), archive.read(entry)):
+                # follow-up tasks were fetched in the crawl and are archived themselves
+                if not isinstance(item, Task):
+                    records.append((name, item))
+        except Exception as e:
+            failed += 1
+            log.warning("extraction failed", source=name, url=entry["url"], error=str(e))
+    return records, failed
+
+
+def chunks(entries: list[dict], size: int) -> list[list[dict]]:
+    return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the current extractors over an archive of fetched pages")
+    parser.add_argument("archive", help="archive directory written with --archive")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=None, help="default: all archived")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=200, help="pages per work unit")
+    parser.add_argument("--all-fetches", action="store_true",
+                        help="extract every archived fetch of a page instead of only the latest")
+    parser.add_argument("--output", default=STAGING_OUTPUT,
+                        help="merged output, the served corpus is only replaced by refresh.py")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    entries = PageArchive(args.archive).entries(args.sources, latest=not args.all_fetches)
+    names = sorted({entry["source"] for entry in entries})
+    print(f"{len(entries)} archived pages of {', '.join(names) or 'no source'}")
+
+    # records go through the same per-source outputs, keyword filter and merge as a crawl
+    stage = FilterStage(load_sources(names), args.output)
+    sources = {source.name: source for source in stage.sources}
+    # the pages of a source that failed to load are skipped
+    entries = [entry for entry in entries if entry["source"] in sources]
+    pages, failed = 0, 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(extract_chunk, args.archive, chunk): len(chunk)
+                       for chunk in chunks(entries, args.chunk)}
+            for future in as_completed(futures):
+                records, chunk_failed = future.result()
+                for name, record in records:
+                    stage.add(sources[name], record)
+                pages += futures[future]
+                failed += chunk_failed
+    finally:
+        stage.close()
+
+    seconds = time.perf_counter() - start
+    print(f"Re-extracted {pages} pages in {seconds:.1f}s ({pages / seconds if seconds else 0:.0f} pages/s), "
+          f"{failed} failed")
+
+
+if __name__ == "__main__":
+    main()
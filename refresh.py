@@ -0,0 +1,353 @@
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import yaml
+
+from common import interchange
+from common.progress import Progress, read_progress
+from common.record import invalid_fields
+from common.telemetry import log
+from filter import filter as paper_filter
+from runner import SOURCES
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+# settings missing from the refresh section of config.yaml
+DEFAULTS = {
+    "corpus": "filter/filtered_papers.ndjson.gz",
+    "state_dir": "refresh_state",
+    "keep_versions": 5,
+    "min_ratio": 0.9,
+    "poll_minutes": 5,
+    "timeout_hours": 12,
+    "retry_minutes": 60,
+    "browsers": 2,
+    "interval_hours": {},
+}
+
+
+def load_config(path: str) -> dict:
+    with open(path, encoding="utf8") as f:
+        section = (yaml.safe_load(f) or {}).get("refresh") or {}
+    config = {**DEFAULTS, **section}
+    unknown = set(config["interval_hours"]) - set(SOURCES)
+    if unknown:
+        raise ValueError(f"unknown sources in refresh.interval_hours: {', '.join(sorted(unknown))}")
+    return config
+
+
+def extension_of(path: str) -> str:
+    return path[len(interchange.stem(path)):]
+
+
+def build_corpus(corpus: str, state_dir: str, output: str) -> int:
+    # runs in a worker process: filter.py over the per-source outputs of all sources,
+    # those crawled in this refresh and the others
+    excluded = os.path.abspath(interchange.stem(corpus))
+    state_dir = os.path.abspath(state_dir) + os.sep
+    files = [file for file in paper_filter.get_files(root)
+             if os.path.abspath(interchange.stem(file)) != excluded and not os.path.abspath(file).startswith(state_dir)]
+    return interchange.write(output, paper_filter.filter_and_merge(paper_filter.load_sources(files)))
+
+
+def source_outputs(name: str) -> list[str]:
+    # the output files in the directory of a source, found without importing its plugin
+    directory = os.path.join(root, SOURCES[name][0].split(".")[0])
+    extensions = (*interchange.EXTENSIONS.values(), ".json")
+    return [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+            if filename.endswith(extensions)]
+
+
+def count_papers(path: str) -> int or None:
+    # of the served corpus, None if there is none yet
+    if not os.path.exists(path):
+        return None
+    header = interchange.read_header(path)
+    if header is not None:
+        return header["rows"]
+    return sum(1 for _ in interchange.read(path))
+
+
+def validate(path: str, served: int or None, min_ratio: float, progress: Progress = None) -> int:
+    # the number of papers of a new corpus, ValueError if it must not replace the served one
+    header = interchange.read_header(path)
+    if header is None:
+        raise ValueError("no interchange header")
+
+    progress = progress or Progress(None)
+    progress.stage("validate", total=header["rows"])
+    rows = 0
+    for paper in interchange.read(path):
+        invalid = invalid_fields(paper)
+        if invalid:
+            raise ValueError(f"invalid {', '.join(invalid)} in {paper.get('title')!r}")
+        rows += 1
+        progress.add(done=1)
+
+    if rows != header["rows"]:
+        raise ValueError(f"{rows} papers, the header says {header['rows']}")
+    if rows == 0:
+        raise ValueError("no papers")
+    if served and rows < min_ratio * served:
+        raise ValueError(f"{rows} papers, the served corpus has {served}")
+    return rows
+
+
+@contextmanager
+def publish_lock(state_dir: str):
+    # one build and publish at a time, the scheduler and the jobs of literature_helper share the state
+    with open(os.path.join(state_dir, "lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class Versions:
+    # earlier corpora as <directory>/corpus-<time>.ndjson.gz, oldest first
+
+    def __init__(self, corpus: str, directory: str, keep: int):
+        self.corpus = corpus
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def list(self) -> list[str]:
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.startswith("corpus-"))
+
+    def save_current(self) -> str or None:
+        path = interchange.resolve(self.corpus)
+        if not os.path.exists(path):
+            return None
+        version = os.path.join(self.directory, f"corpus-{datetime.now():%Y%m%d-%H%M%S-%f}{extension_of(path)}")
+        # a link is enough, the corpus path is replaced by a new file and never written in place
+        try:
+            os.link(path, version)
+        except OSError:
+            shutil.copy2(path, version)
+        return version
+
+    def prune(self):
+        for version in self.list()[:-self.keep]:
+            os.remove(version)
+
+    def publish(self, candidate: str) -> str or None:
+        # the candidate becomes the corpus in one rename, readers see the old or the new file.
+        # Returns the version the replaced corpus was saved as.
+        version = self.save_current()
+        os.replace(candidate, self.corpus)
+        self.prune()
+        return version
+
+    def rollback(self, version: str = None) -> str:
+        # serves an earlier corpus again. The replaced one is saved as a version as well,
+        # so a rollback can be undone the same way.
+        versions = self.list()
+        if version is None:
+            if not versions:
+                raise ValueError("no earlier version")
+            version = versions[-1]
+        elif os.path.dirname(version) == "":
+            version = os.path.join(self.directory, version)
+        if version not in versions:
+            raise ValueError(f"unknown version {version}")
+
+        self.save_current()
+        # written through interchange, so a legacy .json version is served in the format of the corpus path
+        interchange.write(self.corpus, interchange.read(version))
+        self.prune()
+        return version
+
+
+class Refresher:
+    """
+    Crawls the sources whose interval has passed, builds a new corpus from the per-source outputs
+    and swaps it in place of the served one. literature_helper reloads the corpus when its
+    modification time changes, so reviews continue without a restart.
+
+    Every source is crawled in its own runner.py child process and the merge runs in a worker
+    process, so a crashing or leaking crawler does not take the scheduler or the other sources
+    down. A failed source is tried again after retry_minutes. The new corpus only replaces the
+    served one after validate(); the replaced corpus is kept in <state_dir>/versions for a rollback.
+    """
+
+    def __init__(self, config: dict, progress: Progress = None):
+        self.config = config
+        self.progress = progress or Progress(None)
+        self.corpus = os.path.join(root, config["corpus"])
+        self.state_dir = os.path.join(root, config["state_dir"])
+        self.state_path = os.path.join(self.state_dir, "state.json")
+        self.versions = Versions(self.corpus, os.path.join(self.state_dir, "versions"), config["keep_versions"])
+        self.state = self.load_state()
+
+    def load_state(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = dict()
+        # times of the last finished crawl and of the last failure since then, by source
+        state.setdefault("last_crawl", {})
+        state.setdefault("last_failure", {})
+        return state
+
+    def save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def due(self, now: float) -> list[str]:
+        retry = self.config["retry_minutes"] * 60
+        return [name for name, hours in self.config["interval_hours"].items()
+                if now - self.state["last_crawl"].get(name, 0) >= hours * 3600
+                and now - self.state["last_failure"].get(name, 0) >= retry]
+
+    def save_outputs(self, name: str) -> dict[str, str]:
+        # links to the outputs of a source before its crawl, the runner replaces the files and
+        # the links keep their content. Returns the saved copy of every output.
+        directory = os.path.join(self.state_dir, "last_good", name)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        saved = dict()
+        for path in source_outputs(name):
+            saved[path] = os.path.join(directory, os.path.basename(path))
+            try:
+                os.link(path, saved[path])
+            except OSError:
+                shutil.copy2(path, saved[path])
+        return saved
+
+    def crawl_source(self, name: str) -> bool:
+        # a failed crawl leaves the outputs of the last complete one, the corpus is built from those
+        saved = self.save_outputs(name)
+        crawled = self.run_runner(name)
+        if not crawled:
+            for path, copy in saved.items():
+                os.replace(copy, path)
+            log.info("previous outputs kept", source=name, files=len(saved))
+        shutil.rmtree(os.path.join(self.state_dir, "last_good", name))
+        return crawled
+
+    def run_runner(self, name: str) -> bool:
+        command = [sys.executable, os.path.join(root, "runner.py"), "--sources", name,
+                   "--browsers", str(self.config["browsers"]),
+                   # the filtered output of this source alone, the corpus is built by build_corpus
+                   "--output", os.path.join(self.state_dir, f"crawl-{name}.ndjson.gz"),
+                   "--report", os.path.join(self.state_dir, f"crawl_report-{name}.json")]
+        if self.progress.path is not None:
+            command += ["--progress", self.progress.path]
+        log.info("crawl started", source=name)
+        try:
+            result = subprocess.run(command, cwd=root, timeout=self.config["timeout_hours"] * 3600)
+        except subprocess.TimeoutExpired:
+            log.error("crawl timed out", source=name, hours=self.config["timeout_hours"])
+            return False
+        if result.returncode != 0:
+            log.error("crawl failed", source=name, returncode=result.returncode)
+            return False
+        return True
+
+    def crawl(self, names: list[str]) -> list[str]:
+        # one source after the other, so the Chrome pool of a runner is the only one; returns the
+        # sources whose crawl finished
+        finished = []
+        for name in names:
+            # the runner continues the records count of the file, the total of the runners so far
+            self.progress.flush()
+            if self.crawl_source(name):
+                finished.append(name)
+            if self.progress.path is not None:
+                records = (read_progress(self.progress.path) or {}).get("records", 0)
+                self.progress.add(records=max(0, records - self.progress.values["records"]))
+        return finished
+
+    def refresh(self, names: list[str]) -> bool:
+        # crawls the given sources (none: only rebuilds the corpus) and publishes the result,
+        # returns whether a new corpus is served
+        start = time.time()
+        if names:
+            finished = self.crawl(names)
+            with publish_lock(self.state_dir):
+                # another process may have crawled other sources meanwhile
+                self.state = self.load_state()
+                for name in names:
+                    if name in finished:
+                        self.state["last_crawl"][name] = start
+                        self.state["last_failure"].pop(name, None)
+                    else:
+                        # retried after retry_minutes, not at every poll
+                        self.state["last_failure"][name] = time.time()
+                self.save_state()
+            if not finished:
+                return False
+
+        with publish_lock(self.state_dir):
+            self.progress.stage("build")
+            candidate = os.path.join(self.state_dir, "next" + extension_of(self.corpus))
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                executor.submit(build_corpus, self.corpus, self.state_dir, candidate).result()
+
+            served = count_papers(interchange.resolve(self.corpus))
+            try:
+                rows = validate(candidate, served, self.config["min_ratio"], self.progress)
+            except ValueError as e:
+                # kept for inspection until the next rejected corpus
+                os.replace(candidate, os.path.join(self.state_dir, "rejected" + extension_of(self.corpus)))
+                log.error("corpus rejected", reason=str(e))
+                return False
+
+            self.progress.stage("publish")
+            version = self.versions.publish(candidate)
+        log.info("corpus published", papers=rows, previous=served, saved_as=version,
+                 seconds=round(time.time() - start, 1))
+        return True
+
+    def run(self):
+        while True:
+            names = self.due(time.time())
+            if names:
+                try:
+                    self.refresh(names)
+                except Exception as e:
+                    log.error("refresh failed", sources=names, error=str(e))
+            time.sleep(self.config["poll_minutes"] * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the sources on the schedule of config.yaml and swap the "
+                                                 "new corpus into the running literature_helper")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "once", "versions", "rollback"],
+                        help="run: scheduler, once: refresh now, versions: list earlier corpora, "
+                             "rollback: serve an earlier corpus again")
+    parser.add_argument("--config", default=os.path.join(root, "config.yaml"))
+    parser.add_argument("--sources", nargs="*", choices=list(SOURCES), default=None,
+                        help="once: crawl these instead of the due sources, none: only rebuild the corpus")
+    parser.add_argument("--version", default=None, help="rollback: version to serve, default: the latest")
+    parser.add_argument("--progress", default=None, help="once: keep the stage and counts of the refresh in this JSON file")
+    args = parser.parse_args()
+
+    refresher = Refresher(load_config(args.config), Progress(args.progress))
+    if args.command == "run":
+        refresher.run()
+    elif args.command == "once":
+        names = refresher.due(time.time()) if args.sources is None else args.sources
+        sys.exit(0 if refresher.refresh(names) else 1)
+    elif args.command == "versions":
+        for version in refresher.versions.list():
+            print(os.path.basename(version), count_papers(version))
+    else:
+        with publish_lock(refresher.state_dir):
+            print(f"Serving {os.path.basename(refresher.versions.rollback(args.version))}")
+
+
+if __name__ == "__main__":
+    main()
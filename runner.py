@@ -0,0 +1,245 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common import http, interchange
+from common.archive import PageArchive
+from common.browser import BrowserPool
+from common.progress import Progress, read_progress
+from common.rate_limit import limiters
+from common.sink import NdjsonSink, convert, ndjson_path, read_ndjson
+from common.source import RunContext, Source, Task
+from common.telemetry import log, metrics, set_source
+from filter import filter as paper_filter
+from semanticscholar_crawler import enrich
+
+# source name -> (module, plugin class). Modules are imported on demand so a run only
+# needs the dependencies of the selected sources.
+SOURCES = {
+    "acm": ("acm_crawler.acm_crawler", "AcmSource"),
+    "arxiv": ("arxiv_crawler.arxiv_crawler", "ArxivSource"),
+    "ieee": ("ieee_crawler.ieee_crawler", "IeeeSource"),
+    "interspeech": ("interspeech_crawler.interspeech_crawler", "InterspeechSource"),
+    "paperswithcode": ("papers_with_code.papers_with_code_crawler", "PapersWithCodeSource"),
+    "semanticscholar": ("semanticscholar_crawler.semanticscholar_crawler", "SemanticScholarSource"),
+}
+
+# merged output of a run. Not the served corpus (filter/filtered_papers.ndjson.gz): refresh.py
+# replaces that after validation and keeps the replaced one for a rollback.
+STAGING_OUTPUT = "filter/crawled_papers.ndjson.gz"
+
+
+def load_source(name: str) -> Source:
+    module, cls = SOURCES[name]
+    return getattr(importlib.import_module(module), cls)()
+
+
+def load_sources(names: list[str]) -> list[Source]:
+    # a source that cannot be loaded (e.g. a missing dependency) is left out, the others still run
+    sources = []
+    for name in names:
+        try:
+            sources.append(load_source(name))
+        except Exception as e:
+            log.error("source failed to load", source=name, error=f"{type(e).__name__}: {e}")
+    return sources
+
+
+class FilterStage:
+    # receives the records of all sources as they are extracted, streams them to the
+    # per-source outputs and applies the keyword filter of the crawlers and the
+    # date/abstract filter of filter.py in the same pass. With an enricher, relevant records
+    # without an abstract or date are completed at the end of the run before they are filtered.
+
+    def __init__(self, sources: list[Source], filtered_file: str, resume: bool = False,
+                 enricher: enrich.Enricher = None):
+        self.sources = sources
+        self.filtered_file = filtered_file
+        self.enricher = enricher
+        self.sinks = {
+            source.name: NdjsonSink(ndjson_path(source.output_file), key=source.key_field,
+                                    filtered_path=ndjson_path(source.filtered_output_file),
+                                    predicate=source.is_relevant, resume=resume)
+            for source in sources
+        }
+        self.filtered = NdjsonSink(ndjson_path(filtered_file), key=None, resume=resume)
+
+    def add(self, source: Source, record: dict):
+        # the sink applies the keyword filter for its filtered stream
+        if not self.sinks[source.name].write(record):
+            return
+        if self.enricher is not None and self.enricher.hold(source.name, record):
+            return
+        self.filter_record(source.name, record)
+
+    def filter_record(self, name: str, record: dict):
+        paper = paper_filter.from_record(record)
+        paper.add_source(name)
+        if paper_filter.filter_paper(paper) is not None:
+            self.filtered.write(paper.to_dict())
+
+    def close(self, finished: set[str] = None, failed: set[str] = frozenset()):
+        # write the output files read by filter.py and literature_helper. Only sources in
+        # `finished` (default: all) replace their outputs, the others keep those of their last
+        # complete crawl. The NDJSON streams of failed sources are discarded, those of sources
+        # that did not finish otherwise (an interrupted run) are kept for --resume.
+        finished = {source.name for source in self.sources} if finished is None else finished
+        # the enriched records also replace their incomplete versions in the per-source outputs
+        completed = {source.name: dict() for source in self.sources}
+        if self.enricher is not None:
+            for name, record in self.enricher.complete(finished):
+                self.filter_record(name, record)
+                completed[name][record.get(self.sinks[name].key)] = record
+
+        for source in self.sources:
+            sink = self.sinks[source.name]
+            sink.close()
+            if source.name not in finished:
+                print(f"{source.name}: not finished, keeping the previous outputs")
+                if source.name in failed:
+                    for path in (sink.path, sink.filtered_path):
+                        os.remove(path)
+                continue
+            print(f"{source.name}: {sink.count} papers, {sink.filtered_count} relevant")
+
+            convert(sink.path, source.output_file, completed[source.name], sink.key)
+            convert(sink.filtered_path, source.filtered_output_file, completed[source.name], sink.key)
+
+        self.filtered.close()
+        print(f"Filtered {self.filtered.count} papers")
+
+        # one canonical record per paper, as written by filter.py
+        merged = paper_filter.merge_papers([paper_filter.from_dict(data) for data in read_ndjson(self.filtered.path)
+                                            if data.get("source") in finished])
+        print(f"Merged into {len(merged)} papers")
+        interchange.write(self.filtered_file, merged)
+
+
+def run_source(source: Source, context: RunContext, stage: FilterStage, progress: Progress = None) -> int:
+    # runs up to source.max_concurrency tasks at once. Tasks produced by extract()
+    # (e.g. detail pages of a listing page) are scheduled as soon as they appear.
+    start = time.perf_counter()
+    num_records = 0
+    progress = progress or Progress(None)
+    set_source(source.name)
+
+    def process(task: Task) -> list:
+        set_source(source.name)
+        return list(source.extract(task, context.fetch(source, task)))
+
+    # pages already scheduled in this run: a detail page listed by several searches or
+    # listing pages is fetched once
+    scheduled = set()
+
+    def new(task: Task) -> bool:
+        if task.key() in scheduled:
+            metrics.inc("crawler_requests_saved_total", reason="duplicate_task")
+            return False
+        scheduled.add(task.key())
+        return True
+
+    with ThreadPoolExecutor(max_workers=source.max_concurrency) as executor:
+        pending = {executor.submit(process, task): task for task in source.discover(context) if new(task)}
+        progress.add(total=len(pending))
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                progress.add(done=1)
+                try:
+                    items = future.result()
+                except Exception as e:
+                    metrics.inc("crawler_task_errors_total", kind=task.kind)
+                    log.warning("task failed", source=source.name, kind=task.kind, url=task.url,
+                                payload=task.payload, error=str(e))
+                    continue
+
+                for item in items:
+                    if isinstance(item, Task):
+                        if new(item):
+                            pending[executor.submit(process, item)] = item
+                            progress.add(total=1)
+                    else:
+                        stage.add(source, item)
+                        num_records += 1
+                        metrics.inc("crawler_records_total")
+                        progress.add(records=1)
+
+    log.info("source finished", source=source.name, records=num_records, seconds=time.perf_counter() - start)
+    return num_records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run all crawlers concurrently and filter their results")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--browsers", type=int, default=4, help="size of the shared Chrome pool")
+    parser.add_argument("--output", default=STAGING_OUTPUT,
+                        help="merged output of the run, the served corpus is only replaced by refresh.py")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the NDJSON output of an interrupted run and skip records already written")
+    parser.add_argument("--report", default="crawl_report.json", help="JSON run report with per-source metrics")
+    parser.add_argument("--prometheus", default=None, help="also write the metrics in Prometheus text format")
+    parser.add_argument("--archive", default=None, help="store every fetched page in this directory, see reextract.py")
+    parser.add_argument("--no-enrich", action="store_true",
+                        help="drop papers without an abstract or date instead of looking them up on Semantic Scholar")
+    parser.add_argument("--progress", default=None,
+                        help="keep the stage and task counts of the run in this JSON file. The records count "
+                             "continues from the file, so consecutive runs of refresh.py add up")
+    args = parser.parse_args()
+
+    progress = Progress(args.progress, records=(read_progress(args.progress) or {}).get("records", 0)
+                        if args.progress else 0)
+    progress.stage("crawl")
+    sources = load_sources(args.sources)
+    if not sources:
+        sys.exit("No source could be loaded")
+    # sources that failed to load or crashed, the exit status tells refresh.py the run is incomplete
+    failed = set(args.sources) - {source.name for source in sources}
+    finished = set()
+    context = RunContext(BrowserPool(args.browsers), PageArchive(args.archive) if args.archive else None)
+    enricher = None
+    if not args.no_enrich:
+        enrich.dotenv.load_dotenv()
+        enricher = enrich.Enricher(enrich.PaperCache(), api_key=os.getenv("SEMANTIC_SCHOLAR_API_KEY"))
+    stage = FilterStage(sources, args.output, args.resume, enricher)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = {executor.submit(run_source, source, context, stage, progress): source for source in sources}
+            for future, source in futures.items():
+                try:
+                    future.result()
+                    finished.add(source.name)
+                except Exception as e:
+                    failed.add(source.name)
+                    log.error("crawl failed", source=source.name, error=str(e))
+    finally:
+        context.close()
+        progress.stage("write")
+        try:
+            stage.close(finished, failed)
+        finally:
+            if enricher is not None:
+                enricher.close()
+            http.close_client()
+        for source in sources:
+            if source.name in finished:
+                source.finish()
+
+    for host, rate in limiters.rates().items():
+        metrics.set("crawler_request_rate", rate, host=host, source="all")
+        print(f"{host}: {rate:.2f} requests/s")
+    print(f"Saved {metrics.total('crawler_requests_saved_total'):.0f} requests by the query plan and skipped duplicates")
+    metrics.write(args.report, args.prometheus)
+    print(f"Finished in {time.perf_counter() - start:.1f}s")
+    if failed:
+        sys.exit(f"Failed: {', '.join(sorted(failed))}")
+
+
+if __name__ == "__main__":
+    main()
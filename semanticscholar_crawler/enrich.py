@@ -0,0 +1,245 @@
+import argparse
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import http, interchange  # noqa: E402
+from common.lazy import LazyImport  # noqa: E402
+from common.sink import NdjsonSink, read_ndjson  # noqa: E402
+from common.telemetry import metrics, set_source  # noqa: E402
+from filter import filter as paper_filter  # noqa: E402
+
+dotenv = LazyImport("dotenv")
+tqdm = LazyImport("tqdm", "tqdm")
+
+api_url = "https://api.semanticscholar.org/graph/v1"
+fields = "title,abstract,publicationDate,year,externalIds"
+# the batch endpoint accepts at most 500 ids per request
+batch_size = 500
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "enrich_cache.ndjson")
+
+arxiv_regex = re.compile(r"arxiv\.org/(?:abs|pdf)/([^/?#]+?)(?:v\d+)?(?:\.pdf)?$")
+arxiv_doi_regex = re.compile(r"^10\.48550/arxiv\.(.+)$", re.IGNORECASE)
+
+
+def is_missing(value) -> bool:
+    return value is None or value == "" or value == "None"
+
+
+def source_of(file: str) -> str:
+    # same rule as filter.main
+    return file.split("/")[-1].split(".")[0].split("_")[0]
+
+
+def paper_ids(record: dict) -> list[str]:
+    # Semantic Scholar ids of a record, in the order they are tried
+    ids = []
+    doi = record.get("doi")
+    if not is_missing(doi):
+        doi = doi.strip().removeprefix("https://doi.org/")
+        ids.append(f"DOI:{doi}")
+        match = arxiv_doi_regex.match(doi)
+        if match:
+            ids.append(f"ARXIV:{match.group(1)}")
+
+    if not is_missing(record.get("arxiv_id")):
+        ids.append(f"ARXIV:{record['arxiv_id']}")
+    for field in ("pdf", "url"):
+        match = arxiv_regex.search(record.get(field) or "")
+        if match:
+            ids.append(f"ARXIV:{match.group(1)}")
+    return list(dict.fromkeys(ids))
+
+
+def date_missing(record: dict, source: str) -> bool:
+    # also dates filter.py cannot parse
+    if is_missing(record.get("submitted")):
+        return True
+    parse = paper_filter.parse_ieee_date if source == "ieee" else paper_filter.parse_date
+    return parse(record["submitted"]) is None
+
+
+def needs_enrichment(record: dict, source: str) -> bool:
+    return is_missing(record.get("summary")) or date_missing(record, source)
+
+
+def format_date(paper: dict, source: str) -> str or None:
+    # in the format filter.py expects from the source
+    if paper.get("publicationDate"):
+        date = datetime.strptime(paper["publicationDate"], "%Y-%m-%d")
+        return f"{date.day} {date:%B %Y}" if source == "ieee" else date.strftime("%Y-%m-%d")
+    if paper.get("year") and source != "ieee":
+        return str(paper["year"])
+    return None
+
+
+def enrich_record(record: dict, paper: dict, source: str) -> bool:
+    # fills in what the record is missing, returns True if anything changed
+    changed = False
+    if is_missing(record.get("summary")) and paper.get("abstract"):
+        record["summary"] = paper["abstract"]
+        changed = True
+
+    date = format_date(paper, source)
+    if date is not None and date_missing(record, source):
+        record["submitted"] = date
+        changed = True
+
+    doi = (paper.get("externalIds") or {}).get("DOI")
+    if doi and is_missing(record.get("doi")) and "doi" in record:
+        record["doi"] = doi
+        changed = True
+    return changed
+
+
+class PaperCache:
+    # responses of the batch endpoint by id; ids that were not found are cached as None
+
+    def __init__(self, path: str = cache_file):
+        self.papers: dict[str, dict or None] = dict()
+        if os.path.exists(path):
+            for entry in read_ndjson(path):
+                self.papers[entry["id"]] = entry["paper"]
+        self.sink = NdjsonSink(path, key="id", resume=True)
+
+    def __contains__(self, paper_id: str) -> bool:
+        return paper_id in self.papers
+
+    def get(self, paper_id: str) -> dict or None:
+        return self.papers.get(paper_id)
+
+    def add(self, paper_id: str, paper: dict or None):
+        self.papers[paper_id] = paper
+        self.sink.write({"id": paper_id, "paper": paper})
+
+    def close(self):
+        self.sink.close()
+
+
+def fetch_batch(ids: list[str], base_url: str = api_url, api_key: str = None) -> list[dict or None]:
+    # the response lists the papers in the order of the ids, None for unknown ids
+    headers = {"x-api-key": api_key} if api_key else {}
+    response = http.post(f"{base_url}/paper/batch", params={"fields": fields}, json={"ids": ids}, headers=headers)
+    return response.json()
+
+
+def resolve(ids: list[str], cache: PaperCache, base_url: str = api_url, api_key: str = None, max_workers: int = 1):
+    missing = [paper_id for paper_id in dict.fromkeys(ids) if paper_id not in cache]
+    print(f"{len(ids) - len(missing)} ids cached, {len(missing)} to resolve")
+
+    chunks = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    results = http.fetch_all(chunks, lambda chunk: fetch_batch(chunk, base_url, api_key), max_workers)
+    for chunk, papers, error in tqdm(results, total=len(chunks)):
+        if error is not None:
+            # not cached, the ids are requested again on the next run
+            print(f"Error resolving {len(chunk)} ids: {error}")
+            continue
+        metrics.inc("enrich_batches_total")
+        for paper_id, paper in zip(chunk, papers):
+            cache.add(paper_id, paper)
+
+
+def wanted_ids(records: list[tuple[str, dict]]) -> list[str]:
+    # ids of the (source, record) pairs that need anything
+    wanted = dict()
+    for source, record in records:
+        if needs_enrichment(record, source):
+            wanted.update(dict.fromkeys(paper_ids(record)))
+    return list(wanted)
+
+
+def complete(record: dict, source: str, cache: PaperCache) -> bool:
+    # enriches the record from the first of its ids that was resolved
+    if not needs_enrichment(record, source):
+        return False
+    for paper_id in paper_ids(record):
+        paper = cache.get(paper_id)
+        if paper is not None and enrich_record(record, paper, source):
+            return True
+    return False
+
+
+class Enricher:
+    """
+    Completes the records of a crawl run (runner.FilterStage) that miss an abstract or a date
+    before they reach the date/abstract filter of filter.py, which would drop them. The records
+    are held during the run and their ids resolved together at its end, in batches.
+    """
+
+    def __init__(self, cache: PaperCache, base_url: str = api_url, api_key: str = None):
+        self.cache = cache
+        self.base_url = base_url
+        self.api_key = api_key
+        self.held: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+
+    def hold(self, source: str, record: dict) -> bool:
+        # keeps a record that needs enrichment and has an id to look it up by
+        if not needs_enrichment(record, source) or not paper_ids(record):
+            return False
+        with self._lock:
+            self.held.append((source, record))
+        return True
+
+    def complete(self, sources: set[str]) -> list[tuple[str, dict]]:
+        # resolves the records held for `sources`, returns all of them, enriched where possible
+        held = [(source, record) for source, record in self.held if source in sources]
+        resolve(wanted_ids(held), self.cache, self.base_url, self.api_key)
+        enriched = sum(complete(record, source, self.cache) for source, record in held)
+        metrics.inc("enrich_records_total", enriched)
+        print(f"Enriched {enriched} of {len(held)} incomplete papers")
+        return held
+
+    def close(self):
+        self.cache.close()
+
+
+def enrich_files(files: list[str], cache: PaperCache, base_url: str = api_url, api_key: str = None,
+                 dry_run: bool = False) -> dict[str, int]:
+    outputs = dict()
+    for file in files:
+        outputs[file] = list(interchange.read(file))
+
+    # ids of the records that need anything, from all files at once
+    resolve(wanted_ids([(source_of(file), record) for file, records in outputs.items() for record in records]),
+            cache, base_url, api_key)
+
+    stats = dict()
+    for file, records in outputs.items():
+        source = source_of(file)
+        enriched = sum(complete(record, source, cache) for record in records)
+        stats[file] = enriched
+        print(f"{file}: enriched {enriched} of {len(records)} papers")
+
+        if enriched and not dry_run:
+            # in the format of the file, replaced atomically
+            interchange.write(file, records)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill in missing abstracts and dates of the crawler outputs "
+                                                 "through the Semantic Scholar batch API")
+    parser.add_argument("files", nargs="*", help="default: the filtered outputs of all crawlers, as read by filter.py")
+    parser.add_argument("--api-url", default=api_url, help="e.g. a local stub")
+    parser.add_argument("--cache", default=cache_file)
+    parser.add_argument("--dry-run", action="store_true", help="do not rewrite the files")
+    args = parser.parse_args()
+
+    dotenv.load_dotenv()
+    set_source("semanticscholar")
+    cache = PaperCache(args.cache)
+    try:
+        enrich_files(args.files or paper_filter.get_files(repo_root), cache, args.api_url,
+                     os.getenv("SEMANTIC_SCHOLAR_API_KEY"), args.dry_run)
+    finally:
+        cache.close()
+        http.close_client()
+
+
+if __name__ == "__main__":
+    main()
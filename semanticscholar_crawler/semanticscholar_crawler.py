@@ -0,0 +1,112 @@
+import os
+import sys
+
+from semanticscholar import SemanticScholar
+from semanticscholar.SemanticScholarException import NoMorePagesException
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import keywords, query_plan  # noqa: E402
+from common.lazy import LazyImport  # noqa: E402
+from common.record import Record  # noqa: E402
+from common.sink import NdjsonSink, convert  # noqa: E402
+from common.source import RunContext, Source, Task  # noqa: E402
+
+tqdm = LazyImport("tqdm", "tqdm")
+
+search_terms = query_plan.search_terms(query_plan.load_topics())
+# the bulk search takes boolean queries, one query covers all terms
+search_keys = [query_plan.semanticscholar_query(search_terms)]
+
+
+def to_record(result: Record) -> dict:
+    return {
+        "title": result.title,
+        "doi": result.doi,
+        "summary": result.abstract,
+        "submitted": str(result.submitted),
+    }
+
+
+def process_papers(papers) -> dict[str, Record]:
+    results: dict[str, Record] = dict()
+    for paper in papers:
+        if paper.paperId not in results:
+            doi = paper.externalIds["DOI"] if "DOI" in paper.externalIds else None
+
+            results[paper.paperId] = Record(
+                title=paper.title,
+                abstract=paper.abstract,
+                doi=doi,
+                submitted=paper.publicationDate
+            )
+    return results
+
+
+def search(sch: SemanticScholar, search_key: str, sink: NdjsonSink = None) -> dict[str, Record]:
+    # with a sink every page is written as soon as it is loaded
+    papers = sch.search_paper(search_key, bulk=True)
+    results = process_papers(papers)
+    write(results, sink)
+
+    has_next_page = True
+
+    while has_next_page:
+        try:
+            papers.next_page()
+            # print(f"Title of the paper: {papers[0].title}")
+            res = process_papers(papers)
+            results.update(res)
+            write(res, sink)
+        except NoMorePagesException:
+            has_next_page = False
+
+    return results
+
+
+def write(results: dict[str, Record], sink: NdjsonSink or None):
+    if sink is not None:
+        for paper in results.values():
+            sink.write(to_record(paper))
+
+
+class SemanticScholarSource(Source):
+    name = "semanticscholar"
+    output_file = "semanticscholar_crawler/semanticscholar_results.ndjson.gz"
+    filtered_output_file = "semanticscholar_crawler/semanticscholar_filtered_results.ndjson.gz"
+
+    def __init__(self):
+        self.sch = SemanticScholar()
+
+    def discover(self, context: RunContext):
+        query_plan.report(search_terms, search_keys)
+        for search_key in search_keys:
+            yield Task(self.name, "query", payload={"query": search_key})
+
+    def fetch(self, context: RunContext, task: Task) -> dict[str, Record]:
+        return search(self.sch, task.payload["query"])
+
+    def extract(self, task: Task, raw: dict[str, Record]):
+        for paper in raw.values():
+            yield to_record(paper)
+
+
+def main():
+    sch = SemanticScholar()
+
+    with NdjsonSink("semanticscholar_results.ndjson", filtered_path="semanticscholar_filtered_results.ndjson",
+                    predicate=lambda record: keywords.compare(record["title"])) as sink:
+        query_plan.report(search_terms, search_keys)
+        for search_key in search_keys:
+            search(sch, search_key, sink)
+
+    print(f"Found {sink.count} papers")
+    convert("semanticscholar_results.ndjson", "semanticscholar_results.ndjson.gz")
+
+    print(f"Filtered {sink.filtered_count} papers")
+    convert("semanticscholar_filtered_results.ndjson", "semanticscholar_filtered_results.ndjson.gz")
+
+
+if __name__ == "__main__":
+    main()
+
+
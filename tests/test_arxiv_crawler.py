@@ -0,0 +1,180 @@
+import json
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from arxiv_crawler import arxiv_crawler  # noqa: E402
+from common import interchange, rate_limit  # noqa: E402
+from common.source import RunContext  # noqa: E402
+from runner import FilterStage, run_source  # noqa: E402
+
+ATOM_ENTRY = """
+  <entry>
+    <id>http://arxiv.org/abs/{id}v1</id>
+    <updated>{published}</updated>
+    <published>{published}</published>
+    <title>{title}</title>
+    <summary>{summary}</summary>
+    <author><name>A. Author</name></author>
+    <link href="http://arxiv.org/abs/{id}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/{id}v1" rel="related" type="application/pdf"/>
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.CL"/>
+    <category term="cs.CL"/>
+  </entry>"""
+
+ATOM_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <title>arXiv Query</title>
+  <opensearch:totalResults>{total}</opensearch:totalResults>
+  <opensearch:startIndex>0</opensearch:startIndex>
+  <opensearch:itemsPerPage>{total}</opensearch:itemsPerPage>{entries}
+</feed>"""
+
+OAI_RECORD = """
+    <record>
+      <header><identifier>oai:arXiv.org:{id}</identifier></header>
+      <metadata>
+        <arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+          <id>{id}</id><created>{created}</created><title>{title}</title><abstract>{summary}</abstract>
+        </arXiv>
+      </metadata>
+    </record>"""
+
+OAI_PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <ListRecords>{records}
+    <resumptionToken>{token}</resumptionToken>
+  </ListRecords>
+</OAI-PMH>"""
+
+
+class Stub:
+    # serves the pages of `pages(query)` (503 for None) and records the queries it was asked for
+
+    def __init__(self, pages):
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                stub.requests.append(query)
+                page = pages(query)
+                body = (page or "").encode("utf8")
+                self.send_response(503 if page is None else 200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/query"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def unpaced(monkeypatch):
+    # the stub is not paced like export.arxiv.org
+    monkeypatch.setattr(rate_limit, "limiters", rate_limit.HostRateLimiters({}, rate=1000, max_rate=1000, burst=10))
+
+
+def atom(*papers) -> str:
+    return ATOM_FEED.format(total=len(papers), entries="".join(ATOM_ENTRY.format(**paper) for paper in papers))
+
+
+def crawl(tmp_path, monkeypatch, stub: Stub) -> arxiv_crawler.ArxivSource:
+    # one run of runner.py with only the arXiv source, in tmp_path
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("arxiv_crawler", exist_ok=True)
+    source = arxiv_crawler.ArxivSource(api_url=stub.url)
+    stage = FilterStage([source], "crawled_papers.ndjson.gz")
+    run_source(source, RunContext(), stage)
+    stage.close()
+    source.finish()
+    return source
+
+
+def test_incremental_crawl_continues_at_the_high_water_mark(tmp_path, monkeypatch):
+    first = {"id": "2401.00001", "published": "2024-01-10T08:00:00Z", "title": "Expressive TTS",
+             "summary": "Expressive speech synthesis"}
+    second = {"id": "2402.00002", "published": "2024-02-20T09:30:00Z", "title": "Prosody TTS",
+              "summary": "Prosody transfer for speech"}
+    stub = Stub(lambda query: atom(first))
+    try:
+        crawl(tmp_path, monkeypatch, stub)
+        assert "submittedDate" not in stub.requests[0]["search_query"]
+        with open("arxiv_crawler/arxiv_harvest_state.json") as f:
+            assert json.load(f) == {"published": "2024-01-10 08:00:00+00:00"}
+    finally:
+        stub.close()
+
+    stub = Stub(lambda query: atom(second))
+    try:
+        crawl(tmp_path, monkeypatch, stub)
+        assert "submittedDate:[202401100800 TO" in stub.requests[0]["search_query"]
+    finally:
+        stub.close()
+
+    # the papers of the first crawl are kept, the mark moved to the newest paper
+    titles = [record["title"] for record in interchange.read("arxiv_crawler/arxiv_filtered_results.ndjson.gz")]
+    assert sorted(titles) == ["Expressive TTS", "Prosody TTS"]
+    with open("arxiv_crawler/arxiv_harvest_state.json") as f:
+        assert json.load(f) == {"published": "2024-02-20 09:30:00+00:00"}
+
+
+def test_mark_stays_when_the_query_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("arxiv_crawler")
+    arxiv_crawler.save_high_water_mark("arxiv_crawler/arxiv_harvest_state.json",
+                                       arxiv_crawler.parse_published("2024-01-10 08:00:00+00:00"))
+    stub = Stub(lambda query: None)
+    try:
+        source = crawl(tmp_path, monkeypatch, stub)
+    finally:
+        stub.close()
+
+    assert source.queries_done == 0
+    with open("arxiv_crawler/arxiv_harvest_state.json") as f:
+        assert json.load(f) == {"published": "2024-01-10 08:00:00+00:00"}
+
+
+def test_high_water_mark_falls_back_to_the_output(tmp_path):
+    records = {"a": {"submitted": "2023-05-01 00:00:00+00:00"}, "b": {"submitted": "2023-07-02 00:00:00+00:00"},
+               "c": {"submitted": "None"}}
+    mark = arxiv_crawler.load_high_water_mark(str(tmp_path / "missing.json"), records)
+    assert str(mark) == "2023-07-02 00:00:00+00:00"
+
+
+def test_oai_harvest_follows_resumption_tokens():
+    def pages(query):
+        if "resumptionToken" not in query:
+            paper = {"id": "2401.00001", "created": "2024-01-10", "title": "TTS with prosody",
+                     "summary": "Prosody in text to speech"}
+            return OAI_PAGE.format(records=OAI_RECORD.format(**paper), token="page-2")
+        paper = {"id": "2401.00002", "created": "2024-01-11", "title": "Emotional TTS",
+                 "summary": "Emotional text to speech"}
+        return OAI_PAGE.format(records=OAI_RECORD.format(**paper), token="")
+
+    stub = Stub(pages)
+    try:
+        result = arxiv_crawler.oai_harvest(stub.url, ["cs"], since="2024-01-01")
+    finally:
+        stub.close()
+
+    assert sorted(result) == ["Emotional TTS", "TTS with prosody"]
+    assert stub.requests == [
+        {"verb": "ListRecords", "metadataPrefix": "arXiv", "set": "cs", "from": "2024-01-01"},
+        {"verb": "ListRecords", "resumptionToken": "page-2"},
+    ]
+    assert result["Emotional TTS"]["submitted"] == "2024-01-11 00:00:00+00:00"
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from literature_helper import ChangeFeed  # noqa: E402
+
+
+def publish(feed: ChangeFeed, count: int):
+    async def run():
+        for i in range(count):
+            await feed.publish("added", {"id": str(i)})
+    asyncio.run(run())
+
+
+def test_ids_stay_monotonic_when_trimmed():
+    feed = ChangeFeed(size=3)
+    seen = []
+    for _ in range(10):
+        publish(feed, 1)
+        seen.append(feed.seq)
+        assert [event[0] for event in feed.events] == list(range(feed.base + 1, feed.seq + 1))
+    assert seen == list(range(1, 11))
+    assert len(feed.events) <= 2 * feed.size
+
+
+def test_since_after_trim():
+    feed = ChangeFeed(size=3)
+    publish(feed, 7)
+    assert feed.seq == 7
+    assert feed.since(7) == []
+    assert [event[0] for event in feed.since(5)] == [6, 7]
+    assert feed.since(feed.base - 1) is None
+
+
+def test_tokens_of_another_process_reset():
+    feed = ChangeFeed(size=3)
+    publish(feed, 2)
+    assert feed.parse(feed.token(1)) == 1
+    assert feed.since(feed.parse(ChangeFeed().token(1))) is None
+    # numbers ahead of the feed, e.g. bare numbers from before a restart
+    assert feed.since(500) is None
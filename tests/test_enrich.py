@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import http, interchange, rate_limit  # noqa: E402
+from common.source import Source  # noqa: E402
+from runner import FilterStage  # noqa: E402
+from semanticscholar_crawler import enrich  # noqa: E402
+
+PAPERS = {
+    "DOI:10.1109/icassp.2021.1": {"abstract": "Expressive speech synthesis", "publicationDate": "2021-04-16",
+                                  "year": 2021, "externalIds": {"DOI": "10.1109/icassp.2021.1"}},
+    "DOI:10.1145/3.2": {"abstract": "Prosody modelling", "publicationDate": None, "year": 2022, "externalIds": {}},
+    "ARXIV:2301.00003": {"abstract": "Emotional TTS", "publicationDate": "2023-01-02", "year": 2023,
+                         "externalIds": {"ArXiv": "2301.00003"}},
+}
+
+
+class BatchStub:
+    # the /paper/batch endpoint of the Semantic Scholar graph API, records the ids of every request
+
+    def __init__(self):
+        self.batches = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                ids = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["ids"]
+                stub.batches.append(ids)
+                body = json.dumps([PAPERS.get(paper_id) for paper_id in ids]).encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/graph/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubSource(Source):
+    name = "ieee"
+    output_file = "ieee_papers.ndjson.gz"
+    filtered_output_file = "ieee_filtered_papers.ndjson.gz"
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rate_limit, "limiters", rate_limit.HostRateLimiters({}, rate=1000, max_rate=1000, burst=10))
+    stub = BatchStub()
+    yield stub
+    stub.close()
+    http.close_client()
+
+
+def test_files_are_enriched_from_one_batch(stub):
+    interchange.write("ieee_filtered_papers.ndjson.gz", [
+        {"title": "Expressive TTS", "summary": "", "submitted": "", "doi": "10.1109/icassp.2021.1"},
+        {"title": "Complete", "summary": "Speech", "submitted": "16-20 April 2021", "doi": "10.1109/other"},
+    ])
+    interchange.write("acm_filtered_papers.ndjson.gz", [
+        {"title": "Prosody", "summary": None, "submitted": "2022-03-01", "doi": "https://doi.org/10.1145/3.2"},
+        {"title": "Unknown", "summary": None, "submitted": "2022-03-01", "doi": "10.1145/unknown"},
+    ])
+    files = ["ieee_filtered_papers.ndjson.gz", "acm_filtered_papers.ndjson.gz"]
+
+    cache = enrich.PaperCache("cache.ndjson")
+    try:
+        stats = enrich.enrich_files(files, cache, stub.url)
+    finally:
+        cache.close()
+
+    assert stats == {"ieee_filtered_papers.ndjson.gz": 1, "acm_filtered_papers.ndjson.gz": 1}
+    # the ids of the records that need anything, of all files in one request
+    assert stub.batches == [["DOI:10.1109/icassp.2021.1", "DOI:10.1145/3.2", "DOI:10.1145/unknown"]]
+    ieee = list(interchange.read("ieee_filtered_papers.ndjson.gz"))
+    assert ieee[0]["summary"] == "Expressive speech synthesis"
+    # in the format of the IEEE outputs, and read back by filter.py
+    assert ieee[0]["submitted"] == "16 April 2021"
+    assert str(enrich.paper_filter.parse_ieee_date(ieee[0]["submitted"]).date()) == "2021-04-16"
+    assert list(interchange.read("acm_filtered_papers.ndjson.gz"))[0]["summary"] == "Prosody modelling"
+
+    # found and unknown ids are both cached
+    cache = enrich.PaperCache("cache.ndjson")
+    try:
+        enrich.enrich_files(files, cache, stub.url)
+    finally:
+        cache.close()
+    assert len(stub.batches) == 1
+
+
+def test_ids_are_split_into_batches(stub, monkeypatch):
+    monkeypatch.setattr(enrich, "batch_size", 2)
+    cache = enrich.PaperCache("cache.ndjson")
+    try:
+        enrich.resolve(list(PAPERS), cache, stub.url)
+    finally:
+        cache.close()
+
+    assert sorted(map(len, stub.batches)) == [1, 2]
+    assert cache.get("ARXIV:2301.00003")["abstract"] == "Emotional TTS"
+
+
+def test_pipeline_enriches_records_before_the_date_and_abstract_filter(stub):
+    source = StubSource()
+    enricher = enrich.Enricher(enrich.PaperCache("cache.ndjson"), stub.url)
+    stage = FilterStage([source], "crawled_papers.ndjson.gz", enricher=enricher)
+    try:
+        stage.add(source, {"title": "Expressive TTS", "summary": "", "submitted": "", "doi": "10.1109/icassp.2021.1"})
+        stage.add(source, {"title": "Speech without id", "summary": "", "submitted": "", "doi": ""})
+        stage.add(source, {"title": "Natural TTS", "summary": "Speech", "submitted": "5 May 2020", "doi": ""})
+        stage.close()
+    finally:
+        enricher.close()
+
+    merged = {paper["title"]: paper for paper in interchange.read("crawled_papers.ndjson.gz")}
+    assert sorted(merged) == ["Expressive TTS", "Natural TTS"]
+    assert merged["Expressive TTS"]["submitted"] == "2021-04-16"
+    assert stub.batches == [["DOI:10.1109/icassp.2021.1"]]
+
+    # the per-source outputs hold the enriched version
+    filtered = {record["title"]: record for record in interchange.read(source.filtered_output_file)}
+    assert filtered["Expressive TTS"]["summary"] == "Expressive speech synthesis"
+    assert filtered["Speech without id"]["summary"] == ""
@@ -0,0 +1,137 @@
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import http, rate_limit  # noqa: E402
+from common.record import Record  # noqa: E402
+from common.source import Task  # noqa: E402
+from filter.filter import parse_ieee_date  # noqa: E402
+from ieee_crawler import ieee_crawler  # noqa: E402
+
+# two papers a year from 2020 to 2023. Papers 3 and 5 have no abstract in the search results,
+# the document metadata of paper 5 has none either.
+PAPERS = [
+    {"articleNumber": str(number), "articleTitle": f"Paper {number}", "doi": f"10.1109/{number}",
+     "publicationYear": 2020 + number // 2, "publicationDate": f"{number + 1} March {2020 + number // 2}",
+     **({} if number in (3, 5) else {"abstract": f"Abstract {number}"})}
+    for number in range(8)
+]
+DOCUMENT = "<script>xplGlobal.document.metadata = {metadata};\n</script>"
+
+
+def search_results(ranges: str) -> list[dict]:
+    first, last = map(int, re.match(r"(\d+)_(\d+)_Year", ranges).groups())
+    return [paper for paper in PAPERS if first <= paper["publicationYear"] <= last]
+
+
+class IeeeStub:
+    # the search and document endpoints of IEEE Xplore, records every search as (ranges, page)
+
+    def __init__(self):
+        self.searches = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.searches.append((body["ranges"][0], body["pageNumber"]))
+                found = search_results(body["ranges"][0])
+                start = (body["pageNumber"] - 1) * body["rowsPerPage"]
+                self.reply("application/json", json.dumps({
+                    "totalRecords": len(found), "records": found[start:start + body["rowsPerPage"]]}))
+
+            def do_GET(self):
+                number = int(re.match(r"/document/(\d+)/", self.path).group(1))
+                metadata = {"abstract": "From the metadata"} if number != 5 else {}
+                self.reply("text/html", DOCUMENT.format(metadata=json.dumps(metadata)))
+
+            def reply(self, content_type: str, text: str):
+                body = text.encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(rate_limit, "limiters", rate_limit.HostRateLimiters({}, rate=1000, max_rate=1000, burst=10))
+    # small enough that the stub results are sliced and paged
+    monkeypatch.setattr(ieee_crawler, "max_results", 3)
+    monkeypatch.setattr(ieee_crawler, "rows_per_page", 1)
+    monkeypatch.setattr(ieee_crawler, "first_year", 2020)
+    stub = IeeeStub()
+    yield stub
+    stub.close()
+    http.close_client()
+
+
+def test_crawl_api_slices_and_falls_back(stub, monkeypatch):
+    rendered = []
+
+    def extract_paper_info(driver, paper_url: str, base_url: str = ieee_crawler.base_iee_url) -> Record:
+        rendered.append(f"{base_url}{paper_url}")
+        return Record("Paper 5", "Rendered abstract", "6 March 2022", doi="10.1109/5")
+
+    monkeypatch.setattr(ieee_crawler, "extract_paper_info", extract_paper_info)
+    papers = ieee_crawler.crawl_api(stub.url, max_workers=2, driver=object())
+
+    abstracts = {paper.title: paper.abstract for paper in papers}
+    assert sorted(abstracts) == [f"Paper {number}" for number in range(8)]
+    assert abstracts["Paper 0"] == "Abstract 0"
+    assert abstracts["Paper 3"] == "From the metadata"
+    # the browser fallback renders the page of the configured host, not ieeexplore.ieee.org
+    assert abstracts["Paper 5"] == "Rendered abstract"
+    assert rendered == [f"{stub.url}/document/5/"]
+
+    # the first page of a slice is loaded once, when it is counted, and only slices below the cap are paged
+    assert len(stub.searches) == len(set(stub.searches))
+    paged = [ranges for ranges, page in stub.searches if page > 1]
+    assert paged and all(len(search_results(ranges)) <= 3 for ranges in paged)
+    assert any(len(search_results(ranges)) > 3 for ranges, _ in stub.searches)
+
+
+def test_source_detail_tasks_use_the_base_url(stub):
+    source = ieee_crawler.IeeeSource(base_url=stub.url)
+    record = PAPERS[5]
+    items = list(source.extract(Task("ieee", "metadata", "/document/5/", payload={"record": record}), None))
+    assert items == [Task("ieee", "detail", f"{stub.url}/document/5/")]
+
+    items = list(source.extract(Task("ieee", "search", payload={"page": 1}), {"records": PAPERS[:2]}))
+    assert [item["title"] for item in items] == ["Paper 0", "Paper 1"]
+
+
+@pytest.mark.parametrize("date, expected", [
+    ("16-20 April 2021", "2021-04-16"),
+    ("30 Aug.-3 Sept. 2021", "2021-08-30"),
+    ("5 April 2021", "2021-04-05"),
+    ("April 2020", "2020-04-01"),
+    ("2019", "2019-01-01"),
+    ("2021-03-01", "2021-03-01"),
+])
+def test_parse_ieee_date(date, expected):
+    assert str(parse_ieee_date(date).date()) == expected
+
+
+def test_parse_ieee_date_rejects():
+    assert parse_ieee_date("None") is None
+    assert parse_ieee_date("31 Feb. 2021") is None
+    assert parse_ieee_date("soon") is None
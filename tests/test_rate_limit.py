@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.rate_limit import AdaptiveRateLimiter, parse_retry_after  # noqa: E402
+
+
+class Clock:
+    # simulated time, sleep() advances it instead of blocking
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(clock: Clock, **kwargs) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_backs_off_on_429_and_503_and_recovers():
+    clock = Clock()
+    bucket = limiter(clock, rate=2.0, max_rate=2.0, increase=0.5)
+
+    bucket.feedback(429)
+    assert bucket.rate == pytest.approx(1.0)
+    bucket.feedback(503)
+    assert bucket.rate == pytest.approx(0.5)
+
+    # the bucket refills at the lowered rate
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(2.0)
+
+    # additive increase while the responses are healthy, up to max_rate
+    for expected in (1.0, 1.5, 2.0, 2.0):
+        bucket.feedback(200, latency=0.1)
+        assert bucket.rate == pytest.approx(expected)
+
+
+def test_rate_stays_within_bounds():
+    clock = Clock()
+    bucket = limiter(clock, rate=0.2, min_rate=0.1)
+    for _ in range(5):
+        bucket.feedback(500)
+    assert bucket.rate == pytest.approx(0.1)
+
+
+def test_retry_after_pauses_the_bucket():
+    clock = Clock()
+    bucket = limiter(clock, rate=10.0, max_rate=10.0)
+    bucket.feedback(429, retry_after=30)
+    assert bucket.rate == pytest.approx(5.0)
+
+    start = clock.now
+    bucket.acquire()
+    # nothing is sent before the pause is over, the token is then refilled at the new rate
+    assert clock.now - start == pytest.approx(30.0)
+
+
+def test_latency_spike_slows_down():
+    clock = Clock()
+    bucket = limiter(clock, rate=4.0, max_rate=4.0)
+    for _ in range(3):
+        bucket.feedback(200, latency=0.1)
+    bucket.feedback(200, latency=1.0)
+    assert bucket.rate == pytest.approx(2.0)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:30 GMT", now=1445412480) == pytest.approx(30.0)
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None